@@ -1,14 +1,294 @@
 import os
-from openai import OpenAI
+import sys
 import json
 import time
+import random
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from types import SimpleNamespace
+from email.utils import parsedate_to_datetime
+from document_processor import iter_chunks, iter_clauses, count_tokens, PAGE_BREAK
+from retrieval import build_index, select_passages
+from fingerprints import clause_signature, find_findings, store_findings
+from facts import ANALYSIS_FACT_TYPES, extract_facts, facts_for_analysis, summarize_facts
+from revisions import change_counts, diff_clauses, format_changes
+from metrics import span, record_event
 
 MODEL_NAME = "gpt-3.5-turbo"  # Changed from gpt-4 to gpt-3.5-turbo
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+SYSTEM_PROMPT = "Ви експерт з аналізу юридичних документів. Надайте чіткий, структурований аналіз з ключовими пунктами та рекомендаціями українською мовою."
+TEMPERATURE = 0.2  # Зменшено для більш стабільних відповідей
+MAX_TOKENS = 1000  # Зменшено для оптимізації використання токенів
 
-def create_analysis_prompt(text, query, analysis_type=None):
-    """Створення специфічних промптів на основі типу аналізу"""
+# Максимальний розмір промпту в токенах моделі (разом з інструкцією)
+MAX_PROMPT_TOKENS = 6000
+# Розмір фрагмента документа в токенах для map-reduce аналізу та перекриття сусідніх фрагментів
+CHUNK_TOKENS = 3000
+CHUNK_OVERLAP_TOKENS = 150
+# Розмір фрагментів для пошуку релевантних положень, бюджет токенів і кількість відібраних фрагментів
+RETRIEVAL_PASSAGE_TOKENS = 400
+RETRIEVAL_TOKEN_BUDGET = 2500
+RETRIEVAL_TOP_K = 12
+# Максимальний розмір зведення фактів, що замінює текст документа для фінансового аналізу та зобов'язань
+FACTS_TOKEN_BUDGET = 2500
+# Максимальний обсяг нових положень (у токенах) та їх кількість в одному запиті
+# в режимі повторного використання висновків (відповідь обмежена MAX_TOKENS)
+CLAUSE_BATCH_TOKENS = 1500
+CLAUSE_BATCH_SIZE = 12
+# Довжина відповіді в токенах на один розділ у режимі аналізу всіх вибраних типів одним запитом
+# та бюджет відібраних положень, спільний для всіх типів аналізу в цьому режимі
+COMBINED_SECTION_TOKENS = 500
+COMBINED_TOKEN_BUDGET = 4000
+# Кількість одночасних запитів до API під час аналізу фрагментів
+MAX_CONCURRENCY = 4
+
+# Бюджети запитів і токенів на хвилину, спільні для всіх сесій процесу
+RATE_LIMIT_RPM = int(os.environ.get("OPENAI_RPM_LIMIT", "3500"))
+RATE_LIMIT_TPM = int(os.environ.get("OPENAI_TPM_LIMIT", "90000"))
+# Верхня межа адаптивної кількості одночасних запитів у процесі
+SHARED_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", "16"))
+# Базова та максимальна затримка між повторними спробами (с)
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# Маршрути запитів до моделей: JSON-список об'єктів {"name", "provider": "openai" | "anthropic",
+# "model", "max_prompt_tokens", "types", "base_url"} (усі поля, крім provider і model, необов'язкові).
+# Запит спрямовується за першим маршрутом, що підходить за розміром промпту і типом аналізу;
+# якщо не вказано, всі запити надсилаються до MODEL_NAME в OpenAI
+MODEL_ROUTES = json.loads(os.environ["MODEL_ROUTES"]) if os.environ.get("MODEL_ROUTES") else None
+# Дубльований запит надсилається, якщо відповіді немає довше за p95 затримки маршруту
+# (не раніше HEDGE_MIN_DELAY с; поки вимірювань менше HEDGE_MIN_SAMPLES - через HEDGE_DEFAULT_DELAY с),
+# але не частіше ніж для HEDGE_MAX_FRACTION частки запитів
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "1") != "0"
+HEDGE_MIN_DELAY = 1.0
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", "20"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_FRACTION = float(os.environ.get("HEDGE_MAX_FRACTION", "0.1"))
+# Кількість останніх вимірювань затримки кожного маршруту
+LATENCY_WINDOW = 200
+# Запобіжник: маршрут вимикається після CIRCUIT_FAILURE_THRESHOLD помилок сервера поспіль
+# і знову пробується через CIRCUIT_RESET_SECONDS секунд
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+
+# Файл SQLite з кешем результатів аналізу (порожнє значення вимикає кеш)
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH", os.path.join(".cache", "analysis_results.sqlite3"))
+# Час життя записів кешу в секундах (за замовчуванням 30 днів)
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", str(30 * 24 * 3600)))
+# Максимальна кількість записів у кеші
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "5000"))
+
+REDUCE_TOPICS = {
+    "risks": "потенційних ризиків",
+    "responsibility": "розподілу відповідальності",
+    "obligations": "договірних зобов'язань і термінів",
+    "compliance": "відповідності законодавству України",
+    "financial": "фінансових умов"
+}
+
+class RateLimiter:
+    """
+    Спільний для процесу обмежувач запитів до API: маркерні кошики з бюджетами запитів
+    і токенів на хвилину та адаптивна кількість одночасних запитів (AIMD: ліміт
+    зростає на 1/ліміт після успішного запиту і зменшується вдвічі після відмови через
+    перевищення лімітів; відмови запитів, надісланих до попереднього зменшення, ліміт
+    вдруге не зменшують). Безпечний для використання з різних потоків і циклів подій.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_concurrency):
+        self._lock = threading.Lock()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency_limit = float(min(MAX_CONCURRENCY, self.max_concurrency))
+        self.in_flight = 0
+        self._available_requests = float(requests_per_minute)
+        self._available_tokens = float(tokens_per_minute)
+        self._blocked_until = 0.0
+        self._decreased_at = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._available_requests = min(
+            self.requests_per_minute,
+            self._available_requests + elapsed * self.requests_per_minute / 60
+        )
+        self._available_tokens = min(
+            self.tokens_per_minute,
+            self._available_tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    def try_acquire(self, tokens):
+        """
+        Резервує місце для запиту на tokens токенів. Повертає 0, якщо запит можна
+        відправляти, інакше - кількість секунд, через яку варто спробувати знову.
+        """
+        # Запит, більший за весь хвилинний бюджет, чекає на повний кошик
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self.in_flight >= int(self.concurrency_limit):
+                return 0.05
+            if self._available_requests < 1:
+                return (1 - self._available_requests) * 60 / self.requests_per_minute
+            if self._available_tokens < tokens:
+                return (tokens - self._available_tokens) * 60 / self.tokens_per_minute
+
+            self._available_requests -= 1
+            self._available_tokens -= tokens
+            self.in_flight += 1
+            return 0
+
+    async def acquire_async(self, tokens):
+        """Чекає на місце для запиту; повертає час початку запиту (для release)"""
+        while (wait_time := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait_time * random.uniform(1, 1.2))
+        return time.monotonic()
+
+    def release(self, reserved_tokens, used_tokens=None, succeeded=False, rate_limited=False, retry_after=None,
+                started=None):
+        """
+        Звільняє місце запиту, уточнює витрату токенів і коригує кількість одночасних запитів.
+        started - час початку запиту з acquire_async: одночасні запити, що отримали відмову
+        після однієї хвилі перевищення лімітів, зменшують ліміт лише один раз.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                self._available_tokens = min(
+                    self.tokens_per_minute,
+                    self._available_tokens + reserved_tokens - used_tokens
+                )
+
+            if rate_limited:
+                if started is None or started >= self._decreased_at:
+                    self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+                    self._decreased_at = time.monotonic()
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            elif succeeded:
+                self.concurrency_limit = min(
+                    float(self.max_concurrency),
+                    self.concurrency_limit + 1 / self.concurrency_limit
+                )
+
+rate_limiter = RateLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM, SHARED_MAX_CONCURRENCY)
+
+def _percentile(values, fraction):
+    """Перцентиль за методом найближчого рангу"""
+    ordered = sorted(values)
+    return ordered[max(0, int(-(-len(ordered) * fraction // 1)) - 1)] if ordered else None
+
+class RequestRouter:
+    """
+    Спільний для процесу маршрутизатор запитів: вибір моделі за розміром промпту і типом
+    аналізу, ковзна статистика затримок кожного маршруту, запобіжник (circuit breaker),
+    що тимчасово вимикає маршрут після серії помилок сервера, і бюджет дубльованих запитів.
+    Безпечний для використання з різних потоків і циклів подій.
+    """
+
+    def __init__(self, routes):
+        self._lock = threading.Lock()
+        self.routes = [
+            dict(route, name=route.get("name") or f"{route['provider']}:{route['model']}")
+            for route in routes
+        ]
+        self._latencies = {route["name"]: deque(maxlen=LATENCY_WINDOW) for route in self.routes}
+        self._failures = {route["name"]: 0 for route in self.routes}
+        self._opened_at = {}
+        self.requests = 0
+        self.hedged = 0
+
+    def candidates(self, prompt_tokens, analysis_type=None):
+        """
+        Маршрути, придатні для запиту, у порядку пріоритету; маршрути з вимкненим запобіжником
+        пропускаються, доки є інші (якщо вимкнено всі, повертаються всі придатні)
+        """
+        matching = [
+            route for route in self.routes
+            if prompt_tokens <= route.get("max_prompt_tokens", prompt_tokens)
+            and (not route.get("types") or analysis_type in route["types"])
+        ] or self.routes
+        now = time.monotonic()
+        with self._lock:
+            available = [
+                route for route in matching
+                if now - self._opened_at.get(route["name"], -CIRCUIT_RESET_SECONDS) >= CIRCUIT_RESET_SECONDS
+            ]
+        return available or matching
+
+    def record_success(self, name, seconds):
+        with self._lock:
+            self._latencies[name].append(seconds)
+            self._failures[name] = 0
+            self._opened_at.pop(name, None)
+
+    def record_failure(self, name):
+        """Помилка сервера: після CIRCUIT_FAILURE_THRESHOLD помилок поспіль маршрут вимикається"""
+        with self._lock:
+            self._failures[name] += 1
+            # Після перерви маршрут пробується знову, і перша ж помилка вимикає його повторно
+            if self._failures[name] >= CIRCUIT_FAILURE_THRESHOLD:
+                self._opened_at[name] = time.monotonic()
+                print(f"Маршрут {name} тимчасово вимкнено на {CIRCUIT_RESET_SECONDS:.0f} с після помилок поспіль")
+
+    def hedge_delay(self, name):
+        """Час очікування відповіді, після якого надсилається дубльований запит"""
+        with self._lock:
+            latencies = list(self._latencies[name])
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, _percentile(latencies, 0.95))
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def allow_hedge(self):
+        """Резервує дубльований запит, якщо їх частка не перевищить HEDGE_MAX_FRACTION"""
+        with self._lock:
+            if self.hedged + 1 > HEDGE_MAX_FRACTION * self.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    def stats(self):
+        """Статистика маршрутів: кількість вимірювань, p50/p95 затримки, помилки поспіль, стан запобіжника"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "samples": len(latencies),
+                    "p50_seconds": _percentile(latencies, 0.50),
+                    "p95_seconds": _percentile(latencies, 0.95),
+                    "failures": self._failures[name],
+                    "open": now - self._opened_at.get(name, -CIRCUIT_RESET_SECONDS) < CIRCUIT_RESET_SECONDS
+                }
+                for name, latencies in self._latencies.items()
+            }
+
+request_router = RequestRouter(MODEL_ROUTES or [{"name": MODEL_NAME, "provider": "openai", "model": MODEL_NAME}])
+# Тип аналізу поточної задачі (для вибору маршруту запитів до моделі)
+_analysis_category = contextvars.ContextVar("analysis_category", default=None)
+
+def create_analysis_prompt(text, query, analysis_type=None, facts=None):
+    """
+    Створення специфічних промптів на основі типу аналізу.
+    Якщо вказано facts, замість тексту документа передається стисле зведення фактів.
+    """
+    if facts is not None:
+        text = summarize_facts(facts, FACTS_TOKEN_BUDGET)
     if analysis_type is None:
         return f"Проаналізуйте цей юридичний документ відповідно до запиту користувача: {query}\n\nДокумент:\n{text}"
 
@@ -21,58 +301,865 @@ def create_analysis_prompt(text, query, analysis_type=None):
     }
     return prompts.get(analysis_type, "")
 
-def get_analysis(prompt, max_retries=3, timeout=60):
-    """Отримання аналізу від OpenAI API з повторними спробами та таймаутом"""
-    # Обмежуємо розмір тексту до ~2000 символів для зменшення навантаження
-    max_text_length = 2000
-    if len(prompt) > max_text_length:
-        prompt = prompt[:max_text_length] + "\n[Текст було скорочено через обмеження розміру...]"
+def create_reduce_prompt(partial_results, query, analysis_type=None):
+    """Створення промпту для об'єднання результатів аналізу окремих фрагментів"""
+    topic = REDUCE_TOPICS.get(analysis_type)
+    subject = f" щодо {topic}" if topic else ""
+    parts = "\n\n".join(
+        f"Фрагмент {i}:\n{result}" for i, result in enumerate(partial_results, 1)
+    )
+    return (
+        f"Нижче наведено результати аналізу{subject} окремих фрагментів одного юридичного документа. "
+        f"Об'єднайте їх в єдиний структурований аналіз без повторів, враховуючи запит користувача: {query}"
+        f"\n\n{parts}"
+    )
 
-    print(f"Відправляємо запит до OpenAI API (модель: {MODEL_NAME})")
-    print(f"Розмір промпту: {len(prompt)} символів")
+def create_clause_prompt(clauses, query, analysis_type=None):
+    """
+    Промпт для окремих висновків щодо кожного з пронумерованих положень документа
+    (відповідь - JSON-об'єкт, щоб висновки можна було зберегти та використати повторно)
+    """
+    topic = REDUCE_TOPICS.get(analysis_type)
+    subject = f" щодо {topic}" if topic else ""
+    parts = "\n\n".join(f"[{i}]\n{clause}" for i, clause in enumerate(clauses, 1))
+    return (
+        f"Нижче наведено пронумеровані положення юридичного документа. Для кожного положення "
+        f"коротко (1-2 речення) викладіть висновки{subject}, враховуючи запит користувача: {query}. "
+        f"Якщо положення не містить нічого суттєвого для цього аналізу, вкажіть порожній рядок. "
+        f"Відповідь надайте лише у вигляді JSON-об'єкта, ключі якого - номери положень, "
+        f"а значення - висновки, наприклад {{\"1\": \"...\", \"2\": \"\"}}."
+        f"\n\n{parts}"
+    )
+
+def _combined_instructions(analysis_types):
+    """Опис формату JSON-відповіді з окремим розділом для кожного типу аналізу"""
+    sections = "\n".join(f'- "{analysis_type}": аналіз {REDUCE_TOPICS[analysis_type]}' for analysis_type in analysis_types)
+    return (
+        f"Відповідь надайте лише у вигляді JSON-об'єкта з такими розділами:\n{sections}\n"
+        f"Кожен розділ - об'єкт {{\"summary\": \"стислий висновок\", \"key_points\": [\"...\"], "
+        f"\"recommendations\": [\"...\"]}}. Якщо документ не містить нічого суттєвого для розділу, "
+        f"вкажіть це в summary, а списки залиште порожніми."
+    )
+
+def create_combined_prompt(text, query, analysis_types):
+    """
+    Промпт для аналізу документа за всіма вибраними типами одним запитом
+    (відповідь - JSON-об'єкт з окремим розділом для кожного типу аналізу)
+    """
+    return (
+        f"Проаналізуйте цей юридичний документ, враховуючи запит користувача: {query}\n"
+        f"{_combined_instructions(analysis_types)}\n\nДокумент:\n{text}"
+    )
+
+def create_combined_reduce_prompt(partial_results, query, analysis_types):
+    """Створення промпту для об'єднання JSON-результатів create_combined_prompt окремих фрагментів"""
+    parts = "\n\n".join(
+        f"Фрагмент {i}:\n{result}" for i, result in enumerate(partial_results, 1)
+    )
+    return (
+        f"Нижче наведено результати аналізу окремих фрагментів одного юридичного документа у форматі JSON. "
+        f"Об'єднайте їх без повторів, враховуючи запит користувача: {query}\n"
+        f"{_combined_instructions(analysis_types)}\n\n{parts}"
+    )
+
+def create_changes_prompt(changes_text, query):
+    """Промпт для опису змін нової редакції документа порівняно з попередньою"""
+    return (
+        f"Нижче наведено положення юридичного документа, додані, вилучені або змінені в новій редакції "
+        f"порівняно з попередньою. Стисло опишіть, що змінилося, і як ці зміни впливають на права, "
+        f"обов'язки та ризики сторін, враховуючи запит користувача: {query}\n\n{changes_text}"
+    )
+
+def _truncate_prompt(prompt, max_prompt_tokens):
+    """Обмежує розмір промпту, щоб не перевищити контекст моделі"""
+    prompt_tokens = count_tokens(prompt)
+    if prompt_tokens > max_prompt_tokens:
+        cut = int(len(prompt) * max_prompt_tokens / prompt_tokens)
+        prompt = prompt[:cut] + "\n[Текст було скорочено через обмеження розміру...]"
+    return prompt
+
+def _request_params(prompt, timeout, max_tokens=MAX_TOKENS, json_output=False, model=MODEL_NAME):
+    """Параметри запиту до Chat Completions API (json_output вмикає режим JSON-відповіді)"""
+    params = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": max_tokens,
+        "timeout": timeout
+    }
+    if json_output:
+        params["response_format"] = {"type": "json_object"}
+    return params
+
+def _estimate_tokens(prompt, max_tokens=MAX_TOKENS):
+    """
+    Оцінка кількості токенів запиту для бюджету TPM: промпт плюс максимальна довжина відповіді
+    """
+    return count_tokens(SYSTEM_PROMPT) + count_tokens(prompt) + max_tokens
+
+def _used_tokens(usage):
+    return getattr(usage, "total_tokens", None)
+
+def _record_usage(record, usage):
+    """Додає до запису метрик кількість токенів промпту та відповіді"""
+    if usage is not None:
+        record["prompt_tokens"] = usage.prompt_tokens
+        record["completion_tokens"] = usage.completion_tokens
 
-    for attempt in range(max_retries):
+def _retry_after(error):
+    """Час очікування (с) із заголовків retry-after-ms / retry-after відповіді API"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
         try:
-            print(f"Спроба {attempt + 1} з {max_retries}")
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": "Ви експерт з аналізу юридичних документів. Надайте чіткий, структурований аналіз з ключовими пунктами та рекомендаціями українською мовою."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,  # Зменшено для більш стабільних відповідей
-                max_tokens=1000,  # Зменшено для оптимізації використання токенів
-                timeout=timeout
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        # Значення retry-after може бути датою HTTP
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff_delay(attempt):
+    """Експоненційна затримка з повним випадковим розкидом (full jitter)"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def _api_errors(name):
+    """
+    Класи помилок з назвою name з бібліотек провайдерів. Помилки API виникають лише
+    після першого запиту, тож бібліотека провайдера, що її викликала, вже імпортована.
+    """
+    return tuple(
+        getattr(sys.modules[module], name) for module in ("openai", "anthropic") if module in sys.modules
+    )
+
+class AnalysisError(Exception):
+    """Аналіз не отримано: помилку API не можна виправити повторною спробою або вичерпано спроби"""
+
+def _retry_decision(error, attempt, max_retries):
+    """
+    Визначає реакцію на помилку API за її типом: повертає (час очікування, None)
+    для повторної спроби або (None, повідомлення), якщо повторювати запит не варто
+    """
+    APIStatusError, APITimeoutError, AuthenticationError, RateLimitError = (
+        _api_errors(name) for name in ("APIStatusError", "APITimeoutError", "AuthenticationError", "RateLimitError")
+    )
+
+    error_msg = str(error)
+
+    if isinstance(error, RateLimitError):
+        if getattr(error, "code", None) == "insufficient_quota":
+            return None, "Помилка: вичерпано квоту OpenAI API. Перевірте тарифний план."
+        if attempt == max_retries - 1:
+            # Очікування перед неіснуючою наступною спробою лише затримало б повідомлення про помилку
+            return None, "Помилка: перевищено ліміт запитів до API. Спробуйте пізніше."
+        retry_after = _retry_after(error)
+        wait_time = retry_after + random.uniform(0, RETRY_BASE_DELAY) if retry_after else _backoff_delay(attempt)
+        print(f"Перевищено ліміт запитів, очікуємо {wait_time:.1f} секунд...")
+        return wait_time, None
+    elif isinstance(error, AuthenticationError):
+        return None, "Помилка автентифікації API ключа. Будь ласка, перевірте налаштування."
+    elif isinstance(error, APITimeoutError):
+        if attempt < max_retries - 1:
+            wait_time = _backoff_delay(attempt)
+            print(f"Таймаут, очікування {wait_time:.1f} секунд перед повторною спробою...")
+            return wait_time, None
+        return None, "Перевищено час очікування відповіді від API"
+    elif isinstance(error, APIStatusError) and error.status_code < 500:
+        # Помилки запиту (400, 404, 422) не зникнуть після повторної спроби
+        return None, f"Помилка під час аналізу: {error_msg}"
+    elif attempt == max_retries - 1:
+        return None, f"Помилка під час аналізу: {error_msg}"
+
+    # Помилки з'єднання та серверні помилки (5xx) повторюємо з затримкою
+    return _backoff_delay(attempt), None
+
+def _release_after_error(reserved_tokens, error, started=None):
+    rate_limiter.release(
+        reserved_tokens,
+        rate_limited=isinstance(error, _api_errors("RateLimitError")),
+        retry_after=_retry_after(error),
+        started=started
+    )
+
+def _async_client(clients, route):
+    """
+    Асинхронний клієнт провайдера маршруту, спільний для запитів одного запуску
+    (клієнти прив'язані до циклу подій); бібліотеки провайдерів імпортуються під час першого запиту.
+    Повторні спроби виконує get_analysis_async разом з RateLimiter, тому вбудовані повтори вимкнено.
+    """
+    key = (route["provider"], route.get("base_url"))
+    if key not in clients:
+        if route["provider"] == "anthropic":
+            from anthropic import AsyncAnthropic
+            clients[key] = AsyncAnthropic(base_url=route.get("base_url"), max_retries=0)
+        else:
+            from openai import AsyncOpenAI
+            clients[key] = AsyncOpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"), base_url=route.get("base_url"), max_retries=0
             )
-            print("Успішно отримано відповідь від API")
-            return response.choices[0].message.content
+    return clients[key]
+
+@asynccontextmanager
+async def _run_clients():
+    """Словник асинхронних клієнтів одного запуску; після завершення клієнти закриваються"""
+    clients = {}
+    try:
+        yield clients
+    finally:
+        for async_client in clients.values():
+            await async_client.close()
+
+async def _stream_completion(async_client, params, on_delta):
+    """
+    Потокове отримання відповіді: кожна нова частина тексту одразу передається в on_delta.
+    Повертає повний текст відповіді та дані про використані токени.
+    """
+    stream = await async_client.chat.completions.create(
+        **params,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    parts = []
+    usage = None
+    async for chunk in stream:
+        if chunk.usage:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            delta = chunk.choices[0].delta.content
+            parts.append(delta)
+            on_delta(delta)
+    return ''.join(parts), usage
+
+async def _anthropic_completion(async_client, params, on_delta):
+    """Запит до Anthropic Messages API; дані про токени повертаються у форматі OpenAI"""
+    if on_delta is None:
+        message = await async_client.messages.create(**params)
+        content = "".join(block.text for block in message.content if block.type == "text")
+    else:
+        parts = []
+        async with async_client.messages.stream(**params) as stream:
+            async for delta in stream.text_stream:
+                parts.append(delta)
+                on_delta(delta)
+            message = await stream.get_final_message()
+        content = "".join(parts)
+    usage = SimpleNamespace(
+        prompt_tokens=message.usage.input_tokens,
+        completion_tokens=message.usage.output_tokens,
+        total_tokens=message.usage.input_tokens + message.usage.output_tokens
+    )
+    return content, usage
+
+async def _complete(clients, route, prompt, timeout, max_tokens, json_output, on_delta):
+    """Один запит за маршрутом route; повертає текст відповіді та дані про використані токени"""
+    async_client = _async_client(clients, route)
+    if route["provider"] == "anthropic":
+        # Messages API не має режиму JSON: формат відповіді задає промпт
+        params = {
+            "model": route["model"],
+            "system": SYSTEM_PROMPT,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": TEMPERATURE,
+            "max_tokens": max_tokens,
+            "timeout": timeout
+        }
+        return await _anthropic_completion(async_client, params, on_delta)
+
+    params = _request_params(prompt, timeout, max_tokens, json_output, route["model"])
+    if on_delta is None:
+        response = await async_client.chat.completions.create(**params)
+        return response.choices[0].message.content, response.usage
+    return await _stream_completion(async_client, params, on_delta)
+
+def _is_backend_failure(error):
+    """Помилки, що свідчать про несправність маршруту (таймаути, з'єднання, 5xx), а не запиту чи коду"""
+    if isinstance(error, _api_errors("APIConnectionError") + (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return isinstance(error, _api_errors("APIStatusError")) and error.status_code >= 500
+
+async def _send(clients, route, prompt, timeout, max_tokens, json_output, on_delta, reserved_tokens, record,
+                admission=None):
+    """
+    Запит за маршрутом з резервуванням місця в RateLimiter; тривалість успішних запитів
+    і помилки сервера враховуються в статистиці маршруту та запобіжнику.
+    Подія admission (якщо вказана) встановлюється, щойно RateLimiter пропускає запит.
+    """
+    queued = time.perf_counter()
+    admitted = await rate_limiter.acquire_async(reserved_tokens)
+    record["queue_seconds"] += time.perf_counter() - queued
+    if admission is not None:
+        admission.set()
+    started = time.perf_counter()
+    try:
+        content, usage = await _complete(clients, route, prompt, timeout, max_tokens, json_output, on_delta)
+    except asyncio.CancelledError:
+        # Тривалість скасованого запиту (програв дубльованому) не є затримкою маршруту
+        rate_limiter.release(reserved_tokens)
+        raise
+    except Exception as e:
+        _release_after_error(reserved_tokens, e, admitted)
+        if _is_backend_failure(e):
+            request_router.record_failure(route["name"])
+        raise
+    rate_limiter.release(reserved_tokens, _used_tokens(usage), succeeded=True)
+    request_router.record_success(route["name"], time.perf_counter() - started)
+    return content, usage, route
+
+async def _hedged_request(routes, send, record, hedge=True):
+    """
+    Надсилає запит за першим маршрутом; якщо відповіді немає довше за p95 затримки цього
+    маршруту (від моменту, коли RateLimiter пропустив запит) і дозволяє бюджет, надсилає
+    такий самий запит за наступним маршрутом (або тим самим, якщо інших немає).
+    Повертає першу успішну відповідь, інший запит скасовується.
+    send(route, admission) встановлює подію admission, щойно запит пропущено.
+    """
+    admission = asyncio.Event()
+    primary = asyncio.ensure_future(send(routes[0], admission))
+    tasks = [primary]
+    try:
+        if hedge:
+            # Очікування в черзі RateLimiter не свідчить про повільність маршруту
+            admitted = asyncio.ensure_future(admission.wait())
+            try:
+                await asyncio.wait([primary, admitted], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                admitted.cancel()
+            done, _ = await asyncio.wait(tasks, timeout=request_router.hedge_delay(routes[0]["name"]))
+            if not done and request_router.allow_hedge():
+                hedge_route = routes[1] if len(routes) > 1 else routes[0]
+                print(f"Немає відповіді від {routes[0]['name']}, надсилаємо дубльований запит до {hedge_route['name']}")
+                record["hedged"] = 1
+                tasks.append(asyncio.ensure_future(send(hedge_route)))
+
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    record["hedge_won"] = int(task is not primary)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def get_analysis_async(clients, prompt, max_retries=3, timeout=60,
+                             max_prompt_tokens=MAX_PROMPT_TOKENS, on_delta=None,
+                             max_tokens=MAX_TOKENS, json_output=False, analysis_type=None):
+    """
+    Отримання аналізу від моделі з повторними спробами та таймаутом; очікування між
+    спробами не блокує потік виконання.
+    clients - словник асинхронних клієнтів запуску (див. _async_client). Модель обирає
+    request_router за розміром промпту і типом аналізу (за замовчуванням - тип поточної
+    задачі аналізу); повільна відповідь дублюється запитом до іншого маршруту, а повторна
+    спроба після помилки надсилається за наступним придатним маршрутом.
+    Якщо вказано on_delta, відповідь отримується потоково (без дублювання запитів) і кожна
+    частина тексту передається в on_delta; перед повторною спробою викликається
+    on_delta(None), щоб споживач відкинув уже отриманий текст.
+    max_tokens обмежує довжину відповіді, json_output вимагає від моделі JSON-об'єкт.
+    Якщо аналіз отримати не вдалося, викидає AnalysisError (результат не кешується).
+    """
+    prompt = _truncate_prompt(prompt, max_prompt_tokens)
+    reserved_tokens = _estimate_tokens(prompt, max_tokens)
+    prompt_tokens = count_tokens(prompt)
+    analysis_type = analysis_type or _analysis_category.get()
+
+    print(f"Відправляємо асинхронний запит до API (тип: {analysis_type or 'general'})")
+    print(f"Розмір промпту: {len(prompt)} символів")
+
+    def send(route, admission=None):
+        return _send(
+            clients, route, prompt, timeout, max_tokens, json_output, on_delta, reserved_tokens, record, admission
+        )
 
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Помилка при спробі {attempt + 1}: {error_msg}")
+    with span("api_call", model=None, streamed=on_delta is not None, retries=0, queue_seconds=0.0, hedged=0) as record:
+        for attempt in range(max_retries):
+            record["retries"] = attempt
+            routes = request_router.candidates(prompt_tokens, analysis_type)
+            # Повторна спроба надсилається за наступним придатним маршрутом
+            shift = attempt % len(routes)
+            routes = routes[shift:] + routes[:shift]
+            record["model"] = routes[0]["name"]
+            request_router.count_request()
+            try:
+                content, usage, route = await _hedged_request(
+                    routes, send, record, hedge=HEDGE_REQUESTS and on_delta is None
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Помилка при спробі {attempt + 1}: {str(e)}")
+                if on_delta is not None:
+                    on_delta(None)
 
-            if "rate_limit" in error_msg.lower():
-                wait_time = 2 ** attempt
-                print(f"Перевищено ліміт запитів, очікуємо {wait_time} секунд...")
-                time.sleep(wait_time)
+                wait_time, final_message = _retry_decision(e, attempt, max_retries)
+                if final_message:
+                    record["error"] = type(e).__name__
+                    raise AnalysisError(final_message) from e
+                await asyncio.sleep(wait_time)
                 continue
-            elif "authentication" in error_msg.lower():
-                return "Помилка автентифікації API ключа. Будь ласка, перевірте налаштування."
-            elif "timeout" in error_msg.lower():
-                if attempt < max_retries - 1:
-                    print(f"Таймаут, очікування {2 ** attempt} секунд перед повторною спробою...")
-                    time.sleep(2 ** attempt)
-                    continue
-                return "Перевищено час очікування відповіді від API"
-            elif attempt == max_retries - 1:
-                return f"Помилка під час аналізу: {error_msg}"
 
-            time.sleep(2 ** attempt)
-    return "Не вдалося отримати аналіз після кількох спроб"
+            record["model"] = route["name"]
+            _record_usage(record, usage)
+            return content
+        record["error"] = "retries_exhausted"
+        raise AnalysisError("Не вдалося отримати аналіз після кількох спроб")
+
+_result_cache_lock = threading.Lock()
+_result_cache_ready = False
+
+@contextmanager
+def _result_cache_connection():
+    """Відкриває з'єднання з кешем результатів (в межах однієї транзакції) і створює таблицю за потреби"""
+    global _result_cache_ready
+    cache_dir = os.path.dirname(RESULT_CACHE_PATH)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    connection = sqlite3.connect(RESULT_CACHE_PATH, timeout=30)
+    if not _result_cache_ready:
+        with _result_cache_lock:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS analysis_results (
+                    cache_key TEXT PRIMARY KEY,
+                    document_hash TEXT NOT NULL,
+                    analysis_type TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS analysis_results_document ON analysis_results (document_hash)"
+            )
+            connection.commit()
+            _result_cache_ready = True
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def _document_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _normalize_query(query):
+    """Нормалізує запит, щоб відмінності в регістрі та пробілах не впливали на кеш"""
+    return " ".join(query.lower().split())
+
+def result_cache_key(document_hash, query, analysis_type, **params):
+    """
+    Ключ кешу результату: документ, нормалізований запит, тип аналізу, модель,
+    системний промпт, шаблон промпту та параметри генерації
+    """
+    key_data = {
+        "document": document_hash,
+        "query": _normalize_query(query),
+        "analysis_type": analysis_type or "general",
+        "model": MODEL_NAME,
+        "system_prompt": SYSTEM_PROMPT,
+        "prompt_template": create_analysis_prompt("", "", analysis_type),
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS,
+        "max_prompt_tokens": MAX_PROMPT_TOKENS,
+        **({"routes": MODEL_ROUTES} if MODEL_ROUTES else {}),
+        **params
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def clause_analysis_key(query, analysis_type):
+    """
+    Ключ, у межах якого висновки щодо положень можна використовувати повторно:
+    нормалізований запит, тип аналізу, модель, промпти та параметри генерації
+    """
+    return result_cache_key(
+        "", query, analysis_type,
+        clause_prompt_template=create_clause_prompt([], "", analysis_type)
+    )
+
+def get_cached_result(cache_key):
+    """Повертає збережений результат аналізу або None, якщо його немає чи він застарів"""
+    if not RESULT_CACHE_PATH:
+        return None
+    try:
+        with _result_cache_connection() as connection:
+            row = connection.execute(
+                "SELECT result, created_at FROM analysis_results WHERE cache_key = ?",
+                (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > RESULT_CACHE_TTL:
+                connection.execute("DELETE FROM analysis_results WHERE cache_key = ?", (cache_key,))
+                return None
+            connection.execute(
+                "UPDATE analysis_results SET accessed_at = ? WHERE cache_key = ?",
+                (time.time(), cache_key)
+            )
+            return row[0]
+    except sqlite3.Error as e:
+        print(f"Помилка читання кешу результатів: {str(e)}")
+        return None
+
+def store_cached_result(cache_key, document_hash, analysis_type, result):
+    """Зберігає результат аналізу та витісняє застарілі й найдавніше використані записи"""
+    if not RESULT_CACHE_PATH:
+        return
+    try:
+        now = time.time()
+        with _result_cache_connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO analysis_results VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, document_hash, analysis_type or "general", result, now, now)
+            )
+            connection.execute(
+                "DELETE FROM analysis_results WHERE created_at < ?",
+                (now - RESULT_CACHE_TTL,)
+            )
+            connection.execute(
+                """DELETE FROM analysis_results WHERE cache_key IN (
+                    SELECT cache_key FROM analysis_results
+                    ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (RESULT_CACHE_MAX_ENTRIES,)
+            )
+    except sqlite3.Error as e:
+        print(f"Помилка запису кешу результатів: {str(e)}")
+
+def invalidate_cached_results(text=None, analysis_type=None):
+    """
+    Видаляє записи кешу: для вказаного документа та/або типу аналізу, або всі записи.
+    Повертає кількість видалених записів.
+    """
+    if not RESULT_CACHE_PATH:
+        return 0
+    conditions = []
+    params = []
+    if text is not None:
+        conditions.append("document_hash = ?")
+        params.append(_document_hash(text))
+    if analysis_type is not None:
+        conditions.append("analysis_type = ?")
+        params.append(analysis_type)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with _result_cache_connection() as connection:
+        return connection.execute(f"DELETE FROM analysis_results{where}", params).rowcount
+
+def _group_for_reduce(partial_results, instructions):
+    """
+    Групує часткові результати так, щоб кожен промпт об'єднання (інструкція instructions
+    разом з результатами групи) вміщався в MAX_PROMPT_TOKENS
+    """
+    budget = MAX_PROMPT_TOKENS - count_tokens(instructions)
+    groups = []
+    current_group = []
+    current_length = 0
+
+    for result in partial_results:
+        result_tokens = count_tokens(result)
+        # Кожна група містить щонайменше два результати, інакше об'єднання не зменшить їх кількість
+        if len(current_group) >= 2 and current_length + result_tokens > budget:
+            groups.append(current_group)
+            current_group = []
+            current_length = 0
+        current_group.append(result)
+        current_length += result_tokens
+
+    if current_group:
+        groups.append(current_group)
+
+    return groups
+
+async def _gather(coroutines):
+    """asyncio.gather, що скасовує решту завдань після першої помилки"""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+async def _reduce_results(partial_results, query, analysis_type, call, on_delta=None):
+    """
+    Послідовно об'єднує часткові результати, доки не залишиться один підсумковий аналіз.
+    Лише останнє об'єднання передає текст у on_delta.
+    """
+    async def reduce_group(group, group_on_delta):
+        if len(group) == 1:
+            return group[0]
+        return await call(create_reduce_prompt(group, query, analysis_type), group_on_delta)
+
+    while len(partial_results) > 1:
+        groups = _group_for_reduce(partial_results, create_reduce_prompt([], query, analysis_type))
+        group_on_delta = on_delta if len(groups) == 1 else None
+        partial_results = await _gather(reduce_group(group, group_on_delta) for group in groups)
+    return partial_results[0]
+
+def _chunk_label(chunk, number, total, paged):
+    """Заголовок фрагмента для промпту, щоб висновки можна було прив'язати до сторінок"""
+    if not paged:
+        return f"[Фрагмент {number} з {total}]"
+    if chunk["page_start"] == chunk["page_end"]:
+        return f"[Фрагмент {number} з {total}, стор. {chunk['page_start']}]"
+    return f"[Фрагмент {number} з {total}, стор. {chunk['page_start']}-{chunk['page_end']}]"
+
+def _format_passages(passages, paged):
+    """Текст відібраних положень з позначками сторінок і пропусків між ними"""
+    parts = []
+    for passage in passages:
+        location = f", стор. {passage['page_start']}" if paged else ""
+        parts.append(f"[Положення{location}]\n{passage['text'].strip()}")
+    return "Відібрані положення документа, релевантні для цього аналізу:\n\n" + "\n[...]\n".join(parts)
+
+def _json_object(response):
+    """JSON-об'єкт з відповіді моделі (можливо, оточений іншим текстом) або None"""
+    start, end = response.find("{"), response.rfind("}")
+    try:
+        data = json.loads(response[start:end + 1]) if start != -1 else None
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def _parse_clause_findings(response, count):
+    """
+    Висновки з JSON-відповіді на create_clause_prompt у порядку положень
+    або None, якщо відповідь не містить висновків щодо всіх положень
+    """
+    findings = _json_object(response)
+    if findings is None:
+        return None
+    result = []
+    for number in range(1, count + 1):
+        finding = findings.get(str(number))
+        if not isinstance(finding, str):
+            return None
+        result.append(finding.strip())
+    return result
+
+def _parse_section(value):
+    """
+    Розділ JSON-відповіді у вигляді {"summary": str, "key_points": [str], "recommendations": [str]}
+    або None, якщо значення не відповідає схемі чи не містить висновків
+    """
+    if isinstance(value, str):
+        value = {"summary": value}
+    if not isinstance(value, dict) or not isinstance(value.get("summary", ""), str):
+        return None
+    section = {"summary": value.get("summary", "").strip()}
+    for field in ("key_points", "recommendations"):
+        items = value.get(field) or []
+        if isinstance(items, str):
+            items = [items]
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            return None
+        section[field] = [item.strip() for item in items if item.strip()]
+    if not section["summary"] and not section["key_points"]:
+        return None
+    return section
+
+def _parse_combined_sections(response, analysis_types):
+    """
+    Розділи JSON-відповіді на create_combined_prompt для кожного типу аналізу;
+    типи з відсутніми або некоректними розділами до результату не потрапляють
+    """
+    data = _json_object(response) or {}
+    sections = {}
+    for analysis_type in analysis_types:
+        section = _parse_section(data.get(analysis_type))
+        if section is not None:
+            sections[analysis_type] = section
+    return sections
+
+def _merge_sections(sections):
+    """Об'єднання розділів кількох фрагментів без моделі (якщо відповідь на об'єднання некоректна)"""
+    return {
+        "summary": " ".join(section["summary"] for section in sections if section["summary"]),
+        "key_points": list(dict.fromkeys(item for section in sections for item in section["key_points"])),
+        "recommendations": list(dict.fromkeys(item for section in sections for item in section["recommendations"]))
+    }
+
+def _clause_batches(clauses, indices):
+    """Групує нові положення в запити не більше CLAUSE_BATCH_TOKENS токенів і CLAUSE_BATCH_SIZE положень"""
+    batches = []
+    current = []
+    current_tokens = 0
+    for index in indices:
+        tokens = clauses[index]["tokens"]
+        if current and (current_tokens + tokens > CLAUSE_BATCH_TOKENS or len(current) >= CLAUSE_BATCH_SIZE):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+async def _analyze_clauses(clauses, query, analysis_type, call, on_delta=None, paged=False, reusable=None):
+    """
+    Аналіз з повторним використанням висновків: для положень, які вже аналізувалися
+    (у цьому чи інших документах), беруться збережені висновки, моделі надсилаються лише
+    нові або змінені положення, після чого всі висновки об'єднуються.
+    Якщо вказано reusable (позиції start незмінених положень), збережені висновки
+    використовуються лише для цих положень.
+    """
+    analysis_key = clause_analysis_key(query, analysis_type)
+    signatures = [clause_signature(clause["text"]) for clause in clauses]
+    findings = find_findings(analysis_key, signatures)
+    if reusable is not None:
+        findings = [
+            finding if clause["start"] in reusable else None
+            for clause, finding in zip(clauses, findings)
+        ]
+    new_indices = [index for index, finding in enumerate(findings) if finding is None]
+    record_event(
+        "clause_dedup", analysis_type=analysis_type or "general",
+        clauses=len(clauses), reused=len(clauses) - len(new_indices)
+    )
+    print(f"Положень: {len(clauses)}, висновки взято зі сховища: {len(clauses) - len(new_indices)}")
+
+    async def analyze_batch(batch):
+        response = await call(create_clause_prompt(
+            [clauses[index]["text"].strip() for index in batch], query, analysis_type
+        ))
+        return batch, response
+
+    unparsed = []
+    for batch, response in await _gather(analyze_batch(batch) for batch in _clause_batches(clauses, new_indices)):
+        batch_findings = _parse_clause_findings(response, len(batch))
+        if batch_findings is None:
+            # Відповідь не у форматі JSON: використовуємо її як звичайний частковий результат
+            unparsed.append(response)
+            continue
+        for index, finding in zip(batch, batch_findings):
+            findings[index] = finding
+        store_findings(analysis_key, [signatures[index] for index in batch], batch_findings)
+
+    partial_results = [
+        f"[Положення{f', стор. ' + str(clause['page_start']) if paged else ''}]\n{finding}"
+        for clause, finding in zip(clauses, findings)
+        if finding
+    ] + unparsed
+    if not partial_results:
+        return "Положень, суттєвих для цього аналізу, у документі не виявлено."
+    if len(partial_results) == 1:
+        return await call(create_reduce_prompt(partial_results, query, analysis_type), on_delta)
+    return await _reduce_results(partial_results, query, analysis_type, call, on_delta)
+
+async def _analyze_chunks(chunks, query, analysis_type, call, on_delta=None, paged=False):
+    """
+    Map-reduce аналіз: кожен фрагмент аналізується окремо, потім результати об'єднуються
+    """
+    if len(chunks) == 1:
+        return await call(create_analysis_prompt(chunks[0]["text"], query, analysis_type), on_delta)
+
+    total = len(chunks)
+    print(f"Map-reduce аналіз: {total} фрагментів, тип: {analysis_type or 'general'}")
+    partial_results = await _gather(
+        call(create_analysis_prompt(
+            f"{_chunk_label(chunk, i, total, paged)}\n{chunk['text']}", query, analysis_type
+        ))
+        for i, chunk in enumerate(chunks, 1)
+    )
+    return await _reduce_results(list(partial_results), query, analysis_type, call, on_delta)
+
+async def _analyze_combined(chunks, query, analysis_types, call, paged=False):
+    """
+    Аналіз за всіма типами одним запитом на фрагмент; JSON-результати фрагментів
+    об'єднуються запитами того самого формату. Повертає розділи лише для типів аналізу,
+    для яких модель повернула коректні розділи щодо всіх фрагментів.
+    """
+    total = len(chunks)
+    if total == 1:
+        prompts = [create_combined_prompt(chunks[0]["text"], query, analysis_types)]
+    else:
+        print(f"Map-reduce аналіз: {total} фрагментів, типи: {', '.join(analysis_types)}")
+        prompts = [
+            create_combined_prompt(f"{_chunk_label(chunk, i, total, paged)}\n{chunk['text']}", query, analysis_types)
+            for i, chunk in enumerate(chunks, 1)
+        ]
+    partial_sections = [
+        _parse_combined_sections(response, analysis_types)
+        for response in await _gather(call(prompt) for prompt in prompts)
+    ]
+    valid_types = [
+        analysis_type for analysis_type in analysis_types
+        if all(analysis_type in sections for sections in partial_sections)
+    ]
+    if not valid_types:
+        return {}
+
+    async def reduce_group(group):
+        if len(group) == 1:
+            return group[0]
+        sections = _parse_combined_sections(await call(create_combined_reduce_prompt(group, query, valid_types)), valid_types)
+        group_sections = [json.loads(result) for result in group]
+        return json.dumps({
+            analysis_type: sections.get(analysis_type)
+            or _merge_sections([partial[analysis_type] for partial in group_sections])
+            for analysis_type in valid_types
+        }, ensure_ascii=False)
+
+    partial_results = [
+        json.dumps({analysis_type: sections[analysis_type] for analysis_type in valid_types}, ensure_ascii=False)
+        for sections in partial_sections
+    ]
+    while len(partial_results) > 1:
+        groups = _group_for_reduce(partial_results, create_combined_reduce_prompt([], query, valid_types))
+        partial_results = await _gather(reduce_group(group) for group in groups)
+    return json.loads(partial_results[0])
 
-def analyze_document(text, query, selected_types=None, progress_callback=None):
+async def analyze_document_async(text, query, selected_types=None, progress_callback=None,
+                                 chunk_size=CHUNK_TOKENS, max_concurrency=MAX_CONCURRENCY,
+                                 use_cache=True, stream_callback=None, chunk_overlap=CHUNK_OVERLAP_TOKENS,
+                                 retrieval=True, deduplicate=False, use_facts=True, combined=False,
+                                 previous_text=None):
     """
-    Аналіз документа за запитом користувача та вибраними типами аналізу (якщо вказані)
+    Асинхронний аналіз документа: вибрані типи аналізу та фрагменти документа (до chunk_size
+    токенів з перекриттям chunk_overlap токенів) обробляються одночасно, але не більше
+    max_concurrency запитів до API водночас.
+    Якщо увімкнено retrieval і документ більший за RETRIEVAL_TOKEN_BUDGET, для кожного типу
+    аналізу моделі передаються лише відібрані пошуком BM25 релевантні положення.
+    progress_callback викликається після завершення кожного типу аналізу.
+    Якщо use_cache увімкнено, раніше отримані результати беруться з кешу без запитів до API.
+    Якщо вказано stream_callback, підсумковий текст кожного типу аналізу передається
+    по мірі генерації як stream_callback(тип, частина тексту); значення None замість
+    частини тексту означає, що вже отриманий текст цього типу слід відкинути.
+    Якщо увімкнено deduplicate, документ аналізується по окремих положеннях: висновки
+    щодо положень, уже проаналізованих в інших документах, беруться зі сховища відбитків.
+    Якщо увімкнено use_facts, для фінансового аналізу та аналізу зобов'язань моделі
+    передається зведення автоматично витягнутих фактів (сум, ставок, дат, строків, сторін)
+    замість тексту документа, якщо воно коротше за документ.
+    Якщо увімкнено combined і вибрано кілька типів аналізу, документ надсилається один раз
+    для всіх типів, а результатом кожного типу є розділ {"summary", "key_points",
+    "recommendations"} з JSON-відповіді моделі; типи, для яких відповідь некоректна,
+    аналізуються окремо, як без combined (deduplicate та use_facts у цьому режимі
+    застосовуються лише до них).
+    Якщо вказано previous_text (текст попередньої редакції документа), документ порівнюється
+    з нею на рівні положень: моделі надсилаються лише додані та змінені положення, для
+    незмінених беруться збережені висновки (якщо попередня редакція аналізувалася з тим
+    самим запитом у цьому режимі або з deduplicate), а результат "changes" містить опис
+    змін. У цьому режимі combined і use_facts не застосовуються.
     """
     if not query:
         raise ValueError("Необхідно вказати запит для аналізу")
@@ -80,46 +1167,259 @@ def analyze_document(text, query, selected_types=None, progress_callback=None):
     if progress_callback:
         progress_callback(0.0, "Початок аналізу...")
 
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
     try:
-        results = {}
+        # Асинхронні клієнти прив'язані до циклу подій, тому створюються для кожного запуску
+        async with _run_clients() as clients:
+            async def call(prompt, on_delta=None):
+                async with semaphore:
+                    return await get_analysis_async(clients, prompt, on_delta=on_delta)
 
-        if selected_types is None or len(selected_types) == 0:
-            # Аналіз тільки за запитом користувача
-            if progress_callback:
-                progress_callback(0.3, "Виконується загальний аналіз за запитом...")
+            async def run(analysis_type):
+                result_key = analysis_type or "general"
+                # Запити цієї задачі (і створених нею задач) маршрутизуються за типом аналізу
+                _analysis_category.set(result_key)
+                on_delta = None
+                if stream_callback:
+                    def on_delta(delta):
+                        stream_callback(result_key, delta)
 
-            result = get_analysis(create_analysis_prompt(text, query))
+                # Зведення фактів замінює текст, лише якщо воно коротше за документ
+                type_facts = facts_for_analysis(document_facts, analysis_type) if not revision else []
+                if type_facts and count_tokens(summarize_facts(type_facts, FACTS_TOKEN_BUDGET)) >= document_tokens:
+                    type_facts = []
+                use_retrieval = index is not None and analysis_type is not None
+                cache_key = result_cache_key(
+                    document_hash, query, analysis_type,
+                    chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                    retrieval=[RETRIEVAL_PASSAGE_TOKENS, RETRIEVAL_TOKEN_BUDGET, RETRIEVAL_TOP_K] if use_retrieval else None,
+                    deduplicate=deduplicate,
+                    facts=FACTS_TOKEN_BUDGET if type_facts else None,
+                    previous=_document_hash(previous_text) if revision else None
+                )
+                if use_cache:
+                    cached = get_cached_result(cache_key)
+                    record_event("result_cache", analysis_type=result_key, cache_hit=int(cached is not None))
+                    if cached is not None:
+                        print(f"Результат {result_key} аналізу взято з кешу")
+                        if on_delta:
+                            on_delta(cached)
+                        return analysis_type, cached
 
-            if "Помилка" in result:
-                raise Exception(result)
+                if type_facts:
+                    print(f"{result_key}: замість тексту документа передаються факти ({len(type_facts)})")
+                    with span("analysis", analysis_type=result_key, chunks=1, facts=len(type_facts)):
+                        result = await call(create_analysis_prompt(text, query, analysis_type, facts=type_facts), on_delta)
+                    if use_cache:
+                        store_cached_result(cache_key, document_hash, analysis_type, result)
+                    return analysis_type, result
 
-            results["general"] = result
-        else:
-            # Аналіз за запитом та вибраними типами
-            total_steps = len(selected_types)
-            current_step = 0
+                type_chunks = chunks
+                passages = None
+                if use_retrieval:
+                    # Положення коротші за фрагменти пошуку, тому їх кількість обмежена лише бюджетом токенів
+                    top_k = None if clauses else RETRIEVAL_TOP_K
+                    passages = select_passages(index, analysis_type, query, RETRIEVAL_TOKEN_BUDGET, top_k)
+                    if passages:
+                        print(f"{result_key}: відібрано {len(passages)} з {len(index['passages'])} положень")
+                        type_chunks = [{"text": _format_passages(passages, paged)}]
 
-            for analysis_type in selected_types:
-                if progress_callback:
-                    progress_callback(current_step / total_steps, f"Виконується {analysis_type} аналіз...")
+                with span("analysis", analysis_type=result_key, chunks=len(type_chunks)):
+                    if clauses:
+                        result = await _analyze_clauses(
+                            passages or clauses, query, analysis_type, call, on_delta, paged, unchanged
+                        )
+                    else:
+                        result = await _analyze_chunks(type_chunks, query, analysis_type, call, on_delta, paged)
+                if use_cache:
+                    store_cached_result(cache_key, document_hash, analysis_type, result)
+                return analysis_type, result
+
+            async def run_combined(combined_types):
+                max_tokens = COMBINED_SECTION_TOKENS * len(combined_types)
+
+                async def call_combined(prompt):
+                    async with semaphore:
+                        return await get_analysis_async(
+                            clients, prompt, max_tokens=max_tokens, json_output=True, analysis_type="combined"
+                        )
+
+                # Документ, що вміщується в спільний бюджет, надсилається повністю
+                use_retrieval = index is not None and document_tokens > COMBINED_TOKEN_BUDGET
+                cache_key = result_cache_key(
+                    document_hash, query, "combined",
+                    analysis_types=combined_types,
+                    prompt_template=create_combined_prompt("", "", combined_types),
+                    max_tokens=max_tokens,
+                    chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                    retrieval=[RETRIEVAL_PASSAGE_TOKENS, COMBINED_TOKEN_BUDGET, RETRIEVAL_TOP_K] if use_retrieval else None
+                )
+                if use_cache:
+                    cached = get_cached_result(cache_key)
+                    record_event("result_cache", analysis_type="combined", cache_hit=int(cached is not None))
+                    if cached is not None:
+                        print("Результат аналізу одним запитом взято з кешу")
+                        return json.loads(cached)
+
+                combined_chunks = chunks
+                if use_retrieval:
+                    # Об'єднання положень, відібраних для кожного типу аналізу, в межах спільного бюджету
+                    type_budget = max(RETRIEVAL_PASSAGE_TOKENS, COMBINED_TOKEN_BUDGET // len(combined_types))
+                    selected = {}
+                    for analysis_type in combined_types:
+                        for passage in select_passages(index, analysis_type, query, type_budget, RETRIEVAL_TOP_K):
+                            selected[passage["start"]] = passage
+                    if selected:
+                        print(f"combined: відібрано {len(selected)} з {len(index['passages'])} положень")
+                        passages = [selected[start] for start in sorted(selected)]
+                        combined_chunks = [{"text": _format_passages(passages, paged)}]
+
+                with span("analysis", analysis_type="combined", chunks=len(combined_chunks),
+                          types=len(combined_types)) as record:
+                    sections = await _analyze_combined(combined_chunks, query, combined_types, call_combined, paged)
+                    record["sections"] = len(sections)
+                if use_cache and sections:
+                    store_cached_result(cache_key, document_hash, "combined", json.dumps(sections, ensure_ascii=False))
+                return sections
+
+            async def run_changes():
+                _analysis_category.set("changes")
+                counts = change_counts(changes)
+                header = (
+                    f"Змінено положень: {counts['modified']}, додано: {counts['added']}, "
+                    f"вилучено: {counts['removed']}."
+                )
+                if not any(counts.values()):
+                    return "Текст документа не змінився порівняно з попередньою редакцією."
+                with span("analysis", analysis_type="changes", chunks=1):
+                    summary = await call(create_changes_prompt(format_changes(changes, paged), query))
+                return f"{header}\n\n{summary}"
+
+            document_hash = _document_hash(text)
+            revision = previous_text is not None
 
-                analysis_prompt = create_analysis_prompt(text, query, analysis_type)
-                result = get_analysis(analysis_prompt)
+            with span("chunking", characters=len(text)) as record:
+                chunks = list(iter_chunks(text, chunk_size, chunk_overlap)) or [{"text": text}]
+                record["chunks"] = len(chunks)
+            paged = PAGE_BREAK in text
+            document_tokens = sum(chunk.get("tokens", 0) for chunk in chunks)
 
-                if "Помилка" in result:
-                    raise Exception(result)
+            # Факти потрібні лише для типів аналізу, що їх використовують
+            document_facts = []
+            if use_facts and any(analysis_type in ANALYSIS_FACT_TYPES for analysis_type in selected_types or []):
+                with span("facts", characters=len(text)) as record:
+                    document_facts = extract_facts(text)
+                    record["facts"] = len(document_facts)
 
-                results[analysis_type] = result
-                current_step += 1
+            # Окремі положення для повторного використання висновків
+            clauses = None
+            if deduplicate or revision:
+                with span("clause_split") as record:
+                    clauses = list(iter_clauses(text, RETRIEVAL_PASSAGE_TOKENS)) or [chunks[0]]
+                    record["clauses"] = len(clauses)
+
+            # Порівняння з попередньою редакцією: збережені висновки беруться лише для незмінених положень
+            changes = None
+            unchanged = None
+            if revision:
+                with span("revision_diff") as record:
+                    changes = diff_clauses(list(iter_clauses(previous_text, RETRIEVAL_PASSAGE_TOKENS)), clauses)
+                    unchanged = {change["new"]["start"] for change in changes if change["kind"] == "unchanged"}
+                    record.update(clauses=len(clauses), **change_counts(changes))
+                combined = False
+
+            # Індекс для відбору положень будується один раз для всіх типів аналізу
+            index = None
+            if retrieval and selected_types and document_tokens > RETRIEVAL_TOKEN_BUDGET:
+                with span("retrieval_index"):
+                    index = build_index(clauses or list(iter_chunks(text, RETRIEVAL_PASSAGE_TOKENS)))
+
+            if selected_types is None or len(selected_types) == 0:
+                # Аналіз тільки за запитом користувача
+                analysis_types = [None]
+                if progress_callback:
+                    progress_callback(0.3, "Виконується загальний аналіз за запитом...")
+            else:
+                # Аналіз за запитом та вибраними типами
+                analysis_types = list(selected_types)
+                if progress_callback:
+                    progress_callback(0.0, f"Виконується аналіз: {', '.join(analysis_types)}...")
+
+            results = {}
+            total = len(analysis_types)
+            if combined and len(analysis_types) > 1:
+                results.update(await run_combined(analysis_types))
+                # Типи з некоректними розділами відповіді аналізуються окремими запитами
+                analysis_types = [analysis_type for analysis_type in analysis_types if analysis_type not in results]
+                record_event("combined_analysis", types=total, fallback=len(analysis_types))
+                if analysis_types:
+                    print(f"Некоректна відповідь для розділів {', '.join(analysis_types)}, виконується окремий аналіз")
+                if progress_callback:
+                    progress_callback(len(results) / total, f"Завершено аналіз одним запитом ({len(results)} з {total})")
+
+            tasks = [asyncio.create_task(run(analysis_type)) for analysis_type in analysis_types]
+            changes_task = asyncio.create_task(run_changes()) if revision else None
+            try:
+                for completed in asyncio.as_completed(tasks):
+                    analysis_type, result = await completed
+                    results[analysis_type or "general"] = result
+                    if progress_callback and analysis_type:
+                        progress_callback(
+                            len(results) / total,
+                            f"Завершено {analysis_type} аналіз ({len(results)} з {total})"
+                        )
+                if changes_task:
+                    results["changes"] = await changes_task
+            finally:
+                for task in tasks + ([changes_task] if changes_task else []):
+                    task.cancel()
 
         if progress_callback:
             progress_callback(1.0, "Аналіз успішно завершено!")
 
-        return results
+        # Зберігаємо порядок вибраних типів аналізу; опис змін редакції - останнім
+        result_keys = list(selected_types or ["general"])
+        if revision:
+            result_keys.append("changes")
+        return {key: results[key] for key in result_keys}
 
     except Exception as e:
         error_msg = str(e)
         print(f"Критична помилка: {error_msg}")
         if progress_callback:
             progress_callback(1.0, f"Помилка: {error_msg}")
-        return {"error": f"Виникла помилка під час аналізу: {error_msg}"}
\ No newline at end of file
+        return {"error": f"Виникла помилка під час аналізу: {error_msg}"}
+
+def analyze_document(text, query, selected_types=None, progress_callback=None,
+                     chunk_size=CHUNK_TOKENS, max_concurrency=MAX_CONCURRENCY, use_cache=True,
+                     stream_callback=None, chunk_overlap=CHUNK_OVERLAP_TOKENS, retrieval=True,
+                     deduplicate=False, use_facts=True, combined=False, previous_text=None):
+    """
+    Аналіз документа за запитом користувача та вибраними типами аналізу (якщо вказані).
+    Документ розбивається на структурні фрагменти до chunk_size токенів, які разом з вибраними
+    типами аналізу обробляються одночасно (не більше max_concurrency запитів водночас),
+    після чого результати фрагментів об'єднуються. Результати кешуються між сесіями.
+    stream_callback отримує текст результатів по мірі генерації, retrieval вмикає відбір
+    релевантних положень для кожного типу аналізу, deduplicate - повторне використання
+    висновків щодо положень з інших документів, use_facts - передачу моделі зведення
+    витягнутих фактів замість тексту, combined - аналіз усіх вибраних типів одним запитом
+    зі структурованими розділами результату, previous_text - аналіз лише положень, змінених
+    порівняно з попередньою редакцією, з описом змін (див. analyze_document_async).
+    """
+    return asyncio.run(analyze_document_async(
+        text,
+        query,
+        selected_types,
+        progress_callback=progress_callback,
+        chunk_size=chunk_size,
+        max_concurrency=max_concurrency,
+        use_cache=use_cache,
+        stream_callback=stream_callback,
+        chunk_overlap=chunk_overlap,
+        retrieval=retrieval,
+        deduplicate=deduplicate,
+        use_facts=use_facts,
+        combined=combined,
+        previous_text=previous_text
+    ))
@@ -0,0 +1,243 @@
+"""
+Пакетний аналіз документів без інтерфейсу Streamlit.
+
+Приклади:
+    python batch.py ./data_room --query "Оцініть ризики для покупця" --types risks financial
+    python batch.py manifest.jsonl --query "Загальний аналіз" --output ./reports
+
+Маніфест - текстовий файл, кожен рядок якого містить шлях до документа або JSON-об'єкт
+{"path": "...", "query": "...", "types": [...]} з індивідуальними параметрами аналізу.
+Витягування тексту та аналіз працюють як конвеєр з обмеженими чергами; виконані документи
+записуються у файл контрольної точки, тож перерваний запуск можна продовжити.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import document_processor
+from document_processor import extract_text
+from analyzer import analyze_document, REDUCE_TOPICS
+from utils import download_results, create_docx_results
+from facts import extract_facts
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.doc')
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+def find_documents(input_path):
+    """
+    Повертає список завдань {"path", "query", "types"} з каталогу або маніфесту
+    """
+    if os.path.isdir(input_path):
+        items = []
+        for root, _, files in os.walk(input_path):
+            for name in sorted(files):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    items.append({"path": os.path.join(root, name)})
+        return sorted(items, key=lambda item: item["path"])
+
+    items = []
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    with open(input_path, encoding='utf-8') as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            item = json.loads(line) if line.startswith('{') else {"path": line}
+            item["path"] = os.path.join(base_dir, item["path"])
+            items.append(item)
+    return items
+
+def load_checkpoint(checkpoint_path):
+    """
+    Читає контрольну точку: останній запис для кожного документа
+    """
+    records = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding='utf-8') as checkpoint:
+            for line in checkpoint:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["path"]] = record
+    return records
+
+def report_name(path):
+    """Ім'я звіту: назва файлу та короткий хеш повного шляху для унікальності"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]}"
+
+def _init_extraction_worker():
+    # Робочі процеси вже розпаралелюють конвеєр, тому PDF обробляється без вкладеного пулу
+    document_processor.PDF_WORKERS = 1
+
+def _extract_file(path):
+    with open(path, 'rb') as file:
+        return extract_text(file, use_cache=False)
+
+def _extraction_stage(items, executor, analysis_queue, window, analysis_workers):
+    """
+    Подає файли на витягування тексту (не більше window одночасно) та передає результати
+    в обмежену чергу аналізу в порядку подання
+    """
+    pending = deque()
+
+    def forward(item, future):
+        try:
+            analysis_queue.put((item, future.result(), None))
+        except Exception as e:
+            analysis_queue.put((item, None, f"Помилка при обробці файлу: {str(e)}"))
+
+    for item in items:
+        pending.append((item, executor.submit(_extract_file, item["path"])))
+        if len(pending) >= window:
+            forward(*pending.popleft())
+    while pending:
+        forward(*pending.popleft())
+
+    for _ in range(analysis_workers):
+        analysis_queue.put(None)
+
+def _write_reports(output_dir, item, analysis_results, selected_types, facts=None):
+    name = report_name(item["path"])
+    txt_path = os.path.join(output_dir, f"{name}.txt")
+    docx_path = os.path.join(output_dir, f"{name}.docx")
+
+    with open(txt_path, 'w', encoding='utf-8') as report:
+        report.write(download_results(analysis_results, selected_types, facts))
+    with open(docx_path, 'wb') as report:
+        report.write(create_docx_results(analysis_results, selected_types, facts).getvalue())
+    return txt_path, docx_path
+
+def _analysis_worker(analysis_queue, args, output_dir, record_result):
+    while True:
+        task = analysis_queue.get()
+        if task is None:
+            return
+
+        item, text, error = task
+        started = time.monotonic()
+        record = {"path": item["path"], "status": "failed", "error": error}
+
+        # Помилка одного документа не повинна зупиняти потік: інакше черга аналізу
+        # заповниться, і етап витягування тексту чекатиме на неї безкінечно
+        try:
+            if error is None:
+                query = item.get("query") or args.query
+                selected_types = item.get("types", args.types) or None
+                analysis_results = analyze_document(
+                    text, query, selected_types, deduplicate=args.deduplicate, combined=args.combined
+                )
+
+                if "error" in analysis_results:
+                    record["error"] = analysis_results["error"]
+                else:
+                    txt_path, docx_path = _write_reports(
+                        output_dir, item, analysis_results, selected_types, extract_facts(text)
+                    )
+                    record.update({
+                        "status": "ok",
+                        "error": None,
+                        "report_txt": os.path.relpath(txt_path, output_dir),
+                        "report_docx": os.path.relpath(docx_path, output_dir),
+                        "characters": len(text)
+                    })
+        except Exception as e:
+            record.update({"status": "failed", "error": f"Помилка при аналізі документа: {str(e)}"})
+
+        record["seconds"] = round(time.monotonic() - started, 2)
+        record_result(record)
+
+def write_index(output_dir, records):
+    """
+    Записує зведений індекс звітів у форматах CSV та JSON
+    """
+    fields = ["path", "status", "report_txt", "report_docx", "characters", "seconds", "error"]
+    with open(os.path.join(output_dir, "index.csv"), 'w', encoding='utf-8', newline='') as index:
+        writer = csv.DictWriter(index, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(records)
+    with open(os.path.join(output_dir, "index.json"), 'w', encoding='utf-8') as index:
+        json.dump(records, index, ensure_ascii=False, indent=2)
+
+def run_batch(args):
+    """
+    Запускає конвеєр: процеси витягування тексту -> обмежена черга -> потоки аналізу
+    """
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint_path = os.path.join(args.output, CHECKPOINT_FILE)
+    records = load_checkpoint(checkpoint_path)
+
+    items = find_documents(args.input)
+    todo = [item for item in items if records.get(item["path"], {}).get("status") != "ok"]
+    print(f"Знайдено документів: {len(items)}, вже оброблено: {len(items) - len(todo)}")
+
+    lock = threading.Lock()
+    completed = 0
+
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+        def record_result(record):
+            nonlocal completed
+            with lock:
+                records[record["path"]] = record
+                checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+                completed += 1
+                status = "готово" if record["status"] == "ok" else f"помилка: {record['error']}"
+                print(f"[{completed}/{len(todo)}] {record['path']}: {status} ({record['seconds']} с)")
+
+        analysis_queue = queue.Queue(maxsize=args.queue_size)
+        workers = [
+            threading.Thread(
+                target=_analysis_worker,
+                args=(analysis_queue, args, args.output, record_result),
+                daemon=True
+            )
+            for _ in range(args.analysis_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        # Потоки аналізу вже запущено, тому процеси створюються без fork
+        with ProcessPoolExecutor(max_workers=args.extract_workers, mp_context=document_processor.process_pool_context(),
+                                 initializer=_init_extraction_worker) as executor:
+            _extraction_stage(todo, executor, analysis_queue, args.queue_size, args.analysis_workers)
+            for worker in workers:
+                worker.join()
+
+    index_records = [records[item["path"]] for item in items if item["path"] in records]
+    write_index(args.output, index_records)
+
+    failed = sum(1 for record in index_records if record["status"] != "ok")
+    print(f"Завершено. Успішно: {len(index_records) - failed}, з помилками: {failed}")
+    return 1 if failed else 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетний аналіз юридичних документів")
+    parser.add_argument("input", help="Каталог з документами або файл маніфесту")
+    parser.add_argument("--query", required=True, help="Запит для аналізу (можна перевизначити в маніфесті)")
+    parser.add_argument("--types", nargs="*", choices=list(REDUCE_TOPICS), default=None,
+                        help="Категорії аналізу; якщо не вказано, виконується загальний аналіз")
+    parser.add_argument("--output", default="batch_reports", help="Каталог для звітів")
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 1,
+                        help="Кількість процесів витягування тексту")
+    parser.add_argument("--analysis-workers", type=int, default=4,
+                        help="Кількість документів, що аналізуються одночасно")
+    parser.add_argument("--deduplicate", action="store_true",
+                        help="Повторно використовувати висновки щодо положень, що вже аналізувалися")
+    parser.add_argument("--combined", action="store_true",
+                        help="Аналізувати всі вибрані категорії одним запитом на документ")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="Максимальна кількість документів, що очікують на аналіз")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    return run_batch(parse_args(argv))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,236 @@
+"""
+Генератор синтетичних договорів у форматах PDF, DOCX та DOC для бенчмарків.
+Файли будуються напряму (без Word, LibreOffice чи бібліотек запису PDF), тому корпус
+однаковий на будь-якій машині для того самого початкового значення генератора.
+"""
+import io
+import os
+import random
+import struct
+import zipfile
+from xml.sax.saxutils import escape
+
+LINES_PER_PAGE = 36
+
+_SECTIONS_UK = (
+    "ПРЕДМЕТ ДОГОВОРУ", "ЦІНА ТА ПОРЯДОК РОЗРАХУНКІВ", "ПРАВА ТА ОБОВ'ЯЗКИ СТОРІН",
+    "ВІДПОВІДАЛЬНІСТЬ СТОРІН", "ФОРС-МАЖОР", "ПОРЯДОК ВИРІШЕННЯ СПОРІВ", "СТРОК ДІЇ ДОГОВОРУ"
+)
+_CLAUSES_UK = (
+    "Постачальник зобов'язується поставити товар протягом {days} календарних днів з дати оплати.",
+    "Загальна вартість робіт становить {amount} грн, у тому числі ПДВ 20%.",
+    "Покупець сплачує аванс у розмірі {percent}% вартості товару до {date}.",
+    "За порушення строків оплати сторона сплачує пеню в розмірі {percent}% за кожен день прострочення.",
+    "Сторона звільняється від відповідальності у разі настання обставин непереборної сили.",
+    "Усі спори вирішуються шляхом переговорів, а в разі недосягнення згоди - в суді.",
+    "Замовник має право в односторонньому порядку розірвати договір, повідомивши за {days} днів.",
+    "Виконавець відшкодовує збитки, завдані неналежним виконанням зобов'язань, у сумі до {amount} USD."
+)
+_SECTIONS_EN = (
+    "SUBJECT OF THE AGREEMENT", "PRICE AND PAYMENT TERMS", "RIGHTS AND OBLIGATIONS",
+    "LIABILITY OF THE PARTIES", "FORCE MAJEURE", "DISPUTE RESOLUTION", "TERM OF THE AGREEMENT"
+)
+_CLAUSES_EN = (
+    "The Supplier shall deliver the goods within {days} calendar days after payment.",
+    "The total price of the works is {amount} UAH including VAT 20%.",
+    "The Buyer shall pay an advance of {percent}% of the price before {date}.",
+    "For late payment the defaulting party pays a penalty of {percent}% per day of delay.",
+    "A party is released from liability in case of force majeure circumstances.",
+    "All disputes shall be settled by negotiation or, failing that, in court.",
+    "The Customer may terminate the agreement unilaterally with {days} days notice.",
+    "The Contractor compensates damages caused by improper performance up to {amount} USD."
+)
+
+def generate_pages(pages, seed=0, latin=False):
+    """
+    Текст договору з заданою кількістю сторінок: розділи з нумерованими пунктами.
+    latin=True - англійський текст (для PDF зі стандартним шрифтом без кирилиці).
+    """
+    rng = random.Random(seed)
+    sections, clauses = (_SECTIONS_EN, _CLAUSES_EN) if latin else (_SECTIONS_UK, _CLAUSES_UK)
+    heading = "Section" if latin else "Розділ"
+
+    result = []
+    section = 0
+    clause = 0
+    for _ in range(pages):
+        lines = []
+        while len(lines) < LINES_PER_PAGE:
+            if clause == 0 or rng.random() < 0.08:
+                section += 1
+                clause = 0
+                lines.append(f"{heading} {section}. {sections[(section - 1) % len(sections)]}")
+            clause += 1
+            text = rng.choice(clauses).format(
+                days=rng.choice((5, 10, 14, 30, 60)),
+                amount=f"{rng.randrange(10, 5000) * 1000:,}".replace(",", " "),
+                percent=rng.choice(("0.1", "0.5", "1", "10", "30")),
+                date=f"{rng.randrange(1, 29):02d}.{rng.randrange(1, 13):02d}.{rng.randrange(2024, 2028)}"
+            )
+            lines.append(f"{section}.{clause}. {text}")
+        result.append("\n".join(lines))
+    return result
+
+def write_pdf(pages):
+    """PDF 1.4 зі стандартним шрифтом Helvetica, по одному текстовому потоку на сторінку"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    ]
+    kids = []
+    for page in pages:
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode('ascii')
+        )
+        lines = (line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') for line in page.split("\n"))
+        content = "BT /F1 9 Tf 40 760 Td 20 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        content = content.encode('cp1252', 'replace')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode('ascii')
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, content in enumerate(objects, 1):
+        offsets.append(output.tell())
+        output.write(b"%d 0 obj\n" % number + content + b"\nendobj\n")
+    xref = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii'))
+    output.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('ascii'))
+    return output.getvalue()
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+def write_docx(pages):
+    """Мінімальний документ DOCX: абзац на кожен рядок і розрив сторінки між сторінками"""
+    body = []
+    for page_number, page in enumerate(pages):
+        if page_number:
+            body.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+        for line in page.split("\n"):
+            body.append(f'<w:p><w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r></w:p>')
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{"".join(body)}</w:body></w:document>'
+    )
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _DOCX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _DOCX_RELS)
+        archive.writestr('word/document.xml', document)
+    return output.getvalue()
+
+_SECTOR = 512
+_ENDOFCHAIN = 0xFFFFFFFE
+_FREESECT = 0xFFFFFFFF
+_FATSECT = 0xFFFFFFFD
+
+def _pad_stream(data):
+    # Потоки, не менші за 4096 байт, зберігаються у звичайних секторах (без міні-потоку)
+    data = data.ljust(4096, b'\0')
+    return data + b'\0' * (-len(data) % _SECTOR)
+
+def _directory_entry(name, entry_type, start, size, child=_FREESECT, right=_FREESECT):
+    encoded = name.encode('utf-16-le') + b'\0\0'
+    entry = bytearray(128)
+    entry[:len(encoded)] = encoded
+    struct.pack_into('<HBB', entry, 0x40, len(encoded), entry_type, 1)
+    struct.pack_into('<III', entry, 0x44, _FREESECT, right, child)
+    struct.pack_into('<II', entry, 0x74, start, size)
+    return bytes(entry)
+
+def write_doc(pages):
+    """
+    Документ Word 97 (складений файл OLE) з текстом в одному фрагменті UTF-16.
+    Містить лише структури, потрібні для читання тексту: FIB, таблицю фрагментів і потоки.
+    """
+    text = "\x0c".join(pages).replace("\n", "\r") + "\r"
+    fib = bytearray(1024)
+    struct.pack_into('<H', fib, 0, 0xA5EC)
+    struct.pack_into('<H', fib, 0x0A, 0x0200)  # таблиці в потоці 1Table
+    struct.pack_into('<I', fib, 0x4C, len(text))
+    clx = b'\x02' + struct.pack('<I', 16) + struct.pack('<II', 0, len(text)) + struct.pack('<HIH', 0, len(fib), 0)
+    struct.pack_into('<II', fib, 0x01A2, 0, len(clx))
+
+    word_stream = _pad_stream(bytes(fib) + text.encode('utf-16-le'))
+    table_stream = _pad_stream(clx)
+    word_sectors = len(word_stream) // _SECTOR
+    table_sectors = len(table_stream) // _SECTOR
+
+    ids_per_sector = _SECTOR // 4
+    fat_sectors = 1
+    while fat_sectors + 1 + word_sectors + table_sectors > fat_sectors * ids_per_sector:
+        fat_sectors += 1
+    if fat_sectors > 109:
+        raise ValueError("Документ завеликий для генератора без секторів DIFAT")
+
+    fat = [_FATSECT] * fat_sectors
+    directory_start = len(fat)
+    fat.append(_ENDOFCHAIN)
+    word_start = len(fat)
+    fat += [word_start + i + 1 for i in range(word_sectors - 1)] + [_ENDOFCHAIN]
+    table_start = len(fat)
+    fat += [table_start + i + 1 for i in range(table_sectors - 1)] + [_ENDOFCHAIN]
+    fat += [_FREESECT] * (fat_sectors * ids_per_sector - len(fat))
+
+    directory = (
+        _directory_entry('Root Entry', 5, _ENDOFCHAIN, 0, child=1)
+        + _directory_entry('WordDocument', 2, word_start, len(word_stream), right=2)
+        + _directory_entry('1Table', 2, table_start, len(table_stream))
+        + b'\0' * 128
+    )
+
+    header = bytearray(_SECTOR)
+    header[:8] = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+    struct.pack_into('<HHHHH', header, 0x18, 0x3E, 3, 0xFFFE, 9, 6)
+    struct.pack_into('<8I', header, 0x2C, fat_sectors, directory_start, 0, 4096, _ENDOFCHAIN, 0, _ENDOFCHAIN, 0)
+    struct.pack_into('<109I', header, 0x4C, *(list(range(fat_sectors)) + [_FREESECT] * (109 - fat_sectors)))
+
+    return bytes(header) + struct.pack(f'<{len(fat)}I', *fat) + directory + word_stream + table_stream
+
+WRITERS = {
+    "pdf": write_pdf,
+    "docx": write_docx,
+    "doc": write_doc
+}
+
+def generate_corpus(directory, formats, sizes, documents, seed=0):
+    """
+    Створює (якщо ще не створено) documents файлів кожного формату та розміру в сторінках.
+    Повертає список {"format", "pages", "path"}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    corpus = []
+    for file_format in formats:
+        for pages in sizes:
+            for number in range(documents):
+                path = os.path.join(directory, f"contract-{pages}p-{number}.{file_format}")
+                if not os.path.exists(path):
+                    content = generate_pages(pages, seed=seed + number, latin=file_format == "pdf")
+                    with open(path, 'wb') as output:
+                        output.write(WRITERS[file_format](content))
+                corpus.append({"format": file_format, "pages": pages, "path": path})
+    return corpus
@@ -0,0 +1,273 @@
+"""
+Локальний сервер, сумісний з OpenAI Chat Completions, для бенчмарків без витрат квоти API.
+
+Приклад:
+    python benchmarks/mock_openai.py --port 8400 --latency 0.2 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8400/v1 OPENAI_API_KEY=benchmark streamlit run main.py
+
+Сервер імітує затримку відповіді (з випадковим розкидом і рідкісними повільними
+відповідями), відмови 429 із заголовком retry-after-ms та потокові відповіді (SSE); на промпти, що
+вимагають JSON, повертає JSON-об'єкт з висновком для кожного пронумерованого положення
+або з розділом для кожного типу аналізу.
+GET /stats повертає лічильники запитів, POST /reset їх обнуляє.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_ANSWER_SENTENCES = (
+    "Ключові положення документа визначають предмет, строки та порядок розрахунків.",
+    "Основний ризик полягає в односторонньому праві розірвання договору.",
+    "Штрафні санкції передбачено лише для однієї сторони.",
+    "Рекомендується уточнити порядок приймання робіт і строки оплати.",
+    "Положення про форс-мажор відповідають чинному законодавству України."
+)
+
+class MockState:
+    """Налаштування та лічильники сервера, спільні для всіх потоків обробки запитів"""
+
+    def __init__(self, latency, jitter, slow_rate, slow_latency, rate_limit_rate, retry_after_ms,
+                 completion_tokens, seed):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        self.completion_tokens = completion_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {
+                "requests": 0,
+                "completed": 0,
+                "rate_limited": 0,
+                "streamed": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0
+            }
+
+    def count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def draw(self):
+        """Повертає (відмовити з 429, затримка відповіді в секундах)"""
+        with self._lock:
+            rate_limited = self._random.random() < self.rate_limit_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self._random.random() < self.slow_rate:
+                delay += self.slow_latency
+        return rate_limited, delay
+
+def _answer(prompt_tokens, completion_tokens):
+    """Детермінований текст відповіді приблизно заданої довжини в токенах"""
+    sentences = []
+    length = 0
+    index = 0
+    while length < completion_tokens * 4:
+        sentence = _ANSWER_SENTENCES[index % len(_ANSWER_SENTENCES)]
+        sentences.append(f"{index + 1}. {sentence}")
+        length += len(sentence)
+        index += 1
+    sentences.append(f"(Проаналізовано приблизно {prompt_tokens} токенів.)")
+    return "\n".join(sentences)
+
+_NUMBERED_ITEM = re.compile(r"^\[(\d+)\]$", re.MULTILINE)
+
+def _json_answer(prompt):
+    """Відповідь на промпт, що вимагає JSON: висновок для кожного пронумерованого положення"""
+    return json.dumps({
+        number: _ANSWER_SENTENCES[int(number) % len(_ANSWER_SENTENCES)] if int(number) % 3 else ""
+        for number in _NUMBERED_ITEM.findall(prompt)
+    }, ensure_ascii=False)
+
+_SECTION_ITEM = re.compile(r'^- "(\w+)":', re.MULTILINE)
+
+def _combined_answer(prompt):
+    """Відповідь на промпт аналізу кількох типів одним запитом: розділ для кожного типу"""
+    return json.dumps({
+        section: {
+            "summary": _ANSWER_SENTENCES[index % len(_ANSWER_SENTENCES)],
+            "key_points": list(_ANSWER_SENTENCES[1:3]),
+            "recommendations": [_ANSWER_SENTENCES[3]]
+        }
+        for index, section in enumerate(_SECTION_ITEM.findall(prompt))
+    }, ensure_ascii=False)
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload):
+        data = f"data: {payload}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.state.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+
+        if self.path.rstrip('/') == '/reset':
+            self.state.reset()
+            self._send_json(200, {"status": "ok"})
+            return
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        request = json.loads(body or b'{}')
+        self.state.count(requests=1)
+        rate_limited, delay = self.state.draw()
+
+        if rate_limited:
+            self.state.count(rate_limited=1)
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"retry-after-ms": str(self.state.retry_after_ms)}
+            )
+            return
+
+        prompt = "".join(str(message.get("content", "")) for message in request.get("messages", []))
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = min(self.state.completion_tokens, request.get("max_tokens") or self.state.completion_tokens)
+        if _SECTION_ITEM.search(prompt):
+            content = _combined_answer(prompt)
+        elif "JSON" in prompt:
+            content = _json_answer(prompt)
+        else:
+            content = _answer(prompt_tokens, completion_tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        model = request.get("model", "mock")
+        created = int(time.time())
+
+        if not request.get("stream"):
+            time.sleep(delay)
+            self.state.count(completed=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            self._send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+            return
+
+        # Потокова відповідь: затримка розподіляється між частинами тексту
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        parts = content.split("\n")
+        for part_index, part in enumerate(parts):
+            time.sleep(delay / len(parts))
+            text = part if part_index == len(parts) - 1 else part + "\n"
+            self._write_chunk(json.dumps({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]
+            }, ensure_ascii=False))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._write_chunk(json.dumps({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": usage
+            }))
+        self._write_chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+        self.state.count(completed=1, streamed=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+def create_server(port=0, host="127.0.0.1", **settings):
+    """Створює сервер (без запуску); port=0 означає будь-який вільний порт"""
+    handler = type("Handler", (MockOpenAIHandler,), {"state": MockState(**settings)})
+    return ThreadingHTTPServer((host, port), handler)
+
+def add_server_arguments(parser):
+    """Параметри імітації, спільні для цього сервера та запускача бенчмарків"""
+    parser.add_argument("--latency", type=float, default=0.05, help="Базова затримка відповіді (с)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Випадковий розкид затримки (с)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Частка повільних відповідей")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Додаткова затримка повільних відповідей (с)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Частка відповідей 429")
+    parser.add_argument("--retry-after-ms", type=int, default=50, help="Значення заголовка retry-after-ms")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Довжина відповіді в токенах")
+    parser.add_argument("--seed", type=int, default=42, help="Початкове значення генератора випадкових чисел")
+
+def server_settings(args):
+    return {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "slow_rate": args.slow_rate,
+        "slow_latency": args.slow_latency,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after_ms": args.retry_after_ms,
+        "completion_tokens": args.completion_tokens,
+        "seed": args.seed
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Імітація OpenAI Chat Completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8400)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = create_server(args.port, args.host, **server_settings(args))
+    print(f"Імітація OpenAI API: http://{args.host}:{server.server_address[1]}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
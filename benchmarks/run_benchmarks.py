@@ -0,0 +1,276 @@
+"""
+Бенчмарки витягування тексту та аналізу документів з локальною імітацією OpenAI API.
+
+Приклади:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 1 10 50 --documents 5 --rate-limit-rate 0.05 --stream
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py --check  # код виходу 1, якщо є регресії відносно базових значень
+
+Для кожного сценарію звітуються документи за секунду, затримки p50/p95/p99, пікова пам'ять
+(виділення Python у процесі бенчмарку за tracemalloc) і кількість запитів до API на документ.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from corpus import WRITERS, generate_corpus
+from mock_openai import add_server_arguments
+
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+CORPUS_DIR = os.path.join(ROOT_DIR, ".cache", "benchmark_corpus")
+# Показники, для яких менше значення краще; для documents_per_second краще більше
+LOWER_IS_BETTER = (
+    "p50_seconds", "p95_seconds", "p99_seconds", "peak_memory_mb",
+    "api_calls_per_document", "prompt_tokens_per_document"
+)
+
+def percentile(values, fraction):
+    """Перцентиль за методом найближчого рангу"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * fraction // 1))
+    return ordered[int(rank) - 1]
+
+def summarize_latencies(latencies, wall_seconds, peak_bytes):
+    return {
+        "documents": len(latencies),
+        "documents_per_second": round(len(latencies) / wall_seconds, 3) if wall_seconds else 0.0,
+        "p50_seconds": round(percentile(latencies, 0.50), 4),
+        "p95_seconds": round(percentile(latencies, 0.95), 4),
+        "p99_seconds": round(percentile(latencies, 0.99), 4),
+        "peak_memory_mb": round(peak_bytes / 2 ** 20, 2)
+    }
+
+def start_mock_server(args):
+    """Запускає імітацію API в окремому процесі, щоб вона не впливала на вимірювання"""
+    command = [
+        sys.executable, os.path.join(BENCHMARK_DIR, "mock_openai.py"), "--port", "0",
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency),
+        "--rate-limit-rate", str(args.rate_limit_rate), "--retry-after-ms", str(args.retry_after_ms),
+        "--completion-tokens", str(args.completion_tokens), "--seed", str(args.seed)
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    base_url = process.stdout.readline().strip().rsplit(" ", 1)[-1]
+    if not base_url.startswith("http"):
+        process.kill()
+        raise RuntimeError("Не вдалося запустити імітацію OpenAI API")
+    return process, base_url
+
+def server_request(base_url, path, method="GET"):
+    root = base_url.rsplit("/v1", 1)[0]
+    request = urllib.request.Request(root + path, data=b"" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+def bench_extraction(corpus, args):
+    """Витягування тексту з кожного файлу корпусу (без кешу), сценарій на формат і розмір"""
+    from document_processor import extract_text
+
+    results = {}
+    texts = {}
+    for file_format in args.formats:
+        # Прогрів: залежності формату імпортуються під час першого використання,
+        # а холодний запуск вимірює benchmarks/startup.py
+        warm_up = next(item for item in corpus if item["format"] == file_format)
+        with open(warm_up["path"], 'rb') as file, redirect_stdout(io.StringIO()):
+            extract_text(file, use_cache=False)
+
+        for pages in args.sizes:
+            files = [item for item in corpus if item["format"] == file_format and item["pages"] == pages]
+            latencies = []
+            tracemalloc.start()
+            started = time.perf_counter()
+            for item in files:
+                with open(item["path"], 'rb') as file:
+                    file_started = time.perf_counter()
+                    with redirect_stdout(io.StringIO()):
+                        text = extract_text(file, use_cache=False)
+                    latencies.append(time.perf_counter() - file_started)
+                texts.setdefault((file_format, pages), []).append(text)
+            wall = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            scenario = f"extract/{file_format}/{pages}p"
+            results[scenario] = summarize_latencies(latencies, wall, peak)
+            results[scenario]["characters"] = sum(len(text) for text in texts[(file_format, pages)])
+            print(f"{scenario}: {results[scenario]['documents_per_second']} док/с", flush=True)
+    return results, texts
+
+def bench_analysis(texts, args, base_url):
+    """
+    Повний аналіз analyze_document для витягнутих текстів кожного розміру
+    (українських текстів DOCX або DOC, якщо ці формати є в корпусі)
+    """
+    from analyzer import analyze_document
+
+    stream_callback = (lambda key, delta: None) if args.stream else None
+
+    def analyze(text):
+        started = time.perf_counter()
+        result = analyze_document(text, args.query, args.types or None, use_cache=False,
+                                  stream_callback=stream_callback, deduplicate=args.deduplicate,
+                                  combined=args.combined)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return time.perf_counter() - started
+
+    with redirect_stdout(io.StringIO()):
+        analyze(texts[next(iter(texts))][0])
+
+    source_format = next((name for name in ("docx", "doc") if name in args.formats), args.formats[0])
+    results = {}
+    for pages in args.sizes:
+        documents = texts[(source_format, pages)]
+        server_request(base_url, "/reset", "POST")
+        tracemalloc.start()
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.analysis_workers) as executor:
+            latencies = list(executor.map(analyze, documents))
+        wall = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = server_request(base_url, "/stats")
+
+        scenario = f"analyze/{pages}p"
+        results[scenario] = summarize_latencies(latencies, wall, peak)
+        results[scenario].update({
+            "api_calls_per_document": round(stats["requests"] / len(documents), 2),
+            "rate_limited": stats["rate_limited"],
+            "prompt_tokens_per_document": round(stats["prompt_tokens"] / len(documents))
+        })
+        print(f"{scenario}: {results[scenario]['documents_per_second']} док/с", flush=True)
+    return results
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Порівнює показники з базовими; повертає рядки звіту та кількість регресій
+    (погіршення більше ніж на tolerance частку базового значення)
+    """
+    lines = []
+    regressions = 0
+    for scenario, metrics in results.items():
+        base_metrics = baseline.get(scenario)
+        lines.append(scenario)
+        for name, value in metrics.items():
+            if not isinstance(value, (int, float)) or name in ("documents", "characters", "rate_limited"):
+                continue
+            base_value = (base_metrics or {}).get(name)
+            if not base_value:
+                lines.append(f"  {name:<28} {value:>12}")
+                continue
+            change = (value - base_value) / base_value
+            worse = change > tolerance if name in LOWER_IS_BETTER else change < -tolerance
+            regressions += worse
+            marker = "  РЕГРЕСІЯ" if worse else ""
+            lines.append(f"  {name:<28} {value:>12} (база {base_value}, {change:+.1%}){marker}")
+    return lines, regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки конвеєра аналізу документів")
+    parser.add_argument("--formats", nargs="*", choices=list(WRITERS), default=list(WRITERS))
+    parser.add_argument("--sizes", nargs="*", type=int, default=[1, 10, 50], help="Розміри документів у сторінках")
+    parser.add_argument("--documents", type=int, default=3, help="Кількість документів кожного формату та розміру")
+    parser.add_argument("--query", default="Оцініть ключові умови договору")
+    parser.add_argument("--types", nargs="*", default=["risks", "financial"], help="Категорії аналізу")
+    parser.add_argument("--analysis-workers", type=int, default=1, help="Документи, що аналізуються одночасно")
+    parser.add_argument("--stream", action="store_true", help="Отримувати відповіді потоково")
+    parser.add_argument("--deduplicate", action="store_true",
+                        help="Повторне використання висновків щодо положень (сховище створюється заново)")
+    parser.add_argument("--combined", action="store_true", help="Аналіз усіх категорій одним запитом")
+    parser.add_argument("--skip-analysis", action="store_true", help="Лише витягування тексту")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Зберегти результати як базові")
+    parser.add_argument("--check", action="store_true", help="Код виходу 1 у разі регресій")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Допустиме погіршення (частка)")
+    parser.add_argument("--output", help="Файл JSON для збереження результатів")
+    add_server_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    corpus = generate_corpus(CORPUS_DIR, args.formats, args.sizes, args.documents, seed=args.seed)
+    process, base_url = (None, None) if args.skip_analysis else start_mock_server(args)
+
+    # Аналізатор читає налаштування з оточення під час імпорту; кеш результатів вимкнено,
+    # а ліміти запитів підняті, щоб вимірювався конвеєр, а не вбудований обмежувач
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    if base_url:
+        os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["RESULT_CACHE_PATH"] = ""
+    clause_store = os.path.join(CORPUS_DIR, "clause_findings.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(clause_store + suffix):
+            os.remove(clause_store + suffix)
+    os.environ["CLAUSE_STORE_PATH"] = clause_store
+    os.environ.setdefault("OPENAI_RPM_LIMIT", "1000000")
+    os.environ.setdefault("OPENAI_TPM_LIMIT", "100000000")
+
+    try:
+        results, texts = bench_extraction(corpus, args)
+        if not args.skip_analysis:
+            results.update(bench_analysis(texts, args, base_url))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "latency": args.latency,
+            "rate_limit_rate": args.rate_limit_rate,
+            "stream": args.stream,
+            "deduplicate": args.deduplicate,
+            "combined": args.combined
+        },
+        "scenarios": results
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            stored = json.load(baseline_file)
+        baseline = stored.get("scenarios", {})
+        differences = [
+            name for name in ("latency", "rate_limit_rate", "stream", "deduplicate", "combined", "cpus")
+            if stored.get("environment", {}).get(name) != report["environment"][name]
+        ]
+        if differences:
+            print(f"Увага: базові значення отримано з іншими параметрами ({', '.join(differences)})")
+
+    lines, regressions = compare_with_baseline(results, baseline, args.tolerance)
+    print("\n".join(lines))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        print(f"Базові значення збережено у {args.baseline}")
+
+    if regressions:
+        print(f"Виявлено регресій: {regressions}")
+    return 1 if args.check and regressions else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+"""
+Перевірка бюджету часу холодного запуску: імпорт модулів застосунку в новому процесі.
+
+Приклади:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --budget 0.2 --runs 9
+
+Код виходу 1, якщо медіанний час імпорту перевищує бюджет або якщо під час імпорту
+завантажено важкі залежності, які мають імпортуватися лише під час першого використання.
+Streamlit не враховується: він завантажується будь-яким застосунком Streamlit.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Модулі застосунку, що імпортуються під час запуску main.py
+APP_MODULES = ("document_processor", "analyzer", "facts", "revisions", "jobs", "utils", "metrics")
+# Допустимий медіанний час імпорту модулів застосунку (с)
+STARTUP_BUDGET_SECONDS = 0.3
+# Залежності, що мають завантажуватися лише під час першого використання
+DEFERRED_MODULES = ("openai", "anthropic", "docx", "PyPDF2", "pandas", "tiktoken")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+def measure(runs):
+    """Час імпорту модулів застосунку в runs нових процесах і список завантажених важких залежностей"""
+    probe = _PROBE.format(modules=APP_MODULES, deferred=DEFERRED_MODULES)
+    environment = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "startup-check"))
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", probe], cwd=ROOT_DIR, env=environment,
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return timings, sorted(loaded)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бюджет часу холодного запуску")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_SECONDS, help="Допустимий медіанний час імпорту (с)")
+    parser.add_argument("--runs", type=int, default=5, help="Кількість запусків")
+    args = parser.parse_args(argv)
+
+    timings, loaded = measure(args.runs)
+    median = statistics.median(timings)
+    print(f"Імпорт {', '.join(APP_MODULES)}: медіана {median:.3f} с, "
+          f"мін. {min(timings):.3f} с, макс. {max(timings):.3f} с (бюджет {args.budget} с)")
+
+    failed = False
+    if median > args.budget:
+        print("Перевищено бюджет часу запуску")
+        failed = True
+    if loaded:
+        print(f"Під час запуску завантажено важкі залежності: {', '.join(loaded)}")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,9 +1,80 @@
-import docx
-from PyPDF2 import PdfReader
 import io
+import multiprocessing
 import subprocess
 import tempfile
 import os
+import hashlib
+import locale
+import itertools
+import threading
+import re
+import bisect
+import zlib
+import zipfile
+from xml.etree import ElementTree
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from ole_reader import extract_doc_text
+from metrics import span
+
+# python-docx, PyPDF2 та tiktoken імпортуються під час першого використання,
+# щоб не сповільнювати запуск застосунку та нових робочих процесів
+
+# Кількість результатів витягування тексту, що зберігаються в пам'яті
+TEXT_CACHE_SIZE = int(os.environ.get("TEXT_CACHE_SIZE", "32"))
+# Каталог стисненого кешу тексту на диску (якщо не вказано, кеш на диску вимкнено)
+TEXT_CACHE_DIR = os.environ.get("TEXT_CACHE_DIR")
+# Максимальний сумарний розмір кешу на диску в байтах
+TEXT_CACHE_MAX_BYTES = int(os.environ.get("TEXT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Мінімальна кількість сторінок PDF, з якої текст витягується пулом процесів
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "32"))
+# Кількість сторінок PDF в одному завданні пулу процесів
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "16"))
+# Кількість процесів для витягування тексту з PDF
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Обмеження кількості сторінок PDF і сумарного розміру їх тексту в байтах UTF-8 (0 - без обмеження)
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", "0")) or None
+PDF_MAX_TEXT_BYTES = int(os.environ.get("PDF_MAX_TEXT_BYTES", "0")) or None
+
+# Кількість одночасних процесів catdoc та обмеження часу конвертації одного файлу (с)
+DOC_CONVERTER_WORKERS = int(os.environ.get("DOC_CONVERTER_WORKERS", "2"))
+DOC_CONVERTER_TIMEOUT = float(os.environ.get("DOC_CONVERTER_TIMEOUT", "60"))
+# Спершу витягувати текст .doc вбудованим читачем, без запуску catdoc
+DOC_PURE_PYTHON = os.environ.get("DOC_PURE_PYTHON", "1") != "0"
+
+# Кодування токенізатора моделі для підрахунку розміру фрагментів
+TOKEN_ENCODING = "cl100k_base"
+# Роздільник сторінок у витягнутому тексті
+PAGE_BREAK = '\f'
+
+# Заголовки структурних одиниць: розділи, статті, додатки та нумеровані пункти
+_MAJOR_HEADING = re.compile(
+    r'^[ \t]*(?:(?:розділ|стаття|глава|частина|додаток|article|section|chapter|annex|appendix)\b'
+    r'|[IVXLC]+\.[ \t]|\d+\.[ \t])',
+    re.IGNORECASE | re.MULTILINE
+)
+_MINOR_HEADING = re.compile(r'^[ \t]*(?:\d+\.\d+(?:\.\d+)*\.?|\d+\)|[а-яa-z]\))[ \t]', re.IGNORECASE | re.MULTILINE)
+_PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n|\f')
+_SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+')
+_WORD_END = re.compile(r'\s+')
+_CYRILLIC = re.compile(r'[\u0400-\u04ff]')
+
+# Кодувальник tiktoken: None - ще не завантажено, False - tiktoken не встановлено
+_token_encoder = None
+_doc_converter_slots = threading.BoundedSemaphore(DOC_CONVERTER_WORKERS)
+_text_cache = OrderedDict()
+_text_cache_lock = threading.Lock()
+
+def process_pool_context():
+    """
+    Контекст створення процесів для пулів витягування тексту. Пули створюються з робочих
+    потоків (фонових завдань, пакетного аналізу), а fork багатопотокового процесу може
+    скопіювати захоплені іншими потоками блокування і зависнути, тому процеси запускаються
+    через forkserver (або spawn, якщо forkserver недоступний)
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
 
 def split_text(text, max_chunk_size=4000):
     """
@@ -28,48 +99,449 @@ def split_text(text, max_chunk_size=4000):
 
     return chunks
 
-def extract_text_from_pdf(pdf_file):
+def count_tokens(text):
     """
-    Витягує текст з PDF файлу
+    Кількість токенів моделі в тексті. Якщо tiktoken не встановлено або не вдалося
+    завантажити файл кодування (під час першого використання tiktoken завантажує його
+    з мережі, якщо його немає в TIKTOKEN_CACHE_DIR), використовується наближена оцінка:
+    близько 2.5 символу на токен для кирилиці та 4 - для решти тексту.
     """
-    reader = PdfReader(pdf_file)
-    text = []
-    for page in reader.pages:
-        text.append(page.extract_text())
-    return '\n'.join(text)
+    global _token_encoder
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding(TOKEN_ENCODING)
+        except ImportError:
+            _token_encoder = False
+        except Exception as e:
+            print(f"Не вдалося завантажити кодування {TOKEN_ENCODING}, використовується оцінка: {str(e)}")
+            _token_encoder = False
+    if _token_encoder:
+        return len(_token_encoder.encode(text, disallowed_special=()))
 
-def extract_text_from_doc(doc_file):
+    cyrillic = len(_CYRILLIC.findall(text))
+    return int(cyrillic / 2.5 + (len(text) - cyrillic) / 4) + 1
+
+def _segment_boundaries(text):
+    """
+    Межі структурних сегментів тексту: заголовки статей і пунктів, порожні рядки,
+    розриви сторінок. Повертає впорядкований список (позиція, ознака основного заголовка).
+    """
+    boundaries = {0: False}
+    for match in _PARAGRAPH_BREAK.finditer(text):
+        boundaries.setdefault(match.end(), False)
+    for match in _MINOR_HEADING.finditer(text):
+        boundaries.setdefault(match.start(), False)
+    for match in _MAJOR_HEADING.finditer(text):
+        boundaries[match.start()] = True
+    boundaries.pop(len(text), None)
+    return sorted(boundaries.items())
+
+def _split_oversized(text, start, end, max_tokens):
+    """
+    Ділить задовгий сегмент на частини не більше max_tokens: спершу за реченнями,
+    потім за словами, в крайньому випадку - за кількістю символів
+    """
+    for pattern in (_SENTENCE_END, _WORD_END):
+        cuts = [match.end() for match in pattern.finditer(text, start, end) if match.end() < end] + [end]
+        if len(cuts) < 2:
+            continue
+
+        pieces = []
+        piece_start = start
+        piece_tokens = 0
+        previous_cut = start
+        for cut in cuts:
+            unit_tokens = count_tokens(text[previous_cut:cut])
+            if piece_tokens and piece_tokens + unit_tokens > max_tokens:
+                pieces.append((piece_start, previous_cut))
+                piece_start = previous_cut
+                piece_tokens = 0
+            piece_tokens += unit_tokens
+            previous_cut = cut
+        pieces.append((piece_start, end))
+
+        result = []
+        for piece_start, piece_end in pieces:
+            if count_tokens(text[piece_start:piece_end]) > max_tokens:
+                result.extend(_split_oversized(text, piece_start, piece_end, max_tokens))
+            else:
+                result.append((piece_start, piece_end))
+        return result
+
+    # Суцільний текст без пробілів: ділимо за оцінкою кількості символів на токен
+    length = end - start
+    step = max(1, int(length * max_tokens / max(count_tokens(text[start:end]), 1)))
+    return [(position, min(position + step, end)) for position in range(start, end, step)]
+
+def _iter_segments(text, max_tokens):
+    """
+    Генератор структурних сегментів (початок, кінець, токени, основний заголовок)
+    """
+    boundaries = _segment_boundaries(text)
+    for index, (start, major) in enumerate(boundaries):
+        end = boundaries[index + 1][0] if index + 1 < len(boundaries) else len(text)
+        tokens = count_tokens(text[start:end])
+        if tokens <= max_tokens:
+            yield start, end, tokens, major
+            continue
+        for piece_index, (piece_start, piece_end) in enumerate(_split_oversized(text, start, end, max_tokens)):
+            yield piece_start, piece_end, count_tokens(text[piece_start:piece_end]), major and piece_index == 0
+
+def _make_chunk(text, page_breaks, segments):
+    """Словник фрагмента з послідовних сегментів (початок, кінець, токени, ...)"""
+    start, end = segments[0][0], segments[-1][1]
+    chunk_text = text[start:end]
+    # Сторінка останнього значущого символу, без завершальних пробілів і розривів
+    content_end = start + max(len(chunk_text.rstrip()), 1)
+    return {
+        "text": chunk_text,
+        "start": start,
+        "end": end,
+        "page_start": bisect.bisect_left(page_breaks, start) + 1,
+        "page_end": bisect.bisect_left(page_breaks, content_end - 1) + 1,
+        "tokens": sum(segment[2] for segment in segments)
+    }
+
+def iter_clauses(text, max_tokens=400, min_tokens=30):
+    """
+    Генератор окремих положень документа (пунктів, статей, абзаців) у форматі iter_chunks.
+    Короткі сегменти (заголовки, нумерація) об'єднуються з наступними, доки положення
+    не міститиме щонайменше min_tokens токенів; задовгі діляться до max_tokens.
+    На відміну від iter_chunks, межі положень залежать лише від їх власного тексту,
+    тому однакові положення різних документів мають однаковий текст.
+    """
+    page_breaks = [match.start() for match in re.finditer(PAGE_BREAK, text)]
+    current = []
+    current_tokens = 0
+    for segment in _iter_segments(text, max_tokens):
+        if not text[segment[0]:segment[1]].strip():
+            continue
+        if current and current_tokens + segment[2] > max_tokens:
+            yield _make_chunk(text, page_breaks, current)
+            current, current_tokens = [], 0
+        current.append(segment)
+        current_tokens += segment[2]
+        if current_tokens >= min_tokens:
+            yield _make_chunk(text, page_breaks, current)
+            current, current_tokens = [], 0
+
+    if current:
+        yield _make_chunk(text, page_breaks, current)
+
+def iter_chunks(text, max_tokens=3000, overlap_tokens=0):
+    """
+    Генератор фрагментів тексту, що враховує структуру юридичного документа.
+    Фрагмент складається з цілих статей, пунктів та абзаців і містить не більше
+    max_tokens токенів моделі; нова стаття чи розділ починає новий фрагмент, якщо
+    поточний уже заповнений наполовину. Кінцеві сегменти попереднього фрагмента
+    обсягом до overlap_tokens повторюються на початку наступного.
+    Кожен фрагмент - словник з текстом (точним зрізом text), позиціями символів
+    start/end, номерами сторінок page_start/page_end та кількістю токенів.
+    """
+    page_breaks = [match.start() for match in re.finditer(PAGE_BREAK, text)]
+
+    def make_chunk(segments):
+        return _make_chunk(text, page_breaks, segments)
+
+    current = []
+    current_tokens = 0
+    for segment in _iter_segments(text, max_tokens):
+        tokens, major = segment[2], segment[3]
+        if current and (current_tokens + tokens > max_tokens or (major and current_tokens >= max_tokens / 2)):
+            yield make_chunk(current)
+
+            # Перекриття: кінцеві сегменти попереднього фрагмента
+            overlap = []
+            overlap_total = 0
+            for previous in reversed(current[1:]):
+                if overlap_total + previous[2] > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_total += previous[2]
+            while overlap and overlap_total + tokens > max_tokens:
+                overlap_total -= overlap.pop(0)[2]
+            current, current_tokens = overlap, overlap_total
+
+        current.append(segment)
+        current_tokens += tokens
+
+    if current:
+        yield make_chunk(current)
+
+# PdfReader робочого процесу пулу, створюється один раз на процес
+_pdf_worker_reader = None
+
+def _init_pdf_worker(pdf_bytes):
+    global _pdf_worker_reader
+    from PyPDF2 import PdfReader
+    _pdf_worker_reader = PdfReader(io.BytesIO(pdf_bytes))
+
+def _extract_pdf_page_range(start, end):
     """
-    Витягує текст з .doc файлу використовуючи catdoc
+    Витягує текст сторінок [start, end) у робочому процесі пулу
     """
-    # Створюємо тимчасовий файл для збереження вмісту
-    with tempfile.NamedTemporaryFile(suffix='.doc', delete=False) as temp_file:
-        temp_file.write(doc_file.read())
-        temp_path = temp_file.name
+    return [_pdf_worker_reader.pages[i].extract_text() or '' for i in range(start, end)]
 
+def _iter_pdf_pages_parallel(pdf_bytes, page_count, workers):
+    """
+    Розподіляє діапазони сторінок між процесами та повертає текст сторінок по порядку.
+    В обробці одночасно перебуває не більше 2 * workers діапазонів, тож готові сторінки
+    не накопичуються в пам'яті швидше, ніж їх забирає споживач. Кожен процес отримує
+    власну копію файлу і розбирає її повністю, тож пам'ять пулу зростає з кількістю процесів.
+    """
+    page_ranges = iter([
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ])
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=process_pool_context(),
+        initializer=_init_pdf_worker,
+        initargs=(pdf_bytes,)
+    )
+    pending = deque()
     try:
-        # Використовуємо catdoc для конвертації .doc в текст
-        result = subprocess.run(['catdoc', temp_path], 
-                              capture_output=True, 
-                              text=True)
+        for page_range in itertools.islice(page_ranges, workers * 2):
+            pending.append(executor.submit(_extract_pdf_page_range, *page_range))
 
-        if result.returncode == 0 and result.stdout.strip():
-            return result.stdout
-        else:
-            error_msg = result.stderr if result.stderr else "Не вдалося витягнути текст з файлу"
-            raise ValueError(error_msg)
+        while pending:
+            page_texts = pending.popleft().result()
+            next_range = next(page_ranges, None)
+            if next_range:
+                pending.append(executor.submit(_extract_pdf_page_range, *next_range))
+            yield from page_texts
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def iter_pdf_pages(pdf_file, max_pages=None, max_text_bytes=None, workers=None):
+    """
+    Генератор тексту сторінок PDF у порядку їх розташування.
+    Великі файли (від PDF_PARALLEL_MIN_PAGES сторінок) обробляються пулом процесів.
+    max_pages обмежує кількість сторінок, max_text_bytes - сумарний розмір витягнутого тексту
+    в байтах UTF-8. Це не обмеження пам'яті процесу: файл PDF розбирається повністю
+    (у пулі - кожним робочим процесом окремо), обмежується лише текст, що передається далі.
+    """
+    from PyPDF2 import PdfReader
+
+    pdf_bytes = pdf_file.read()
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
 
+    workers = workers or PDF_WORKERS
+    if workers > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+        pages = _iter_pdf_pages_parallel(pdf_bytes, page_count, workers)
+    else:
+        pages = (reader.pages[i].extract_text() or '' for i in range(page_count))
+
+    text_bytes = 0
+    try:
+        for page_text in pages:
+            text_bytes += len(page_text.encode('utf-8'))
+            if max_text_bytes is not None and text_bytes > max_text_bytes:
+                print(f"Досягнуто обмеження розміру тексту PDF ({max_text_bytes} байт)")
+                break
+            yield page_text
+    finally:
+        pages.close()
+
+def extract_text_from_pdf(pdf_file, max_pages=None, max_text_bytes=None):
+    """
+    Витягує текст з PDF файлу; сторінки розділяються символом PAGE_BREAK
+    """
+    text = io.StringIO()
+    with span("extract_pdf") as record:
+        record["pages"] = 0
+        for page_text in iter_pdf_pages(pdf_file, max_pages, max_text_bytes):
+            if record["pages"]:
+                text.write(f'{PAGE_BREAK}\n')
+            text.write(page_text)
+            record["pages"] += 1
+    return text.getvalue()
+
+def _feed_stdin(stream, data):
+    """
+    Передає байти документа процесу конвертації; помилка запису означає, що процес уже завершився
+    """
+    try:
+        stream.write(data)
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+def iter_doc_text(doc_bytes, timeout=None, chunk_size=65536):
+    """
+    Конвертує .doc у текст за допомогою catdoc без тимчасових файлів: байти передаються
+    через stdin, текст читається зі stdout частинами по chunk_size символів.
+    Одночасно працює не більше DOC_CONVERTER_WORKERS процесів, процес примусово
+    завершується, якщо конвертація триває довше timeout секунд.
+    """
+    timeout = timeout or DOC_CONVERTER_TIMEOUT
+    with _doc_converter_slots:
+        process = subprocess.Popen(
+            ['catdoc'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+
+        stderr_chunks = []
+        timer = threading.Timer(timeout, kill_on_timeout)
+        writer = threading.Thread(target=_feed_stdin, args=(process.stdin, doc_bytes), daemon=True)
+        stderr_reader = threading.Thread(
+            target=lambda: stderr_chunks.append(process.stderr.read()),
+            daemon=True
+        )
+        timer.start()
+        writer.start()
+        stderr_reader.start()
+
+        try:
+            stdout = io.TextIOWrapper(
+                process.stdout,
+                encoding=locale.getpreferredencoding(False),
+                errors='replace'
+            )
+            while True:
+                chunk = stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            writer.join()
+            stderr_reader.join()
+
+    if timed_out.is_set():
+        raise ValueError(f"Перевищено час конвертації ({timeout} с)")
+    if process.returncode != 0:
+        stderr = b''.join(stderr_chunks).decode(locale.getpreferredencoding(False), 'replace').strip()
+        raise ValueError(stderr or "Не вдалося витягнути текст з файлу")
+
+def extract_text_from_doc(doc_file):
+    """
+    Витягує текст з .doc файлу: спершу вбудованим читачем (якщо увімкнено DOC_PURE_PYTHON),
+    а для складніших файлів - за допомогою catdoc
+    """
+    doc_bytes = doc_file.read()
+
+    if DOC_PURE_PYTHON:
+        try:
+            with span("convert_doc", method="ole"):
+                text = extract_doc_text(doc_bytes)
+            if text.strip():
+                return text
+        except ValueError as e:
+            print(f"Вбудований читач .doc не впорався ({str(e)}), використовуємо catdoc")
+
+    try:
+        with span("convert_doc", method="catdoc"):
+            text = ''.join(iter_doc_text(doc_bytes))
     except Exception as e:
         raise ValueError(f"Помилка при обробці .doc файлу: {str(e)}")
-    finally:
-        # Видаляємо тимчасовий файл
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
 
-def extract_text_from_docx(docx_file):
+    if not text.strip():
+        raise ValueError("Помилка при обробці .doc файлу: Не вдалося витягнути текст з файлу")
+    return text
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+def iter_docx_blocks(docx_file):
     """
-    Витягує текст з .docx файлу
+    Потоково розбирає word/document.xml і повертає текст абзаців та клітинок таблиць
+    у порядку їх розташування в документі. Клітинки-продовження вертикально об'єднаних
+    клітинок пропускаються, оброблені елементи XML одразу звільняються.
     """
+    with zipfile.ZipFile(docx_file) as archive, archive.open('word/document.xml') as xml_file:
+        paragraphs = []  # стек частин тексту відкритих абзаців
+        cells = []  # стек відкритих клітинок: [тексти абзаців, ознака об'єднаної клітинки]
+        depth = 0
+        run_depth = 0
+        fallback_depth = 0
+        body = None
+
+        for event, elem in ElementTree.iterparse(xml_file, events=('start', 'end')):
+            tag = elem.tag
+
+            if event == 'start':
+                depth += 1
+                if tag == _MC_FALLBACK:
+                    # Альтернативне представлення дублює вміст mc:Choice
+                    fallback_depth += 1
+                elif fallback_depth:
+                    continue
+                elif tag == _W + 'p':
+                    paragraphs.append([])
+                elif tag == _W + 'r':
+                    run_depth += 1
+                elif tag == _W + 'tc':
+                    cells.append([[], False])
+                elif tag == _W + 'body':
+                    body = elem
+                continue
+
+            depth -= 1
+            if tag == _MC_FALLBACK:
+                fallback_depth -= 1
+            elif fallback_depth:
+                pass
+            elif tag == _W + 'r':
+                run_depth -= 1
+            elif run_depth and paragraphs and tag in (_W + 't', _W + 'tab', _W + 'br', _W + 'cr'):
+                if tag == _W + 't':
+                    paragraphs[-1].append(elem.text or '')
+                else:
+                    paragraphs[-1].append('\t' if tag == _W + 'tab' else '\n')
+            elif tag == _W + 'vMerge' and cells:
+                if elem.get(_W + 'val', 'continue') != 'restart':
+                    cells[-1][1] = True
+            elif tag == _W + 'p':
+                text = ''.join(paragraphs.pop())
+                elem.clear()
+                if paragraphs:
+                    # Абзац усередині текстового поля належить зовнішньому абзацу
+                    paragraphs[-1].append('\n' + text)
+                elif cells:
+                    cells[-1][0].append(text)
+                else:
+                    yield text
+            elif tag == _W + 'tc':
+                cell_paragraphs, merged = cells.pop()
+                elem.clear()
+                if not merged:
+                    text = '\n'.join(cell_paragraphs)
+                    if cells:
+                        # Вкладена таблиця: текст належить зовнішній клітинці
+                        cells[-1][0].append(text)
+                    else:
+                        yield text
+
+            if depth == 2 and body is not None:
+                # Завершено елемент верхнього рівня в w:body
+                body.clear()
+
+def _extract_text_from_docx_object_model(docx_file):
+    """
+    Витягує текст з .docx файлу через об'єктну модель python-docx
+    """
+    import docx
+
     doc = docx.Document(docx_file)
     full_text = []
 
@@ -84,21 +556,155 @@ def extract_text_from_docx(docx_file):
 
     return '\n'.join(full_text)
 
-def extract_text(file):
+def extract_text_from_docx(docx_file):
     """
-    Витягує текст з файлу в залежності від його формату
+    Витягує текст з .docx файлу потоковим розбором word/document.xml;
+    якщо розібрати XML не вдалося, використовує python-docx
+    """
+    try:
+        with span("extract_docx"):
+            return '\n'.join(iter_docx_blocks(docx_file))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        print(f"Потоковий розбір DOCX не вдався ({str(e)}), використовуємо python-docx")
+        docx_file.seek(0)
+        return _extract_text_from_docx_object_model(docx_file)
+
+def _text_cache_key(file_content, extension, max_pages=None, max_text_bytes=None):
+    """
+    Ключ кешу: SHA-256 вмісту файлу разом з його форматом і обмеженнями розміру тексту
+    """
+    limits = f"-p{max_pages}-b{max_text_bytes}" if max_pages or max_text_bytes else ""
+    return f"{hashlib.sha256(file_content).hexdigest()}{limits}{extension}"
+
+def _disk_cache_path(key):
+    return os.path.join(TEXT_CACHE_DIR, f"{key}.txt.z")
+
+def _read_disk_cache(key):
+    """
+    Читає текст з кешу на диску; оновлює час доступу для LRU-витіснення
+    """
+    path = _disk_cache_path(key)
+    try:
+        with open(path, 'rb') as cache_file:
+            text = zlib.decompress(cache_file.read()).decode('utf-8')
+        os.utime(path)
+        return text
+    except (OSError, zlib.error, UnicodeDecodeError):
+        return None
+
+def _evict_disk_cache():
+    """
+    Видаляє найдавніше використані файли, доки розмір кешу перевищує TEXT_CACHE_MAX_BYTES
+    """
+    entries = []
+    for entry in os.scandir(TEXT_CACHE_DIR):
+        if entry.is_file() and entry.name.endswith('.txt.z'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= TEXT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+            total_size -= size
+        except OSError:
+            pass
+
+def _write_disk_cache(key, text):
+    """
+    Зберігає стиснений текст у кеші на диску (атомарно, через тимчасовий файл)
+    """
+    try:
+        os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=TEXT_CACHE_DIR, suffix='.tmp', delete=False) as temp_file:
+            temp_file.write(zlib.compress(text.encode('utf-8'), 6))
+        os.replace(temp_file.name, _disk_cache_path(key))
+        _evict_disk_cache()
+    except OSError as e:
+        print(f"Не вдалося записати кеш тексту на диск: {str(e)}")
+
+def _remember_text(key, text):
+    with _text_cache_lock:
+        _text_cache[key] = text
+        _text_cache.move_to_end(key)
+        while len(_text_cache) > TEXT_CACHE_SIZE:
+            _text_cache.popitem(last=False)
+
+def get_cached_text(key):
+    """
+    Повертає текст з кешу (спочатку з пам'яті, потім з диску) або None
+    """
+    with _text_cache_lock:
+        if key in _text_cache:
+            _text_cache.move_to_end(key)
+            return _text_cache[key]
+
+    if not TEXT_CACHE_DIR:
+        return None
+
+    text = _read_disk_cache(key)
+    if text is not None:
+        _remember_text(key, text)
+    return text
+
+def cache_text(key, text):
+    """
+    Зберігає витягнутий текст у кеші в пам'яті та, якщо увімкнено, на диску
+    """
+    _remember_text(key, text)
+    if TEXT_CACHE_DIR:
+        _write_disk_cache(key, text)
+
+def clear_text_cache():
+    """
+    Очищає кеш витягнутого тексту в пам'яті
+    """
+    with _text_cache_lock:
+        _text_cache.clear()
+
+def extract_text(file, use_cache=True, max_pages=PDF_MAX_PAGES, max_text_bytes=PDF_MAX_TEXT_BYTES):
+    """
+    Витягує текст з файлу в залежності від його формату.
+    Результат кешується за хешем вмісту файлу, тому повторна обробка того самого
+    файлу (зокрема під час перезапусків скрипта Streamlit) не потребує розбору.
+    max_pages і max_text_bytes обмежують кількість сторінок і розмір тексту PDF
+    (за замовчуванням - PDF_MAX_PAGES і PDF_MAX_TEXT_BYTES).
     """
     file_content = file.read()
     file.seek(0)  # Reset file pointer
 
     # Визначаємо формат файлу за розширенням
     filename = file.name.lower()
+    extension = os.path.splitext(filename)[1]
 
-    if filename.endswith('.pdf'):
-        return extract_text_from_pdf(file)
-    elif filename.endswith('.docx'):
+    if extension not in ('.pdf', '.docx', '.doc'):
+        raise ValueError("Непідтримуваний формат файлу. Підтримуються формати: .pdf, .docx, .doc")
+
+    with span("extract_text", format=extension, bytes=len(file_content)) as record:
+        limits = (max_pages, max_text_bytes) if extension == '.pdf' else (None, None)
+        if not use_cache:
+            text = _extract_text_by_format(file, file_content, extension, *limits)
+        else:
+            key = _text_cache_key(file_content, extension, *limits)
+            text = get_cached_text(key)
+            record["cache_hit"] = int(text is not None)
+            if text is None:
+                text = _extract_text_by_format(file, file_content, extension, *limits)
+                cache_text(key, text)
+        record["characters"] = len(text)
+    return text
+
+def _extract_text_by_format(file, file_content, extension, max_pages=None, max_text_bytes=None):
+    """
+    Витягує текст відповідним для формату способом
+    """
+    if extension == '.pdf':
+        return extract_text_from_pdf(file, max_pages, max_text_bytes)
+    elif extension == '.docx':
         return extract_text_from_docx(io.BytesIO(file_content))
-    elif filename.endswith('.doc'):
+    elif extension == '.doc':
         return extract_text_from_doc(io.BytesIO(file_content))
     else:
         raise ValueError("Непідтримуваний формат файлу. Підтримуються формати: .pdf, .docx, .doc")
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+Детерміноване витягування фактів з тексту договору без звернень до API: суми в гривнях,
+доларах і євро, відсотки, штрафні санкції, дати, строки в днях (місяцях, роках) та сторони.
+Усі шаблони об'єднано в один скомпільований регулярний вираз, який проходить увесь текст
+за один раз; кожен факт містить позиції символів у тексті та номер сторінки.
+"""
+import bisect
+import re
+
+from document_processor import PAGE_BREAK, count_tokens
+
+FACT_LABELS = {
+    "party": "Сторона",
+    "role": "Роль сторони",
+    "amount": "Сума",
+    "percent": "Відсоток",
+    "penalty": "Штрафна санкція",
+    "date": "Дата",
+    "term": "Строк"
+}
+
+# Типи фактів, що передаються моделі замість тексту документа для відповідних типів аналізу
+ANALYSIS_FACT_TYPES = {
+    "financial": ("party", "role", "amount", "percent", "penalty", "date"),
+    "obligations": ("party", "role", "term", "date", "penalty")
+}
+
+# Числа з розділювачами розрядів: пробілами (1 500,50), комами (1,500.50) або крапками (1.500.000,00)
+_NUMBER = (
+    r"\d{1,3}(?:[ \u00a0\u202f]\d{3})+(?:[.,]\d+)?"
+    r"|\d{1,3}(?:,\d{3})+(?:\.\d+)?"
+    r"|\d{1,3}(?:\.\d{3})+,\d+|\d{1,3}(?:\.\d{3}){2,}"
+    r"|\d+(?:[.,]\d+)?"
+)
+# Числа прописом у дужках після цифр: "10 (десять) днів", "1 000 (одна тисяча) гривень"
+_SPELLED = r"(?:\s?\([^()\n]{1,80}\))?"
+_MONTHS = (
+    "січня", "лютого", "березня", "квітня", "травня", "червня",
+    "липня", "серпня", "вересня", "жовтня", "листопада", "грудня"
+)
+_CURRENCIES = (
+    ("UAH", r"грн\.?|гривень|гривні|гривня|гривнях|UAH|₴"),
+    ("USD", r"доларів\s+США|долари\s+США|долар\s+США|доларів|USD|\$"),
+    ("EUR", r"євро|EUR|€")
+)
+
+_FACT_PATTERN = re.compile(
+    # Швидка перевірка першого символу: факт починається з цифри, символу валюти,
+    # організаційно-правової форми або слова "надалі"/"далі"
+    r"(?=[\d$€₴ТПФАКДLНнДд])(?:"
+    # Дати
+    r"(?P<date_numeric>\b(?P<day>0?[1-9]|[12]\d|3[01])[./](?P<month>0?[1-9]|1[0-2])[./](?P<year>(?:19|20)\d{2})\b)"
+    r"|(?P<date_iso>\b(?P<iso_year>(?:19|20)\d{2})-(?P<iso_month>0[1-9]|1[0-2])-(?P<iso_day>0[1-9]|[12]\d|3[01])\b)"
+    rf"|(?P<date_text>\b(?P<text_day>[0-3]?\d)\s+(?P<text_month>(?i:{'|'.join(_MONTHS)}))\s+(?P<text_year>(?:19|20)\d{{2}})(?:\s*(?:року|р\.))?)"
+    # Суми: символ валюти перед числом або назва валюти після числа
+    rf"|(?P<amount_prefixed>(?P<prefix_currency>[$€₴])\s?(?P<prefix_value>{_NUMBER}))"
+    rf"|(?P<amount>(?P<amount_value>{_NUMBER}){_SPELLED}\s?(?P<multiplier>(?i:тис\.|тисяч[аі]?|млн\.?|мільйон(?:а|ів)?))?\s?"
+    rf"(?P<currency>{'|'.join(f'(?P<currency_{code}>(?i:{pattern}))' for code, pattern in _CURRENCIES)}))"
+    # Відсотки
+    rf"|(?P<percent>(?P<percent_value>{_NUMBER}){_SPELLED}\s?(?:%|(?i:відсот(?:ок|ки|ків|ка)\b|відс\.)))"
+    # Строки
+    rf"|(?P<term>(?<!\d)(?P<term_value>(?!(?:19|20)\d{{2}}\s?(?i:року|рік|р\.))\d+){_SPELLED}\s?(?P<term_kind>(?i:календарн\w*|робоч\w*|банківськ\w*))?\s?"
+    r"(?P<term_unit>(?i:дн(?:ів|і|я)\b|день\b|тижн(?:ів|і|я)\b|тиждень\b|місяц(?:ів|і|я)\b|місяць\b|рок(?:ів|и|у)\b|рік\b)))"
+    # Сторони: організаційно-правова форма та назва в лапках або ФОП з прізвищем та ініціалами
+    r"|(?P<party>(?P<party_form>ТОВ|ТзОВ|ПрАТ|ПАТ|АТ|ПП|КП|ДП|LLC|Ltd)\s*[«\"“](?P<party_name>[^»\"”\n]{2,80})[»\"”])"
+    r"|(?P<sole_trader>ФОП\s+(?P<trader_name>[А-ЯІЇЄҐ][а-яіїєґ'’]+(?:\s+[А-ЯІЇЄҐ]\.\s?[А-ЯІЇЄҐ]\.)?))"
+    # Ролі сторін: (надалі - «Постачальник»)
+    r"|(?P<role>(?i:надалі|далі)\s*(?:[-–—]\s*)?(?:іменується\s+)?[«\"“]?(?P<role_name>[А-ЯІЇЄҐ][а-яіїєґ'’]+)[»\"”]?)"
+    r")"
+)
+_PENALTY_CONTEXT = re.compile(r"пен[яіюей]|штраф|неустойк|penalt", re.IGNORECASE)
+_MULTIPLIERS = {"тис": 1_000, "млн": 1_000_000, "мільйон": 1_000_000}
+_SENTENCE_END = re.compile(r"\n|\f|[.;](?=\s)")
+
+# Один розділювач перед групою з трьох цифр (1,000; 10.000): розряди чи дробова частина
+_SINGLE_GROUP = re.compile(r"[1-9]\d{0,2}[.,]\d{3}")
+
+def _number(value, grouped=True):
+    """
+    Число з тексту; кома і крапка розбираються за тими самими правилами: якщо є обидві,
+    десятковим розділювачем вважається остання; кілька однакових розділювачів розділяють
+    розряди (1.000.000; 2,000,000); інакше розділювач - десятковий (2,5; 12.50; 0,125).
+    Один розділювач перед групою з трьох цифр неоднозначний: у сумах (grouped) це розряди
+    (10.000 грн, $2,000), у відсотках - дробова частина (1,000%).
+    """
+    value = re.sub(r"[ \u00a0\u202f]", "", value)
+    if "," in value and "." in value:
+        thousands = "," if value.rfind(",") < value.rfind(".") else "."
+        value = value.replace(thousands, "")
+    elif value.count(",") > 1 or value.count(".") > 1 or (grouped and _SINGLE_GROUP.fullmatch(value)):
+        value = value.replace(".", "").replace(",", "")
+    return float(value.replace(",", "."))
+
+def _format_number(value, decimals=2):
+    """Число з пробілами між розрядами; цілі числа - без дробової частини"""
+    if value == int(value):
+        return f"{int(value):,}".replace(",", " ")
+    formatted = f"{value:,.{decimals}f}".replace(",", " ")
+    return formatted.rstrip("0") if decimals > 2 else formatted
+
+def _describe(match):
+    """Тип і нормалізоване значення факту за групами збігу"""
+    if match.group("date_numeric"):
+        return "date", f"{match.group('year')}-{int(match.group('month')):02d}-{int(match.group('day')):02d}"
+    if match.group("date_iso"):
+        return "date", f"{match.group('iso_year')}-{match.group('iso_month')}-{match.group('iso_day')}"
+    if match.group("date_text"):
+        month = _MONTHS.index(match.group("text_month").lower()) + 1
+        return "date", f"{match.group('text_year')}-{month:02d}-{int(match.group('text_day')):02d}"
+    if match.group("amount_prefixed"):
+        currency = {"$": "USD", "€": "EUR", "₴": "UAH"}[match.group("prefix_currency")]
+        return "amount", f"{_format_number(_number(match.group('prefix_value')))} {currency}"
+    if match.group("amount"):
+        value = _number(match.group("amount_value"))
+        multiplier = (match.group("multiplier") or "").lower()
+        for prefix, factor in _MULTIPLIERS.items():
+            if multiplier.startswith(prefix):
+                value *= factor
+        currency = next(code for code, _ in _CURRENCIES if match.group(f"currency_{code}"))
+        return "amount", f"{_format_number(value)} {currency}"
+    if match.group("percent"):
+        return "percent", f"{_format_number(_number(match.group('percent_value'), grouped=False), 4)}%"
+    if match.group("term"):
+        kind = match.group("term_kind")
+        unit = match.group("term_unit").lower()
+        return "term", " ".join(part for part in (match.group("term_value"), kind and kind.lower(), unit) if part)
+    if match.group("party"):
+        return "party", f"{match.group('party_form')} «{match.group('party_name').strip()}»"
+    if match.group("sole_trader"):
+        return "party", f"ФОП {match.group('trader_name')}"
+    return "role", match.group("role_name").capitalize()
+
+def extract_facts(text):
+    """
+    Витягує факти з тексту одним проходом об'єднаного регулярного виразу.
+    Повертає список словників {"type", "value", "text", "start", "end", "page", "context"}
+    у порядку розташування в тексті; суми та відсотки в реченнях про пеню, штраф
+    чи неустойку позначаються як штрафні санкції.
+    """
+    page_breaks = [match.start() for match in re.finditer(PAGE_BREAK, text)]
+    # Кінці речень (рядків, пунктів) знаходяться одним проходом для всього тексту
+    sentence_ends = [match.end() for match in _SENTENCE_END.finditer(text)]
+    facts = []
+    for match in _FACT_PATTERN.finditer(text):
+        fact_type, value = _describe(match)
+        start, end = match.span()
+        # Крапки всередині факту (дати, десяткові числа) не завершують речення
+        left = bisect.bisect_right(sentence_ends, start) - 1
+        right = bisect.bisect_left(sentence_ends, end)
+        sentence_start = sentence_ends[left] if left >= 0 else 0
+        sentence_end = sentence_ends[right] if right < len(sentence_ends) else len(text)
+        if fact_type in ("amount", "percent") and _PENALTY_CONTEXT.search(text, sentence_start, start):
+            fact_type = "penalty"
+        facts.append({
+            "type": fact_type,
+            "value": value,
+            "text": match.group(),
+            "start": start,
+            "end": end,
+            "page": bisect.bisect_left(page_breaks, start) + 1,
+            "context_start": sentence_start,
+            "context": " ".join(text[sentence_start:sentence_end].split())
+        })
+    return facts
+
+def facts_for_analysis(facts, analysis_type):
+    """Факти, суттєві для типу аналізу (порожній список, якщо тип аналізу не використовує факти)"""
+    types = ANALYSIS_FACT_TYPES.get(analysis_type, ())
+    return [fact for fact in facts if fact["type"] in types]
+
+def summarize_facts(facts, max_tokens=None):
+    """
+    Стисле текстове зведення фактів для промпту: сторони, а потім речення з фактами
+    (з номерами сторінок для багатосторінкових документів) та їх нормалізовані значення
+    """
+    paged = any(fact["page"] > 1 for fact in facts)
+    parties = list(dict.fromkeys(fact["value"] for fact in facts if fact["type"] in ("party", "role")))
+    lines = ["Факти, автоматично витягнуті з документа (з реченнями, в яких вони містяться):"]
+    if parties:
+        lines.append(f"Сторони та їх ролі: {'; '.join(parties)}")
+
+    sentences = {}
+    for fact in facts:
+        if fact["type"] in ("party", "role"):
+            continue
+        sentence = sentences.setdefault(fact["context_start"], {"fact": fact, "values": []})
+        sentence["values"].append(f"{FACT_LABELS[fact['type']].lower()}: {fact['value']}")
+
+    used_tokens = count_tokens("\n".join(lines))
+    for sentence in sentences.values():
+        fact = sentence["fact"]
+        location = f"[стор. {fact['page']}] " if paged else ""
+        line = f"- {location}{fact['context']}\n  ({'; '.join(dict.fromkeys(sentence['values']))})"
+        line_tokens = count_tokens(line)
+        if max_tokens is not None and used_tokens + line_tokens > max_tokens:
+            lines.append("[Решту фактів пропущено через обмеження розміру...]")
+            break
+        lines.append(line)
+        used_tokens += line_tokens
+    return "\n".join(lines)
+
+def fact_rows(facts):
+    """Рядки таблиці фактів для інтерфейсу та звітів"""
+    return [
+        {
+            "Тип": FACT_LABELS[fact["type"]],
+            "Значення": fact["value"],
+            "Стор.": fact["page"],
+            "Позиція": f"{fact['start']}-{fact['end']}",
+            "Контекст": fact["context"] if len(fact["context"]) <= 200 else fact["context"][:197] + "..."
+        }
+        for fact in facts
+    ]
@@ -0,0 +1,233 @@
+"""
+Відбитки положень договорів (шинглінг слів, MinHash і LSH) для повторного використання
+висновків: положення, яке вже аналізувалося в іншому документі з тим самим запитом і типом
+аналізу, не надсилається моделі. За замовчуванням повторно використовуються лише висновки
+щодо дослівно таких самих положень (без урахування регістру, пунктуації та пробілів);
+майже такі самі положення враховуються, лише якщо знижено CLAUSE_SIMILARITY_THRESHOLD,
+і лише коли в них збігаються всі числа, заперечення, модальні дієслова та ролі сторін.
+"""
+import array
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Файл SQLite зі збереженими висновками щодо положень (порожнє значення вимикає сховище)
+CLAUSE_STORE_PATH = os.environ.get("CLAUSE_STORE_PATH", os.path.join(".cache", "clause_findings.sqlite3"))
+# Мінімальна оцінка подібності Жаккара, за якої висновок щодо положення використовується повторно;
+# 1.0 - лише дослівно такі самі положення (одне слово "не" змінює зміст положення на протилежний)
+CLAUSE_SIMILARITY_THRESHOLD = float(os.environ.get("CLAUSE_SIMILARITY_THRESHOLD", "1.0"))
+# Час життя записів у секундах (за замовчуванням 90 днів) і максимальна кількість положень
+CLAUSE_STORE_TTL = int(os.environ.get("CLAUSE_STORE_TTL", str(90 * 24 * 3600)))
+CLAUSE_STORE_MAX_ENTRIES = int(os.environ.get("CLAUSE_STORE_MAX_ENTRIES", "200000"))
+
+# Кількість слів у шинглі, кількість хеш-функцій MinHash і смуг LSH (по 4 значення в смузі)
+SHINGLE_SIZE = 3
+NUM_HASHES = 32
+LSH_BANDS = 8
+
+_WORD = re.compile(r"\w+")
+# Апострофи в українських словах пишуть різними символами або пропускають
+_APOSTROPHES = str.maketrans("", "", "'’ʼ`")
+# Слова, що визначають зміст положення: числа, заперечення, модальні дієслова та ролі сторін.
+# Майже такі самі положення вважаються рівнозначними, лише якщо ці слова в них збігаються.
+_KEY_TERM = re.compile(
+    r"\d+"
+    r"|не|ні|ані|без|крім|окрім|ніхто|нічого|ніщо|ніколи|жодн\w*|заборон\w*"
+    r"|може|можуть|вправі|прав\w*|зобовяз\w*|повин\w*|має|мають|мусить|необхідно|слід|дозвол\w*|виключн\w*"
+    r"|сторон\w*|постачальник\w*|покупц\w*|покупець|продав\w*|замовник\w*|виконав\w*|підрядник\w*"
+    r"|субпідрядник\w*|орендар\w*|орендодав\w*|позичальник\w*|позикодав\w*|кредитор\w*|боржник\w*"
+    r"|ліцензіар\w*|ліцензіат\w*|працівник\w*|роботодав\w*|агент\w*|принципал\w*|страхувальник\w*"
+    r"|страховик\w*|перевізник\w*|вантаж\w*|клієнт\w*|банк\w*|інвестор\w*|засновник\w*|учасник\w*"
+)
+# Кожен виклик blake2b з digest_size=64 дає 16 незалежних 32-бітних хешів
+_HASH_SALTS = [bytes([index]) * 8 for index in range(NUM_HASHES // 16)]
+
+def _shingles(words):
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def clause_signature(text):
+    """
+    Відбиток положення: MinHash-підпис шинглів слів, хеш нормалізованого тексту та хеш
+    ключових слів положення (чисел, заперечень, модальних дієслів і ролей сторін у порядку
+    їх появи), які мають збігатися для повторного використання висновку
+    """
+    words = _WORD.findall(text.lower().translate(_APOSTROPHES))
+    normalized = " ".join(words)
+
+    digests = bytearray()
+    for shingle in _shingles(words):
+        encoded = shingle.encode('utf-8')
+        for salt in _HASH_SALTS:
+            digests += hashlib.blake2b(encoded, digest_size=64, salt=salt).digest()
+    values = array.array('I')
+    values.frombytes(bytes(digests))
+    # Мінімум кожної хеш-функції по всіх шинглах (значення i-ї функції - кожне NUM_HASHES-те)
+    minhash = tuple(min(values[index::NUM_HASHES]) for index in range(NUM_HASHES))
+
+    return {
+        "minhash": minhash,
+        "text_hash": hashlib.sha256(normalized.encode('utf-8')).hexdigest(),
+        "key_terms": hashlib.sha256(
+            " ".join(word for word in words if _KEY_TERM.fullmatch(word)).encode('utf-8')
+        ).hexdigest()
+    }
+
+def estimated_similarity(first, second):
+    """Оцінка подібності Жаккара двох положень за їх MinHash-підписами"""
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+def _band_keys(minhash):
+    rows = NUM_HASHES // LSH_BANDS
+    return [
+        f"{band}:" + hashlib.blake2b(
+            array.array('I', minhash[band * rows:(band + 1) * rows]).tobytes(), digest_size=8
+        ).hexdigest()
+        for band in range(LSH_BANDS)
+    ]
+
+_store_lock = threading.Lock()
+_store_ready = False
+
+@contextmanager
+def _store_connection():
+    """Відкриває з'єднання зі сховищем висновків (в межах однієї транзакції) і створює таблиці за потреби"""
+    global _store_ready
+    store_dir = os.path.dirname(CLAUSE_STORE_PATH)
+    if store_dir:
+        os.makedirs(store_dir, exist_ok=True)
+    connection = sqlite3.connect(CLAUSE_STORE_PATH, timeout=30)
+    connection.execute("PRAGMA foreign_keys=ON")
+    if not _store_ready:
+        with _store_lock:
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Записи сховища без хешу ключових слів не можна безпечно зіставити з новими
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(clauses)")]
+            if columns and "key_terms" not in columns:
+                connection.execute("DROP TABLE IF EXISTS clause_bands")
+                connection.execute("DROP TABLE clauses")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS clauses (
+                    clause_id INTEGER PRIMARY KEY,
+                    analysis_key TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    key_terms TEXT NOT NULL,
+                    minhash BLOB NOT NULL,
+                    finding TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    UNIQUE (analysis_key, text_hash)
+                )"""
+            )
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS clause_bands (
+                    band_key TEXT NOT NULL,
+                    clause_id INTEGER NOT NULL REFERENCES clauses (clause_id) ON DELETE CASCADE
+                )"""
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS clause_bands_key ON clause_bands (band_key)")
+            connection.execute("CREATE INDEX IF NOT EXISTS clause_bands_clause ON clause_bands (clause_id)")
+            connection.commit()
+            _store_ready = True
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def _find_one(connection, analysis_key, signature, threshold, cutoff):
+    row = connection.execute(
+        "SELECT clause_id, finding FROM clauses WHERE analysis_key = ? AND text_hash = ? AND created_at >= ?",
+        (analysis_key, signature["text_hash"], cutoff)
+    ).fetchone()
+    if row is not None or threshold >= 1:
+        return row
+
+    band_keys = _band_keys(signature["minhash"])
+    candidates = connection.execute(
+        f"""SELECT DISTINCT clauses.clause_id, clauses.finding, clauses.minhash
+            FROM clause_bands JOIN clauses ON clauses.clause_id = clause_bands.clause_id
+            WHERE clause_bands.band_key IN ({', '.join('?' * len(band_keys))})
+              AND clauses.analysis_key = ? AND clauses.key_terms = ? AND clauses.created_at >= ?""",
+        (*band_keys, analysis_key, signature["key_terms"], cutoff)
+    ).fetchall()
+
+    best = None
+    best_similarity = threshold
+    for clause_id, finding, minhash in candidates:
+        similarity = estimated_similarity(signature["minhash"], array.array('I', minhash))
+        if similarity >= best_similarity:
+            best, best_similarity = (clause_id, finding), similarity
+    return best
+
+def find_findings(analysis_key, signatures, threshold=None):
+    """
+    Для кожного відбитка повертає збережений висновок щодо такого самого положення (або,
+    якщо threshold менший за 1, майже такого самого з тими самими ключовими словами)
+    чи None, якщо положення ще не аналізувалося
+    """
+    if not CLAUSE_STORE_PATH or not signatures:
+        return [None] * len(signatures)
+    threshold = CLAUSE_SIMILARITY_THRESHOLD if threshold is None else threshold
+    try:
+        now = time.time()
+        with _store_connection() as connection:
+            matches = [
+                _find_one(connection, analysis_key, signature, threshold, now - CLAUSE_STORE_TTL)
+                for signature in signatures
+            ]
+            found_ids = [(now, match[0]) for match in matches if match is not None]
+            connection.executemany("UPDATE clauses SET accessed_at = ? WHERE clause_id = ?", found_ids)
+        return [match[1] if match is not None else None for match in matches]
+    except sqlite3.Error as e:
+        print(f"Помилка читання сховища висновків щодо положень: {str(e)}")
+        return [None] * len(signatures)
+
+def store_findings(analysis_key, signatures, findings):
+    """
+    Зберігає висновки щодо положень (порожній висновок означає, що положення не суттєве
+    для цього аналізу) та витісняє застарілі й найдавніше використані записи
+    """
+    if not CLAUSE_STORE_PATH or not signatures:
+        return
+    try:
+        now = time.time()
+        with _store_connection() as connection:
+            for signature, finding in zip(signatures, findings):
+                connection.execute(
+                    "DELETE FROM clauses WHERE analysis_key = ? AND text_hash = ?",
+                    (analysis_key, signature["text_hash"])
+                )
+                clause_id = connection.execute(
+                    """INSERT INTO clauses (analysis_key, text_hash, key_terms, minhash, finding, created_at, accessed_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (analysis_key, signature["text_hash"], signature["key_terms"],
+                     array.array('I', signature["minhash"]).tobytes(), finding, now, now)
+                ).lastrowid
+                connection.executemany(
+                    "INSERT INTO clause_bands VALUES (?, ?)",
+                    [(band_key, clause_id) for band_key in _band_keys(signature["minhash"])]
+                )
+            connection.execute("DELETE FROM clauses WHERE created_at < ?", (now - CLAUSE_STORE_TTL,))
+            connection.execute(
+                """DELETE FROM clauses WHERE clause_id IN (
+                    SELECT clause_id FROM clauses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (CLAUSE_STORE_MAX_ENTRIES,)
+            )
+    except sqlite3.Error as e:
+        print(f"Помилка запису сховища висновків щодо положень: {str(e)}")
+
+def clear_clause_store(analysis_key=None):
+    """Видаляє збережені висновки (для вказаного ключа аналізу або всі). Повертає кількість записів."""
+    if not CLAUSE_STORE_PATH:
+        return 0
+    with _store_connection() as connection:
+        if analysis_key is None:
+            return connection.execute("DELETE FROM clauses").rowcount
+        return connection.execute("DELETE FROM clauses WHERE analysis_key = ?", (analysis_key,)).rowcount
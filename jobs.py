@@ -0,0 +1,353 @@
+"""
+Фонові завдання аналізу: заявки зберігаються в черзі SQLite, а обмежений пул робочих
+потоків витягує текст і аналізує документи незалежно від перезапусків скрипта Streamlit.
+Стан завдання (прогрес, частковий текст результатів, результати) читається за його
+ідентифікатором, тож користувач може повернутися до результатів пізніше.
+"""
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from document_processor import extract_text
+from analyzer import analyze_document
+from facts import extract_facts
+from revisions import get_version_text, save_version
+from metrics import start_run, span, summarize
+
+# Файл SQLite з чергою завдань
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(".cache", "jobs.sqlite3"))
+# Кількість завдань, що виконуються одночасно в процесі
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# Максимальна кількість завдань в очікуванні; нові заявки понад цю межу відхиляються
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", "20"))
+# Час зберігання завершених завдань у секундах (за замовчуванням 7 днів)
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", str(7 * 24 * 3600)))
+# Завдання, стан якого не оновлювався довше JOB_STALE_SECONDS, вважається перерваним
+# (процес завершився) і повертається в чергу, але не більше JOB_MAX_ATTEMPTS спроб
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = 2
+JOB_HEARTBEAT_SECONDS = 10
+# Інтервал перевірки черги робочими потоками та оновлення часткового тексту результатів (с)
+JOB_POLL_SECONDS = 1.0
+JOB_FLUSH_SECONDS = 0.5
+
+ACTIVE_STATUSES = ("queued", "running")
+_JSON_FIELDS = ("params", "partial", "result", "facts", "timings")
+
+class JobQueueFull(Exception):
+    """Черга завдань заповнена: заявку слід повторити пізніше"""
+
+# Ідентифікатор процесу та завдання, що в ньому виконуються (їх стан оновлює потік пульсу)
+_owner = uuid.uuid4().hex
+_running_lock = threading.Lock()
+_running_jobs = set()
+_db_lock = threading.Lock()
+_db_ready = False
+_workers_lock = threading.Lock()
+_workers = []
+_job_available = threading.Event()
+
+@contextmanager
+def _jobs_connection():
+    """Відкриває з'єднання з чергою завдань (в межах однієї транзакції) і створює таблицю за потреби"""
+    global _db_ready
+    db_dir = os.path.dirname(JOBS_DB_PATH)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    connection = sqlite3.connect(JOBS_DB_PATH, timeout=30)
+    connection.row_factory = sqlite3.Row
+    if not _db_ready:
+        with _db_lock:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    file_data BLOB,
+                    params TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    partial TEXT,
+                    result TEXT,
+                    facts TEXT,
+                    timings TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    updated_at REAL NOT NULL,
+                    finished_at REAL
+                )"""
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            connection.commit()
+            _db_ready = True
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def submit_job(file_name, file_data, query, selected_types=None, **options):
+    """
+    Додає завдання аналізу в чергу та повертає його ідентифікатор. options передаються
+    в analyze_document (deduplicate, combined тощо), крім параметрів версій документа:
+    version_owner - токен користувача, якому належать версії; save_version - зберегти
+    текст документа як версію для порівняння з наступними редакціями (документ аналізується
+    по положеннях, без combined і зведення фактів); previous_version -
+    ідентифікатор збереженої версії попередньої редакції для інкрементального аналізу.
+    Якщо в черзі вже JOB_QUEUE_LIMIT завдань, викликає JobQueueFull.
+    """
+    if not query:
+        raise ValueError("Необхідно вказати запит для аналізу")
+    job_id = uuid.uuid4().hex
+    params = {"query": query, "selected_types": selected_types or None, "options": options}
+    now = time.time()
+    with _jobs_connection() as connection:
+        queued = connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= JOB_QUEUE_LIMIT:
+            raise JobQueueFull("Черга завдань заповнена, спробуйте пізніше")
+        connection.execute(
+            """INSERT INTO jobs (job_id, status, file_name, file_data, params, message, created_at, updated_at)
+               VALUES (?, 'queued', ?, ?, ?, 'Очікування в черзі...', ?, ?)""",
+            (job_id, file_name, file_data, json.dumps(params, ensure_ascii=False), now, now)
+        )
+        connection.execute(
+            "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished_at < ?",
+            (now - JOB_RESULT_TTL,)
+        )
+    _job_available.set()
+    return job_id
+
+def get_job(job_id):
+    """
+    Стан завдання без вмісту файлу або None, якщо завдання не існує. Для завдань
+    в очікуванні містить position - кількість завдань, що стоять у черзі перед ним.
+    """
+    with _jobs_connection() as connection:
+        row = connection.execute(
+            """SELECT job_id, status, file_name, params, progress, message, partial, result, facts,
+                      timings, error, attempts, created_at, started_at, updated_at, finished_at
+               FROM jobs WHERE job_id = ?""",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job["status"] == "queued":
+            job["position"] = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                (job["created_at"],)
+            ).fetchone()[0]
+    for field in _JSON_FIELDS:
+        if job[field] is not None:
+            job[field] = json.loads(job[field])
+    return job
+
+def cancel_job(job_id):
+    """Скасовує завдання, що ще очікує в черзі. Повертає True, якщо завдання скасовано."""
+    now = time.time()
+    with _jobs_connection() as connection:
+        return connection.execute(
+            """UPDATE jobs SET status = 'cancelled', file_data = NULL, message = 'Завдання скасовано',
+                   updated_at = ?, finished_at = ?
+               WHERE job_id = ? AND status = 'queued'""",
+            (now, now, job_id)
+        ).rowcount == 1
+
+def _update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    for field in _JSON_FIELDS:
+        if field in fields:
+            fields[field] = json.dumps(fields[field], ensure_ascii=False)
+    with _jobs_connection() as connection:
+        connection.execute(
+            f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE job_id = ?",
+            (*fields.values(), job_id)
+        )
+
+def recover_jobs():
+    """
+    Повертає в чергу завдання, виконання яких перервано (стан не оновлювався довше
+    JOB_STALE_SECONDS), або завершує їх з помилкою після JOB_MAX_ATTEMPTS спроб.
+    Повертає кількість відновлених завдань.
+    """
+    now = time.time()
+    cutoff = now - JOB_STALE_SECONDS
+    with _jobs_connection() as connection:
+        connection.execute(
+            """UPDATE jobs SET status = 'failed', file_data = NULL, finished_at = ?, updated_at = ?,
+                   error = 'Виконання завдання кілька разів переривалося'
+               WHERE status = 'running' AND updated_at < ? AND attempts >= ?""",
+            (now, now, cutoff, JOB_MAX_ATTEMPTS)
+        )
+        recovered = connection.execute(
+            """UPDATE jobs SET status = 'queued', owner = NULL, progress = 0, partial = NULL, updated_at = ?,
+                   message = 'Виконання перервано, завдання повернуто в чергу...'
+               WHERE status = 'running' AND updated_at < ?""",
+            (now, cutoff)
+        ).rowcount
+    if recovered:
+        print(f"Повернуто в чергу перерваних завдань: {recovered}")
+        _job_available.set()
+    return recovered
+
+def _claim_job():
+    """Бере найдавніше завдання з черги; None, якщо черга порожня"""
+    with _jobs_connection() as connection:
+        while True:
+            row = connection.execute(
+                "SELECT job_id, file_name, file_data, params, created_at FROM jobs "
+                "WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            # Інший робочий потік чи процес міг узяти завдання між вибіркою та оновленням
+            claimed = connection.execute(
+                """UPDATE jobs SET status = 'running', owner = ?, attempts = attempts + 1, started_at = ?,
+                       updated_at = ?, message = 'Обробка документу...'
+                   WHERE job_id = ? AND status = 'queued'""",
+                (_owner, now, now, row["job_id"])
+            ).rowcount
+            if claimed:
+                job = dict(row)
+                job["params"] = json.loads(job["params"])
+                return job
+
+def _run_job(job):
+    """
+    Витягування тексту, пошук фактів і аналіз документа з оновленням стану завдання;
+    якщо користувач погодився, текст документа зберігається як версія для аналізу наступних редакцій
+    """
+    job_id = job["job_id"]
+    params = job["params"]
+    options = dict(params["options"])
+    version_owner = options.pop("version_owner", None)
+    keep_version = options.pop("save_version", False)
+    previous_version = options.pop("previous_version", None)
+    if keep_version:
+        # Збережена версія аналізується по положеннях, як і редакції, що з нею порівнюватимуться,
+        # щоб висновки щодо незмінених положень потрапили у сховище відбитків
+        options.update(deduplicate=True, use_facts=False, combined=False)
+    run_metrics = start_run()
+    partial = {}
+    last_flush = 0.0
+
+    def update_progress(progress, message):
+        _update_job(job_id, progress=progress, message=message)
+
+    def update_stream(key, delta):
+        nonlocal last_flush
+        # Повторна спроба запиту (delta None): відповідь буде згенеровано заново
+        partial[key] = "" if delta is None else partial.get(key, "") + delta
+        now = time.monotonic()
+        if now - last_flush >= JOB_FLUSH_SECONDS:
+            _update_job(job_id, partial=partial)
+            last_flush = now
+
+    status, result, error = "failed", None, None
+    with span("job", queue_seconds=time.time() - job["created_at"]) as record:
+        try:
+            file = io.BytesIO(job["file_data"])
+            file.name = job["file_name"]
+            text = extract_text(file)
+            # Факти доступні інтерфейсу ще до завершення аналізу
+            _update_job(job_id, facts=extract_facts(text), message="Документ успішно завантажено")
+            if keep_version:
+                save_version(version_owner, job["file_name"], text)
+
+            previous_text = None
+            if previous_version:
+                previous_text = get_version_text(previous_version, version_owner)
+                if previous_text is None:
+                    raise ValueError("Попередню редакцію документа не знайдено")
+
+            result = analyze_document(
+                text,
+                params["query"],
+                params["selected_types"],
+                progress_callback=update_progress,
+                stream_callback=update_stream,
+                previous_text=previous_text,
+                **options
+            )
+            if "error" in result:
+                error, result = result["error"], None
+            else:
+                status = "done"
+        except Exception as e:
+            error = f"Помилка при обробці файлу: {str(e)}"
+        record["status"] = status
+
+    now = time.time()
+    _update_job(
+        job_id, status=status, result=result, error=error, partial=partial or None,
+        timings=summarize(run_metrics), file_data=None, progress=1.0, finished_at=now,
+        message="Аналіз успішно завершено!" if status == "done" else error
+    )
+
+def _worker_loop():
+    while True:
+        try:
+            job = _claim_job()
+        except sqlite3.Error as e:
+            print(f"Помилка читання черги завдань: {str(e)}")
+            job = None
+        if job is None:
+            _job_available.wait(JOB_POLL_SECONDS)
+            _job_available.clear()
+            continue
+        print(f"Виконується завдання {job['job_id']} ({job['file_name']})")
+        with _running_lock:
+            _running_jobs.add(job["job_id"])
+        # Помилка бази даних (наприклад, "database is locked") не повинна зупиняти робочий потік;
+        # завдання, стан якого не вдалося записати, повертається в чергу під час відновлення
+        try:
+            _run_job(job)
+        except Exception as e:
+            print(f"Помилка виконання завдання {job['job_id']}: {str(e)}")
+        finally:
+            with _running_lock:
+                _running_jobs.discard(job["job_id"])
+
+def _heartbeat_loop():
+    """
+    Оновлює час стану завдань, що виконуються в цьому процесі, та повертає в чергу перервані
+    завдання (інших процесів або завдання, стан яких не вдалося записати через помилку бази)
+    """
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with _running_lock:
+            running = list(_running_jobs)
+        try:
+            with _jobs_connection() as connection:
+                connection.executemany(
+                    "UPDATE jobs SET updated_at = ? WHERE job_id = ? AND status = 'running' AND owner = ?",
+                    [(time.time(), job_id, _owner) for job_id in running]
+                )
+            recover_jobs()
+        except sqlite3.Error as e:
+            print(f"Помилка оновлення стану завдань: {str(e)}")
+
+def start_workers(workers=None):
+    """
+    Запускає (один раз на процес) пул з workers робочих потоків (за замовчуванням
+    JOB_WORKERS) та потік пульсу; перед запуском повертає в чергу перервані завдання
+    """
+    with _workers_lock:
+        if not _workers:
+            recover_jobs()
+            for _ in range(max(1, workers or JOB_WORKERS)):
+                _workers.append(threading.Thread(target=_worker_loop, daemon=True))
+            _workers.append(threading.Thread(target=_heartbeat_loop, daemon=True))
+            for thread in _workers:
+                thread.start()
+        return list(_workers)
@@ -1,15 +1,22 @@
 import os
+import secrets
+from datetime import datetime
 import streamlit as st
-import pandas as pd
-from document_processor import extract_text
-from analyzer import analyze_document
-from utils import download_results, create_docx_results
+from facts import fact_rows
+from jobs import ACTIVE_STATUSES, JobQueueFull, cancel_job, get_job, start_workers, submit_job
+from utils import download_results, create_docx_results, format_section
+from metrics import start_metrics_server
+from revisions import delete_versions, list_versions
 
 # Add logging at startup
 print("Starting Streamlit application...")
 print(f"Environment PORT: {os.environ.get('PORT', 'Not set')}")
 print(f"Current working directory: {os.getcwd()}")
 
+# Ендпоінт /metrics у форматі Prometheus, якщо вказано порт
+if os.environ.get("METRICS_PORT"):
+    start_metrics_server(int(os.environ["METRICS_PORT"]))
+
 # Set Streamlit configuration - must be first Streamlit command
 st.set_page_config(
     page_title="Аналізатор Юридичних Документів",
@@ -17,6 +24,118 @@ st.set_page_config(
     layout="wide"
 )
 
+# Пул робочих потоків фонових завдань запускається один раз на процес
+start_workers()
+
+# Інтервал оновлення стану фонового завдання в інтерфейсі (с)
+JOB_REFRESH_SECONDS = 1.0
+
+RESULT_HEADERS = {
+    "general": "📝 Загальний Аналіз",
+    "risks": "⚠️ Аналіз Ризиків",
+    "responsibility": "⚖️ Аналіз Відповідальності",
+    "obligations": "📋 Аналіз Договірних Зобов'язань",
+    "compliance": "📜 Аналіз Відповідності Законодавству",
+    "financial": "💰 Аналіз Фінансових Умов",
+    "changes": "🔁 Що змінилося порівняно з попередньою редакцією"
+}
+
+def forget_job():
+    """Прибирає завдання з сесії та посилання, щоб можна було почати новий аналіз"""
+    st.session_state.pop("job_id", None)
+    st.query_params.pop("job", None)
+
+def show_facts(facts):
+    # Суми, ставки, дати, строки та сторони знаходяться без звернень до API
+    if facts:
+        with st.expander(f"📌 Ключові факти документа ({len(facts)})"):
+            st.table(fact_rows(facts))
+
+@st.fragment(run_every=JOB_REFRESH_SECONDS)
+def poll_job(job_id):
+    """
+    Періодично оновлює прогрес і частковий текст результатів завдання, що виконується;
+    після завершення завдання перезапускає скрипт для показу результатів
+    """
+    job = get_job(job_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        st.rerun()
+
+    if job["status"] == "queued":
+        st.info(f"⏳ Завдання в черзі (перед ним: {job['position']})")
+        st.button("✖️ Скасувати", on_click=cancel_job, args=(job_id,))
+    else:
+        st.progress(job["progress"])
+        st.text(f"⏳ {job['message']}")
+    show_facts(job["facts"])
+
+    selected_types = job["params"]["selected_types"]
+    partial = job["partial"] or {}
+    for key in selected_types or ["general"]:
+        st.markdown(f'<h3>{RESULT_HEADERS[key]}</h3>', unsafe_allow_html=True)
+        if partial.get(key):
+            st.markdown(partial[key] + " ▌")
+
+def render_job(job_id):
+    """Секція результатів фонового завдання: прогрес, результати, кнопки завантаження"""
+    job = get_job(job_id)
+    if job is None:
+        st.warning("⚠️ Завдання не знайдено: можливо, його результати вже видалено")
+        forget_job()
+        return
+
+    st.markdown('<div class="results-section">', unsafe_allow_html=True)
+    st.markdown(f'<h2 class="sub-header">📊 Результати Аналізу: {job["file_name"]}</h2>', unsafe_allow_html=True)
+
+    if job["status"] in ACTIVE_STATUSES:
+        poll_job(job_id)
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
+
+    if job["status"] != "done":
+        st.error(f"❌ {job['error'] or job['message']}")
+        st.button("🔄 Новий аналіз", on_click=forget_job)
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
+
+    st.success("✅ Аналіз успішно завершено")
+    show_facts(job["facts"])
+    analysis_results = job["result"]
+    selected_types = job["params"]["selected_types"]
+    for key in analysis_results:
+        st.markdown(f'<h3>{RESULT_HEADERS[key]}</h3>', unsafe_allow_html=True)
+        st.markdown(format_section(analysis_results[key], markdown=True))
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    # Кнопки завантаження
+    st.markdown('<div class="download-buttons">', unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.download_button(
+            label="📄 Завантажити у форматі TXT",
+            data=download_results(analysis_results, selected_types, job["facts"]),
+            file_name="результати_аналізу.txt",
+            mime="text/plain"
+        )
+
+    with col2:
+        docx_bytes = create_docx_results(analysis_results, selected_types, job["facts"]).getvalue()
+        st.download_button(
+            label="📑 Завантажити у форматі DOCX",
+            data=docx_bytes,
+            file_name="результати_аналізу.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+
+    with col3:
+        st.button("🔄 Новий аналіз", on_click=forget_job)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    if st.session_state.get("show_timings") and job["timings"]:
+        with st.expander("⏱️ Час виконання етапів", expanded=True):
+            st.table(job["timings"])
+
 def main():
     st.markdown("""
         <style>
@@ -80,12 +199,11 @@ def main():
     uploaded_file = st.file_uploader("Завантажте документ формату .doc, .docx або .pdf", type=['doc', 'docx', 'pdf'])
     st.markdown('</div>', unsafe_allow_html=True)
 
+    # Завдання поточної сесії або завдання з посилання (?job=...), до якого повернувся користувач
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
+
     if uploaded_file:
         try:
-            with st.spinner("⏳ Обробка документу..."):
-                doc_text = extract_text(uploaded_file)
-                st.success("✅ Документ успішно завантажено")
-
             # Секція налаштувань аналізу
             st.markdown('<div class="analysis-options">', unsafe_allow_html=True)
             st.markdown('<h2 class="sub-header">Налаштування Аналізу</h2>', unsafe_allow_html=True)
@@ -105,6 +223,7 @@ def main():
             )
 
             selected_types = None
+            combined = False
             if analysis_mode == "Аналізувати за запитом та категоріями":
                 st.markdown('<h3 class="sub-header">Оберіть категорії аналізу</h3>', unsafe_allow_html=True)
 
@@ -135,6 +254,58 @@ def main():
                 if analyze_financial:
                     selected_types.append("financial")
 
+                # Вимкнено за замовчуванням: у цьому режимі результати не надходять потоково,
+                # а зведення фактів і повторне використання висновків застосовуються лише
+                # до категорій, для яких відповідь моделі некоректна
+                combined = st.checkbox(
+                    "🧩 Аналізувати всі категорії одним запитом",
+                    key="combined",
+                    help="Документ надсилається один раз для всіх вибраних категорій; результати надходять "
+                         "після завершення запиту, без потокового виводу та зведення фактів"
+                )
+
+            deduplicate = st.checkbox(
+                "♻️ Використовувати висновки щодо типових положень з попередніх документів",
+                key="deduplicate",
+                help="Положення, що вже аналізувалися в інших документах з тим самим запитом, не надсилаються моделі повторно"
+            )
+            # Збережені редакції документів доступні лише за токеном власника; він зберігається
+            # в посиланні (?owner=...), тож версії не губляться після оновлення сторінки
+            version_owner = st.query_params.get("owner") or st.session_state.setdefault("version_owner", secrets.token_hex(16))
+            st.session_state["version_owner"] = version_owner
+            st.query_params["owner"] = version_owner
+            keep_version = st.checkbox(
+                "💾 Зберегти текст документа для порівняння з наступними редакціями",
+                key="save_version",
+                help="Текст документа зберігається на сервері й доступний лише за посиланням цієї сторінки; документ аналізується "
+                     "по окремих положеннях, щоб у наступних редакціях повторно аналізувалися лише змінені"
+            )
+            # Нова редакція раніше проаналізованого документа: моделі надсилаються лише змінені положення
+            versions = {version["version_id"]: version for version in list_versions(version_owner)}
+            previous_version = None
+            if versions:
+                previous_version = st.selectbox(
+                    "🔁 Попередня редакція документа:",
+                    [None, *versions],
+                    format_func=lambda version_id: "Не порівнювати з попередньою редакцією" if version_id is None else (
+                        f"{versions[version_id]['name']} "
+                        f"({datetime.fromtimestamp(versions[version_id]['created_at']):%d.%m.%Y %H:%M})"
+                    ),
+                    key="previous_version",
+                    help="Аналізуються лише додані та змінені положення; висновки щодо незмінених беруться з попереднього аналізу"
+                )
+                st.caption("Збережені редакції доступні за посиланням цієї сторінки: збережіть його, щоб повернутися до них пізніше")
+                col1, col2 = st.columns(2)
+                with col1:
+                    delete_selected = st.button("🗑️ Видалити вибрану редакцію", disabled=previous_version is None)
+                with col2:
+                    delete_all = st.button("🗑️ Видалити всі збережені редакції")
+                if delete_selected or delete_all:
+                    delete_versions(version_owner, None if delete_all else previous_version)
+                    st.session_state.pop("previous_version", None)
+                    st.rerun()
+            st.checkbox("⏱️ Показати час виконання етапів", key="show_timings")
+
             st.markdown('</div>', unsafe_allow_html=True)
 
             if st.button("🚀 Аналізувати Документ", type="primary"):
@@ -146,86 +317,32 @@ def main():
                     st.error("❌ Будь ласка, оберіть хоча б одну категорію аналізу")
                     return
 
-                progress_placeholder = st.empty()
-                progress_bar = progress_placeholder.progress(0)
-                status_text = st.empty()
-                error_placeholder = st.empty()
-
-                def update_progress(progress, message):
-                    try:
-                        progress_bar.progress(progress)
-                        status_text.text(f"⏳ {message}")
-                        if "Помилка" in message:
-                            error_placeholder.error(f"❌ {message}")
-                    except Exception as e:
-                        st.error(f"Помилка оновлення прогресу: {str(e)}")
-
+                # Аналіз виконується у фоновому завданні, тож він не переривається
+                # перезапусками скрипта чи оновленням сторінки
                 try:
-                    analysis_results = analyze_document(
-                        doc_text,
+                    job_id = submit_job(
+                        uploaded_file.name,
+                        uploaded_file.getvalue(),
                         query,
                         selected_types,
-                        progress_callback=update_progress
+                        deduplicate=deduplicate,
+                        combined=combined,
+                        version_owner=version_owner,
+                        save_version=keep_version,
+                        previous_version=previous_version
                     )
-
-                    if "error" in analysis_results:
-                        st.error(analysis_results["error"])
-                        return
-
-                    # Відображення результатів
-                    st.markdown('<div class="results-section">', unsafe_allow_html=True)
-                    st.markdown('<h2 class="sub-header">📊 Результати Аналізу</h2>', unsafe_allow_html=True)
-
-                    if analysis_mode == "Аналізувати тільки за запитом":
-                        st.markdown('<h3>📝 Загальний Аналіз</h3>', unsafe_allow_html=True)
-                        st.write(analysis_results["general"])
-                    else:
-                        headers = {
-                            "risks": "⚠️ Аналіз Ризиків",
-                            "responsibility": "⚖️ Аналіз Відповідальності",
-                            "obligations": "📋 Аналіз Договірних Зобов'язань",
-                            "compliance": "📜 Аналіз Відповідності Законодавству",
-                            "financial": "💰 Аналіз Фінансових Умов"
-                        }
-
-                        for analysis_type in selected_types:
-                            st.markdown(f'<h3>{headers[analysis_type]}</h3>', unsafe_allow_html=True)
-                            st.write(analysis_results[analysis_type])
-
-                    st.markdown('</div>', unsafe_allow_html=True)
-
-                    # Кнопки завантаження
-                    st.markdown('<div class="download-buttons">', unsafe_allow_html=True)
-                    col1, col2 = st.columns(2)
-
-                    with col1:
-                        st.download_button(
-                            label="📄 Завантажити у форматі TXT",
-                            data=download_results(analysis_results, selected_types),
-                            file_name="результати_аналізу.txt",
-                            mime="text/plain"
-                        )
-
-                    with col2:
-                        docx_bytes = create_docx_results(analysis_results, selected_types).getvalue()
-                        st.download_button(
-                            label="📑 Завантажити у форматі DOCX",
-                            data=docx_bytes,
-                            file_name="результати_аналізу.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                        )
-                    st.markdown('</div>', unsafe_allow_html=True)
-
-                except Exception as e:
-                    st.error(f"❌ Критична помилка під час аналізу: {str(e)}")
-                finally:
-                    progress_placeholder.empty()
-                    status_text.empty()
+                except JobQueueFull as e:
+                    st.error(f"❌ {str(e)}")
+                    return
+                st.session_state["job_id"] = job_id
+                st.query_params["job"] = job_id
 
         except Exception as e:
             st.error(f"❌ Помилка при обробці файлу: {str(e)}")
 
-    else:
+    if job_id:
+        render_job(job_id)
+    elif not uploaded_file:
         st.info("ℹ️ Будь ласка, завантажте документ формату .doc, .docx або .pdf для початку аналізу.")
         st.markdown("""
         ### 📌 Як користуватися аналізатором:
@@ -237,6 +354,8 @@ def main():
         4. ☑️ Якщо потрібно, оберіть категорії для аналізу
         5. 🚀 Натисніть 'Аналізувати Документ' для початку аналізу
         6. 💾 Завантажте результати у зручному форматі (TXT або DOCX)
+
+        Аналіз виконується у фоновому режимі: до результатів можна повернутися пізніше за посиланням на сторінку.
         """)
 
 if __name__ == "__main__":
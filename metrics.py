@@ -0,0 +1,140 @@
+"""
+Інструментування конвеєра: тривалість етапів (спани), обсяги даних, токени, повторні
+спроби та звернення до кешів. Записи збираються для поточного запуску, підсумовуються
+для всього процесу і, за потреби, експортуються у файл JSON Lines або у форматі Prometheus.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Файл JSON Lines, у який дописується кожен запис (якщо не вказано, експорт вимкнено)
+METRICS_JSONL_PATH = os.environ.get("METRICS_JSONL_PATH")
+METRICS_PREFIX = "legal_analyzer"
+
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+_lock = threading.Lock()
+_span_counts = defaultdict(int)
+_span_seconds = defaultdict(float)
+_field_totals = defaultdict(float)
+_server = None
+
+def start_run():
+    """
+    Починає збір записів для поточного запуску (сесії, задачі) і повертає список,
+    до якого вони додаються. Асинхронні задачі та виклики в тому ж контексті пишуть у нього ж.
+    """
+    records = []
+    _current_run.set(records)
+    return records
+
+def _record(record):
+    records = _current_run.get()
+    if records is not None:
+        records.append(record)
+
+    name = record["name"]
+    with _lock:
+        _span_counts[name] += 1
+        _span_seconds[name] += record.get("seconds", 0.0)
+        for field, value in record.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and field not in ("seconds", "timestamp"):
+                _field_totals[(name, field)] += value
+
+        if METRICS_JSONL_PATH:
+            try:
+                with open(METRICS_JSONL_PATH, 'a', encoding='utf-8') as metrics_file:
+                    metrics_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                print(f"Не вдалося записати метрики: {str(e)}")
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Вимірює тривалість блоку коду. Повертає словник запису, до якого можна додати
+    поля (байти, сторінки, токени); числові поля підсумовуються для Prometheus.
+    """
+    record = {"name": name, **attributes}
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        record["timestamp"] = time.time()
+        _record(record)
+
+def record_event(name, **fields):
+    """Записує подію без тривалості (наприклад, звернення до кешу)"""
+    _record({"name": name, "timestamp": time.time(), **fields})
+
+def summarize(records):
+    """
+    Зведення записів запуску за етапами для відображення в інтерфейсі
+    """
+    summary = {}
+    for record in records:
+        row = summary.setdefault(record["name"], {"Етап": record["name"], "Кількість": 0, "Час, с": 0.0})
+        row["Кількість"] += 1
+        row["Час, с"] += record.get("seconds", 0.0)
+        for field in ("bytes", "pages", "characters", "prompt_tokens", "completion_tokens", "retries", "cache_hit"):
+            value = record.get(field)
+            if isinstance(value, (int, float)):
+                row[field] = row.get(field, 0) + int(value)
+
+    rows = sorted(summary.values(), key=lambda row: row["Час, с"], reverse=True)
+    for row in rows:
+        row["Час, с"] = round(row["Час, с"], 3)
+    return rows
+
+def render_prometheus():
+    """Підсумкові метрики процесу в текстовому форматі Prometheus"""
+    lines = [
+        f"# HELP {METRICS_PREFIX}_span_count_total Кількість виконань етапу",
+        f"# TYPE {METRICS_PREFIX}_span_count_total counter"
+    ]
+    with _lock:
+        for name, count in sorted(_span_counts.items()):
+            lines.append(f'{METRICS_PREFIX}_span_count_total{{span="{name}"}} {count}')
+        lines.append(f"# HELP {METRICS_PREFIX}_span_seconds_total Сумарна тривалість етапу")
+        lines.append(f"# TYPE {METRICS_PREFIX}_span_seconds_total counter")
+        for name, seconds in sorted(_span_seconds.items()):
+            lines.append(f'{METRICS_PREFIX}_span_seconds_total{{span="{name}"}} {seconds:.6f}')
+        lines.append(f"# HELP {METRICS_PREFIX}_field_total Сума числових полів записів етапу")
+        lines.append(f"# TYPE {METRICS_PREFIX}_field_total counter")
+        for (name, field), value in sorted(_field_totals.items()):
+            lines.append(f'{METRICS_PREFIX}_field_total{{span="{name}",field="{field}"}} {value:g}')
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port):
+    """
+    Запускає у фоновому потоці HTTP-сервер з ендпоінтом /metrics (один раз на процес)
+    """
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"Метрики Prometheus доступні на порту {port} (/metrics)")
+    return _server
@@ -0,0 +1,186 @@
+"""
+Вбудований читач тексту документів Word 97-2003 (.doc) без запуску зовнішніх процесів.
+Підтримує нешифровані документи формату Word 97 і новіших з таблицею фрагментів тексту.
+"""
+import re
+import struct
+
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+_FREESECT = 0xFFFFFFFF
+_ENDOFCHAIN = 0xFFFFFFFE
+
+_WORD97_IDENT = 0xA5EC
+_FIB_FLAG_ENCRYPTED = 0x0100
+_FIB_FLAG_WHICH_TABLE = 0x0200
+_FIB_FC_CLX = 0x01A2
+
+_FIELD_MARK = re.compile('[\x13\x14\x15]')
+# Службові символи Word: кінці абзаців і клітинок, розриви рядків, прив'язки об'єктів
+_WORD_CHARS = str.maketrans({
+    '\r': '\n',
+    '\x07': '\t',
+    '\x0b': '\n',
+    '\x1e': '-',
+    '\x1f': None,
+    '\x01': None,
+    '\x02': None,
+    '\x05': None,
+    '\x08': None
+})
+
+def _sector_chain(start, table):
+    """Послідовність номерів секторів ланцюжка, що починається зі start"""
+    sector_id = start
+    for _ in range(len(table) + 1):
+        if sector_id in (_ENDOFCHAIN, _FREESECT) or sector_id >= len(table):
+            return
+        yield sector_id
+        sector_id = table[sector_id]
+    raise ValueError("Пошкоджений ланцюжок секторів OLE")
+
+def read_ole_streams(data, names):
+    """
+    Повертає словник {назва: вміст} для потоків з names, знайдених у складеному файлі OLE
+    """
+    if data[:8] != OLE_SIGNATURE:
+        raise ValueError("Файл не є документом Word 97-2003")
+
+    sector_shift, mini_sector_shift = struct.unpack_from('<HH', data, 0x1E)
+    sector_size = 1 << sector_shift
+    mini_sector_size = 1 << mini_sector_shift
+    (fat_sectors, first_dir_sector, _, mini_stream_cutoff, first_mini_fat_sector,
+     _, first_difat_sector, difat_sectors) = struct.unpack_from('<8I', data, 0x2C)
+    ids_per_sector = sector_size // 4
+
+    def sector(sector_id):
+        offset = (sector_id + 1) * sector_size
+        return data[offset:offset + sector_size]
+
+    def read_chain(start, table, size=None):
+        content = b''.join(sector(sector_id) for sector_id in _sector_chain(start, table))
+        return content if size is None else content[:size]
+
+    # Таблиця розміщення секторів (FAT) збирається за масивом DIFAT
+    difat = list(struct.unpack_from('<109I', data, 0x4C))
+    sector_id = first_difat_sector
+    for _ in range(difat_sectors):
+        entries = struct.unpack(f'<{ids_per_sector}I', sector(sector_id))
+        difat.extend(entries[:-1])
+        sector_id = entries[-1]
+
+    fat = []
+    for sector_id in difat[:fat_sectors]:
+        fat.extend(struct.unpack(f'<{ids_per_sector}I', sector(sector_id)))
+
+    directory = read_chain(first_dir_sector, fat)
+    entries = {}
+    root = None
+    for offset in range(0, len(directory) - 127, 128):
+        name_length, entry_type = struct.unpack_from('<HB', directory, offset + 0x40)
+        start, size = struct.unpack_from('<II', directory, offset + 0x74)
+        name = directory[offset:offset + max(name_length - 2, 0)].decode('utf-16-le', 'replace')
+        if entry_type == 5:
+            root = (start, size)
+        elif entry_type == 2 and name in names:
+            entries[name] = (start, size)
+
+    mini_stream = b''
+    mini_fat = []
+    if root is not None and any(size < mini_stream_cutoff for _, size in entries.values()):
+        mini_stream = read_chain(root[0], fat, root[1])
+        mini_fat_data = read_chain(first_mini_fat_sector, fat)
+        mini_fat = list(struct.unpack(f'<{len(mini_fat_data) // 4}I', mini_fat_data))
+
+    streams = {}
+    for name, (start, size) in entries.items():
+        if size < mini_stream_cutoff:
+            streams[name] = b''.join(
+                mini_stream[sector_id * mini_sector_size:(sector_id + 1) * mini_sector_size]
+                for sector_id in _sector_chain(start, mini_fat)
+            )[:size]
+        else:
+            streams[name] = read_chain(start, fat, size)
+    return streams
+
+def _strip_fields(text):
+    """
+    Прибирає коди полів Word (між позначками 0x13 і 0x14), залишаючи їх відображуваний результат
+    """
+    if '\x13' not in text:
+        return text
+
+    parts = []
+    in_instruction = []  # стек відкритих полів: True, поки триває код поля
+    position = 0
+    for match in _FIELD_MARK.finditer(text):
+        if not any(in_instruction):
+            parts.append(text[position:match.start()])
+        mark = match.group()
+        if mark == '\x13':
+            in_instruction.append(True)
+        elif mark == '\x14' and in_instruction:
+            in_instruction[-1] = False
+        elif mark == '\x15' and in_instruction:
+            in_instruction.pop()
+        position = match.end()
+
+    if not any(in_instruction):
+        parts.append(text[position:])
+    return ''.join(parts)
+
+def _read_pieces(word_stream, clx):
+    """
+    Збирає текст документа за таблицею фрагментів (Pcdt) зі структури CLX
+    """
+    position = 0
+    # Пропускаємо блоки Prc з властивостями форматування
+    while position < len(clx) and clx[position] == 0x01:
+        position += 3 + struct.unpack_from('<H', clx, position + 1)[0]
+    if position >= len(clx) or clx[position] != 0x02:
+        raise ValueError("Не знайдено таблицю фрагментів тексту")
+
+    plc_length = struct.unpack_from('<I', clx, position + 1)[0]
+    plc = clx[position + 5:position + 5 + plc_length]
+    piece_count = (len(plc) - 4) // 12
+    cps = struct.unpack_from(f'<{piece_count + 1}I', plc, 0)
+
+    pieces = []
+    for i in range(piece_count):
+        char_count = cps[i + 1] - cps[i]
+        fc = struct.unpack_from('<I', plc, 4 * (piece_count + 1) + 8 * i + 2)[0]
+        if fc & 0x40000000:
+            # Стиснений фрагмент: один байт на символ у кодуванні cp1252
+            offset = (fc & 0x3FFFFFFF) // 2
+            pieces.append(word_stream[offset:offset + char_count].decode('cp1252', 'replace'))
+        else:
+            pieces.append(word_stream[fc:fc + 2 * char_count].decode('utf-16-le', 'replace'))
+    return ''.join(pieces)
+
+def extract_doc_text(data):
+    """
+    Витягує текст з документа Word 97-2003. Для непідтримуваних файлів
+    (шифрованих, старіших версій Word, пошкоджених) викликає ValueError.
+    """
+    try:
+        streams = read_ole_streams(data, ('WordDocument', '0Table', '1Table'))
+        word_stream = streams.get('WordDocument')
+        if word_stream is None:
+            raise ValueError("У файлі відсутній потік WordDocument")
+
+        ident, = struct.unpack_from('<H', word_stream, 0)
+        flags, = struct.unpack_from('<H', word_stream, 0x0A)
+        if ident != _WORD97_IDENT:
+            raise ValueError("Непідтримувана версія документа Word")
+        if flags & _FIB_FLAG_ENCRYPTED:
+            raise ValueError("Документ зашифровано")
+
+        table_stream = streams.get('1Table' if flags & _FIB_FLAG_WHICH_TABLE else '0Table')
+        if table_stream is None:
+            raise ValueError("У файлі відсутній потік таблиць")
+
+        fc_clx, lcb_clx = struct.unpack_from('<II', word_stream, _FIB_FC_CLX)
+        text = _read_pieces(word_stream, table_stream[fc_clx:fc_clx + lcb_clx])
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Пошкоджена структура документа Word: {str(e)}")
+
+    return _strip_fields(text).translate(_WORD_CHARS)
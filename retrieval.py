@@ -0,0 +1,109 @@
+"""
+Локальний лексичний пошук (BM25) по фрагментах документа: для кожного типу аналізу
+відбираються лише релевантні положення, щоб не передавати моделі весь текст.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+# Довжина префікса слова, що використовується як основа (грубий стемінг для українських відмінків)
+STEM_LENGTH = 6
+# Параметри ранжування BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Вага термінів із запиту користувача відносно ключових слів категорії
+QUERY_WEIGHT = 2
+
+_WORD = re.compile(r"[^\W\d_]{2,}|\d+")
+
+CATEGORY_KEYWORDS = {
+    "risks": (
+        "ризик ризики загроза відповідальність штраф пеня неустойка збитки порушення розірвання "
+        "припинення одностороннє форс-мажор спір арбітраж гарантія застава забезпечення "
+        "risk liability penalty termination breach damages dispute"
+    ),
+    "responsibility": (
+        "відповідальність відповідає вина винна сторона збитки відшкодування компенсація штраф "
+        "пеня неустойка санкції обмеження звільняється форс-мажор обставини непереборної сили "
+        "liability indemnity damages"
+    ),
+    "obligations": (
+        "зобов'язується зобов'язаний обов'язок повинен забезпечити строк термін протягом днів "
+        "календарних робочих поставка виконання передача приймання акт графік повідомлення "
+        "shall obligation deadline delivery"
+    ),
+    "compliance": (
+        "закон законодавство кодекс україни відповідно чинного нормативних постанова ліцензія "
+        "дозвіл реєстрація персональні дані податковий валютний антимонопольний санкції "
+        "law regulation compliance license"
+    ),
+    "financial": (
+        "ціна вартість оплата оплачує платіж сума гривень грн usd eur долар євро рахунок "
+        "аванс передоплата розрахунки відсотки пеня штраф пдв податок індексація курс валюта "
+        "price payment amount invoice"
+    )
+}
+
+def tokenize(text):
+    """Слова тексту в нижньому регістрі, скорочені до основи довжиною STEM_LENGTH"""
+    return [word[:STEM_LENGTH] for word in _WORD.findall(text.lower())]
+
+def build_index(passages):
+    """
+    Будує інвертований індекс BM25 для списку фрагментів (словників з полем "text")
+    """
+    postings = defaultdict(dict)
+    lengths = []
+    for passage_id, passage in enumerate(passages):
+        term_counts = Counter(tokenize(passage["text"]))
+        lengths.append(sum(term_counts.values()))
+        for term, count in term_counts.items():
+            postings[term][passage_id] = count
+
+    return {
+        "passages": passages,
+        "postings": dict(postings),
+        "lengths": lengths,
+        "average_length": sum(lengths) / len(lengths) if lengths else 0
+    }
+
+def score_passages(index, terms):
+    """
+    Оцінки BM25 фрагментів для зваженого набору термінів {термін: вага}
+    """
+    passage_count = len(index["passages"])
+    average_length = index["average_length"] or 1
+    scores = Counter()
+
+    for term, weight in terms.items():
+        term_postings = index["postings"].get(term)
+        if not term_postings:
+            continue
+        document_frequency = len(term_postings)
+        idf = math.log(1 + (passage_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        for passage_id, frequency in term_postings.items():
+            length_norm = 1 - BM25_B + BM25_B * index["lengths"][passage_id] / average_length
+            scores[passage_id] += weight * idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+    return scores
+
+def select_passages(index, analysis_type, query, token_budget, top_k=None):
+    """
+    Відбирає найрелевантніші для типу аналізу та запиту фрагменти, сумарно не більше
+    token_budget токенів, і повертає їх у порядку розташування в документі
+    """
+    terms = Counter(tokenize(CATEGORY_KEYWORDS.get(analysis_type, "")))
+    for term in tokenize(query):
+        terms[term] += QUERY_WEIGHT
+
+    ranked = [passage_id for passage_id, score in score_passages(index, terms).most_common(top_k) if score > 0]
+
+    selected = []
+    used_tokens = 0
+    for passage_id in ranked:
+        passage = index["passages"][passage_id]
+        if used_tokens + passage["tokens"] > token_budget:
+            continue
+        selected.append(passage)
+        used_tokens += passage["tokens"]
+
+    return sorted(selected, key=lambda passage: passage["start"])
@@ -0,0 +1,222 @@
+"""
+Редакції документів для інкрементального аналізу: тексти проаналізованих документів
+зберігаються як версії, а нова редакція порівнюється з попередньою на рівні положень
+(difflib), щоб моделі надсилалися лише додані та змінені положення. Версії зберігаються
+лише на прохання користувача, доступні лише їх власнику (за токеном власника з посилання
+на сторінку) і можуть бути ним видалені.
+"""
+import difflib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Файл SQLite з текстами версій документів (порожнє значення вимикає збереження версій)
+VERSION_STORE_PATH = os.environ.get("VERSION_STORE_PATH", os.path.join(".cache", "document_versions.sqlite3"))
+# Максимальна кількість збережених версій
+VERSION_STORE_MAX_ENTRIES = int(os.environ.get("VERSION_STORE_MAX_ENTRIES", "200"))
+# Мінімальна подібність слів, за якої положення нової редакції вважається зміненим
+# положенням попередньої, а не вилученим і доданим
+CLAUSE_MODIFIED_RATIO = 0.5
+# Максимальна довжина тексту положення в описі змін (символів)
+CHANGE_EXCERPT_CHARS = 1500
+
+CHANGE_LABELS = {
+    "added": "Додано",
+    "removed": "Вилучено",
+    "modified": "Змінено"
+}
+
+_store_lock = threading.Lock()
+_store_ready = False
+
+@contextmanager
+def _store_connection():
+    """Відкриває з'єднання зі сховищем версій (в межах однієї транзакції) і створює таблицю за потреби"""
+    global _store_ready
+    store_dir = os.path.dirname(VERSION_STORE_PATH)
+    if store_dir:
+        os.makedirs(store_dir, exist_ok=True)
+    connection = sqlite3.connect(VERSION_STORE_PATH, timeout=30)
+    if not _store_ready:
+        with _store_lock:
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Версії, збережені без власника, були доступні всім сесіям
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(versions)")]
+            if columns and "owner" not in columns:
+                connection.execute("DROP TABLE versions")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS versions (
+                    version_id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (owner, name, text_hash)
+                )"""
+            )
+            connection.commit()
+            _store_ready = True
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def save_version(owner, name, text):
+    """
+    Зберігає текст документа як версію власника owner (токена користувача) та повертає
+    її ідентифікатор (для того самого власника, імені та тексту - ідентифікатор уже
+    збереженої версії) або None, якщо сховище вимкнено
+    """
+    if not VERSION_STORE_PATH or not owner:
+        return None
+    text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    try:
+        now = time.time()
+        with _store_connection() as connection:
+            row = connection.execute(
+                "SELECT version_id FROM versions WHERE owner = ? AND name = ? AND text_hash = ?",
+                (owner, name, text_hash)
+            ).fetchone()
+            if row is not None:
+                connection.execute("UPDATE versions SET created_at = ? WHERE version_id = ?", (now, row[0]))
+                return row[0]
+            version_id = uuid.uuid4().hex
+            connection.execute(
+                "INSERT INTO versions VALUES (?, ?, ?, ?, ?, ?)", (version_id, owner, name, text_hash, text, now)
+            )
+            connection.execute(
+                """DELETE FROM versions WHERE version_id IN (
+                    SELECT version_id FROM versions ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (VERSION_STORE_MAX_ENTRIES,)
+            )
+            return version_id
+    except sqlite3.Error as e:
+        print(f"Помилка запису версії документа: {str(e)}")
+        return None
+
+def list_versions(owner, limit=50):
+    """Останні збережені версії власника owner: [{"version_id", "name", "created_at", "characters"}]"""
+    if not VERSION_STORE_PATH or not owner:
+        return []
+    try:
+        with _store_connection() as connection:
+            rows = connection.execute(
+                """SELECT version_id, name, created_at, length(text) FROM versions
+                   WHERE owner = ? ORDER BY created_at DESC LIMIT ?""",
+                (owner, limit)
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Помилка читання версій документів: {str(e)}")
+        return []
+    return [
+        {"version_id": version_id, "name": name, "created_at": created_at, "characters": characters}
+        for version_id, name, created_at, characters in rows
+    ]
+
+def get_version_text(version_id, owner):
+    """Текст збереженої версії власника owner або None, якщо її немає"""
+    if not VERSION_STORE_PATH or not owner:
+        return None
+    with _store_connection() as connection:
+        row = connection.execute(
+            "SELECT text FROM versions WHERE version_id = ? AND owner = ?", (version_id, owner)
+        ).fetchone()
+    return row[0] if row is not None else None
+
+def delete_versions(owner, version_id=None):
+    """
+    Видаляє версію version_id власника owner (або всі його версії, якщо version_id не вказано)
+    та повертає кількість видалених версій
+    """
+    if not VERSION_STORE_PATH or not owner:
+        return 0
+    query, params = "DELETE FROM versions WHERE owner = ?", [owner]
+    if version_id is not None:
+        query, params = query + " AND version_id = ?", params + [version_id]
+    try:
+        with _store_connection() as connection:
+            return connection.execute(query, params).rowcount
+    except sqlite3.Error as e:
+        print(f"Помилка видалення версій документів: {str(e)}")
+        return 0
+
+def _normalized(clause):
+    return " ".join(clause["text"].split())
+
+def _pair_replaced(old_clauses, new_clauses):
+    """
+    Зміни в блоці положень, що відрізняються: положення нової редакції по порядку
+    зіставляються з найподібнішими ще не зіставленими положеннями попередньої
+    """
+    changes = []
+    old_words = [_normalized(clause).split() for clause in old_clauses]
+    next_old = 0
+    for new_clause in new_clauses:
+        matcher = difflib.SequenceMatcher(None, autojunk=False)
+        matcher.set_seq2(_normalized(new_clause).split())
+        best, best_ratio = None, CLAUSE_MODIFIED_RATIO
+        for index in range(next_old, len(old_clauses)):
+            matcher.set_seq1(old_words[index])
+            if matcher.quick_ratio() >= best_ratio and matcher.ratio() >= best_ratio:
+                best, best_ratio = index, matcher.ratio()
+        if best is None:
+            changes.append({"kind": "added", "old": None, "new": new_clause})
+            continue
+        # Положення, пропущені перед зіставленим, вилучено з нової редакції
+        changes.extend({"kind": "removed", "old": clause, "new": None} for clause in old_clauses[next_old:best])
+        changes.append({"kind": "modified", "old": old_clauses[best], "new": new_clause})
+        next_old = best + 1
+    changes.extend({"kind": "removed", "old": clause, "new": None} for clause in old_clauses[next_old:])
+    return changes
+
+def diff_clauses(old_clauses, new_clauses):
+    """
+    Порівнює положення двох редакцій (у форматі iter_clauses) без урахування пробілів.
+    Повертає список змін {"kind": "unchanged" | "added" | "removed" | "modified",
+    "old": положення попередньої редакції або None, "new": положення нової або None}.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [_normalized(clause) for clause in old_clauses], [_normalized(clause) for clause in new_clauses],
+        autojunk=False
+    )
+    changes = []
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            changes.extend(
+                {"kind": "unchanged", "old": old, "new": new}
+                for old, new in zip(old_clauses[old_start:old_end], new_clauses[new_start:new_end])
+            )
+        else:
+            changes.extend(_pair_replaced(old_clauses[old_start:old_end], new_clauses[new_start:new_end]))
+    return changes
+
+def change_counts(changes):
+    """Кількість доданих, вилучених і змінених положень"""
+    return {kind: sum(change["kind"] == kind for change in changes) for kind in CHANGE_LABELS}
+
+def _excerpt(clause):
+    text = clause["text"].strip()
+    return text if len(text) <= CHANGE_EXCERPT_CHARS else text[:CHANGE_EXCERPT_CHARS] + "..."
+
+def format_changes(changes, paged=False):
+    """Текст змін для промпту: кожне додане, вилучене чи змінене положення з текстом до і після"""
+    parts = []
+    for change in changes:
+        if change["kind"] == "unchanged":
+            continue
+        clause = change["new"] or change["old"]
+        location = f", стор. {clause['page_start']}" if paged else ""
+        lines = [f"[{CHANGE_LABELS[change['kind']]}{location}]"]
+        if change["old"] is not None:
+            lines.append(f"Було: {_excerpt(change['old'])}")
+        if change["new"] is not None:
+            lines.append(f"Стало: {_excerpt(change['new'])}")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
@@ -0,0 +1,27 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import corpus
+import document_processor
+from document_processor import PAGE_BREAK, extract_text
+
+PDF = corpus.write_pdf(corpus.generate_pages(5, seed=1))
+
+def _file():
+    file = io.BytesIO(PDF)
+    file.name = "contract.pdf"
+    return file
+
+def test_pdf_limits(monkeypatch):
+    monkeypatch.setattr(document_processor, "TEXT_CACHE_DIR", None)
+    full = extract_text(_file(), use_cache=False)
+    assert full.count(PAGE_BREAK) == 4
+
+    # Обмежений текст кешується окремо від повного
+    assert extract_text(_file()) == full
+    assert extract_text(_file(), max_pages=2).count(PAGE_BREAK) == 1
+    limited = extract_text(_file(), max_text_bytes=len(full.split(PAGE_BREAK)[0].encode("utf-8")))
+    assert PAGE_BREAK not in limited and limited.strip()
@@ -0,0 +1,38 @@
+import pytest
+
+from facts import extract_facts
+
+@pytest.mark.parametrize("text, expected", [
+    ("Ціна становить $2,000 за одиницю.", ("amount", "2 000 USD")),
+    ("Аванс $1,500.50 сплачується протягом тижня.", ("amount", "1 500.50 USD")),
+    ("Загальна вартість 2,000,000.00 USD.", ("amount", "2 000 000 USD")),
+    ("Загальна вартість 1.000.000,00 гривень.", ("amount", "1 000 000 UAH")),
+    ("Ціна 1 500,50 грн. з ПДВ.", ("amount", "1 500.50 UAH")),
+    ("Ціна 12.50 євро за одиницю.", ("amount", "12.50 EUR")),
+    ("Ставка становить 2,5 відсотка річних.", ("percent", "2.5%")),
+    ("Пеня 0,125% за кожен день прострочення.", ("penalty", "0.125%")),
+    ("Штраф 10.000 грн за кожне порушення.", ("penalty", "10 000 UAH")),
+    ("Ставка 1,000% річних.", ("percent", "1%")),
+])
+def test_amount_separators(text, expected):
+    facts = extract_facts(text)
+    assert [(fact["type"], fact["value"]) for fact in facts] == [expected]
+
+def test_amount_text_covers_whole_number():
+    fact, = extract_facts("Разом до сплати 2,000,000.00 USD.")
+    assert fact["text"] == "2,000,000.00 USD"
+
+def test_dates_are_not_amounts():
+    assert [(fact["type"], fact["value"]) for fact in extract_facts("Договір від 01.02.2024 р.")] == [("date", "2024-02-01")]
+
+@pytest.mark.parametrize("text", [
+    "Оплата здійснюється протягом 2025 року.",
+    "Ціни діють з 2024 року.",
+    "Звіт подається до кінця 2023 р.",
+])
+def test_years_are_not_terms(text):
+    assert [fact for fact in extract_facts(text) if fact["type"] == "term"] == []
+
+def test_terms_are_still_found():
+    facts = extract_facts("Строк поставки - 30 календарних днів.")
+    assert [(fact["type"], fact["value"]) for fact in facts] == [("term", "30 календарних днів")]
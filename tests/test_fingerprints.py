@@ -0,0 +1,36 @@
+import pytest
+
+import fingerprints
+from fingerprints import clause_signature, find_findings, store_findings
+
+CLAUSE = (
+    "7.1. Постачальник несе відповідальність за прострочення поставки Товару у вигляді пені "
+    "у розмірі 0,1 відсотка від вартості непоставленого в строк Товару за кожен день прострочення, "
+    "але не більше 10 відсотків від загальної вартості Товару за цим Договором, а також "
+    "відшкодовує Покупцю всі документально підтверджені збитки, завдані таким простроченням, "
+    "протягом 10 банківських днів з дня отримання відповідної письмової вимоги."
+)
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(fingerprints, "CLAUSE_STORE_PATH", str(tmp_path / "clauses.sqlite3"))
+    monkeypatch.setattr(fingerprints, "_store_ready", False)
+    store_findings("risks", [clause_signature(CLAUSE)], ["Штраф обмежено 10% вартості."])
+
+def test_exact_match_ignores_case_and_punctuation(store):
+    variant = "  " + CLAUSE.upper().replace(", але", " але").replace(" Товару", "\nТовару")
+    assert find_findings("risks", [clause_signature(variant)]) == ["Штраф обмежено 10% вартості."]
+
+@pytest.mark.parametrize("variant", [
+    CLAUSE.replace("Постачальник несе", "Постачальник не несе"),
+    CLAUSE.replace("Постачальник несе", "Покупець несе"),
+    CLAUSE.replace("відшкодовує", "може відшкодувати"),
+    CLAUSE.replace("10 банківських", "30 банківських"),
+])
+def test_meaningful_changes_are_not_reused(store, variant):
+    assert find_findings("risks", [clause_signature(variant)], threshold=0.5) == [None]
+
+def test_near_match_only_below_exact_threshold(store):
+    variant = CLAUSE.replace("документально підтверджені", "підтверджені документально")
+    assert find_findings("risks", [clause_signature(variant)]) == [None]
+    assert find_findings("risks", [clause_signature(variant)], threshold=0.5) == ["Штраф обмежено 10% вартості."]
@@ -0,0 +1,21 @@
+import asyncio
+
+from analyzer import RateLimiter
+
+def test_concurrent_rate_limits_decrease_once():
+    limiter = RateLimiter(1000, 1_000_000, 16)
+    limiter.concurrency_limit = 16.0
+
+    async def acquire_all():
+        return [await limiter.acquire_async(10) for _ in range(8)]
+
+    started = asyncio.run(acquire_all())
+    for admitted in started:
+        limiter.release(10, rate_limited=True, started=admitted)
+    assert limiter.concurrency_limit == 8.0
+    assert limiter.in_flight == 0
+
+    # Відмова запиту, надісланого після зменшення, зменшує ліміт знову
+    admitted = asyncio.run(limiter.acquire_async(10))
+    limiter.release(10, rate_limited=True, started=admitted)
+    assert limiter.concurrency_limit == 4.0
@@ -0,0 +1,79 @@
+import io
+import re
+import time
+
+import pytest
+
+import analyzer
+import fingerprints
+import jobs
+import revisions
+
+CLAUSES = [
+    "1.1. Постачальник зобов'язується поставити Покупцю Товар в асортименті, кількості та за цінами, "
+    "що визначені у специфікаціях, які є невід'ємною частиною цього Договору, а Покупець зобов'язується "
+    "прийняти Товар та оплатити його на умовах цього Договору.",
+    "2.1. Покупець здійснює оплату Товару шляхом перерахування грошових коштів на поточний рахунок "
+    "Постачальника протягом 10 банківських днів з дати поставки відповідної партії Товару та отримання "
+    "Покупцем належно оформлених видаткових накладних і рахунку.",
+    "3.1. Постачальник несе відповідальність за прострочення поставки Товару у вигляді пені у розмірі "
+    "0,1 відсотка від вартості непоставленого в строк Товару за кожен день прострочення, але не більше "
+    "10 відсотків від загальної вартості Товару за цим Договором.",
+]
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(fingerprints, "CLAUSE_STORE_PATH", str(tmp_path / "clauses.sqlite3"))
+    monkeypatch.setattr(fingerprints, "_store_ready", False)
+    monkeypatch.setattr(revisions, "VERSION_STORE_PATH", str(tmp_path / "versions.sqlite3"))
+    monkeypatch.setattr(revisions, "_store_ready", False)
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "_db_ready", False)
+    monkeypatch.setattr(analyzer, "RESULT_CACHE_PATH", "")
+
+@pytest.fixture
+def sent_clauses(monkeypatch):
+    """Тексти положень, надісланих моделі; відповіді моделі імітуються"""
+    sent = []
+
+    async def get_analysis_async(clients, prompt, **kwargs):
+        if not prompt.startswith("Нижче наведено пронумеровані положення"):
+            return "Підсумок аналізу."
+        parts = re.split(r"\n\n\[\d+\]\n", prompt)[1:]
+        sent.extend(part.strip() for part in parts)
+        return "{" + ", ".join(f'"{number}": "Висновок {number}."' for number in range(1, len(parts) + 1)) + "}"
+
+    monkeypatch.setattr(analyzer, "get_analysis_async", get_analysis_async)
+    monkeypatch.setattr(jobs, "extract_text", lambda file: file.read().decode("utf-8"))
+    return sent
+
+def _run(text, **options):
+    job_id = jobs.submit_job("contract.docx", text.encode("utf-8"), "Проаналізуйте договір", ["risks"], **options)
+    job = {"job_id": job_id, "file_name": "contract.docx", "file_data": text.encode("utf-8"), "created_at": time.time(),
+           "params": {"query": "Проаналізуйте договір", "selected_types": ["risks"], "options": options}}
+    jobs._run_job(job)
+    return jobs.get_job(job_id)
+
+def test_revision_resends_only_changed_clause(stores, sent_clauses):
+    first = _run("\n\n".join(CLAUSES), version_owner="owner", save_version=True)
+    assert first["status"] == "done"
+    assert len(sent_clauses) == len(CLAUSES)
+
+    version, = revisions.list_versions("owner")
+    changed = CLAUSES[1].replace("10 банківських", "30 банківських")
+    sent_clauses.clear()
+    second = _run("\n\n".join([CLAUSES[0], changed, CLAUSES[2]]),
+                  version_owner="owner", previous_version=version["version_id"])
+    assert second["status"] == "done"
+    assert sent_clauses == [changed]
+
+def test_versions_are_deleted_only_for_owner(stores):
+    first = revisions.save_version("owner", "contract.docx", CLAUSES[0])
+    second = revisions.save_version("owner", "contract.docx", CLAUSES[1])
+    other = revisions.save_version("other", "contract.docx", CLAUSES[0])
+    assert revisions.delete_versions("other", first) == 0
+    assert revisions.delete_versions("owner", first) == 1
+    assert [version["version_id"] for version in revisions.list_versions("owner")] == [second]
+    assert revisions.delete_versions("owner") == 1
+    assert revisions.list_versions("owner") == []
+    assert revisions.get_version_text(other, "other") == CLAUSES[0]
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import analyzer
+from analyzer import RequestRouter, _hedged_request, _is_backend_failure
+
+ROUTES = [
+    {"name": "main", "provider": "openai", "model": "main-model"},
+    {"name": "backup", "provider": "openai", "model": "backup-model"},
+]
+
+@pytest.fixture
+def router(monkeypatch):
+    router = RequestRouter(ROUTES)
+    # Бюджет дубльованих запитів не обмежує тести
+    router.requests = 100
+    monkeypatch.setattr(analyzer, "request_router", router)
+    monkeypatch.setattr(analyzer, "HEDGE_DEFAULT_DELAY", 0.1)
+    return router
+
+def _sender(queue_seconds, latencies):
+    """Імітація _send: очікування в RateLimiter queue_seconds[назва] с, потім відповідь через latencies[назва] с"""
+    async def send(route, admission=None):
+        await asyncio.sleep(queue_seconds[route["name"]])
+        if admission is not None:
+            admission.set()
+        await asyncio.sleep(latencies[route["name"]])
+        return route["name"], None, route
+    return send
+
+def test_queue_time_does_not_trigger_hedge(router):
+    record = {}
+    send = _sender({"main": 0.3, "backup": 0}, {"main": 0.05, "backup": 0.05})
+    result = asyncio.run(_hedged_request(router.routes, send, record))
+    assert result[0] == "main"
+    assert "hedged" not in record
+
+def test_slow_response_is_hedged(router):
+    record = {}
+    send = _sender({"main": 0, "backup": 0}, {"main": 1.0, "backup": 0.05})
+    result = asyncio.run(_hedged_request(router.routes, send, record))
+    assert result[0] == "backup"
+    assert record["hedged"] == 1 and record["hedge_won"] == 1
+
+def test_cancelled_request_is_not_a_latency_sample(router, monkeypatch):
+    async def complete(*args):
+        await asyncio.sleep(1.0)
+
+    monkeypatch.setattr(analyzer, "_complete", complete)
+
+    async def cancel_after_start():
+        task = asyncio.ensure_future(analyzer._send(
+            {}, router.routes[0], "prompt", 60, 100, False, None, 10, {"queue_seconds": 0.0}
+        ))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_after_start())
+    assert router.stats()["main"]["samples"] == 0
+
+def test_circuit_opens_after_failures_and_closes_on_success(router, monkeypatch):
+    monkeypatch.setattr(analyzer, "CIRCUIT_FAILURE_THRESHOLD", 3)
+    for _ in range(3):
+        router.record_failure("main")
+    assert [route["name"] for route in router.candidates(100)] == ["backup"]
+    assert router.stats()["main"]["open"]
+
+    router.record_success("main", 0.1)
+    assert [route["name"] for route in router.candidates(100)] == ["main", "backup"]
+
+def test_all_open_routes_are_still_candidates(router, monkeypatch):
+    monkeypatch.setattr(analyzer, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    router.record_failure("main")
+    router.record_failure("backup")
+    assert [route["name"] for route in router.candidates(100)] == ["main", "backup"]
+
+@pytest.mark.parametrize("error, expected", [
+    (TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (TypeError("unexpected keyword argument"), False),
+    (ValueError("bad response"), False),
+])
+def test_backend_failures(error, expected):
+    assert _is_backend_failure(error) is expected
+
+def test_api_status_errors():
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    request = httpx.Request("POST", "http://localhost/v1/chat/completions")
+
+    def status_error(error_class, status_code):
+        return error_class("error", response=httpx.Response(status_code, request=request), body=None)
+
+    assert _is_backend_failure(status_error(openai.InternalServerError, 503))
+    assert not _is_backend_failure(status_error(openai.BadRequestError, 400))
+    assert _is_backend_failure(openai.APITimeoutError(request=request))
+    assert _is_backend_failure(openai.APIConnectionError(request=request))
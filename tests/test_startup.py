@@ -0,0 +1,12 @@
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import startup
+
+def test_startup_within_budget():
+    timings, loaded = startup.measure(5)
+    assert loaded == []
+    assert statistics.median(timings) <= startup.STARTUP_BUDGET_SECONDS
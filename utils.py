@@ -1,9 +1,32 @@
-from docx import Document
 import io
+from metrics import span
+from facts import fact_rows
 
-def download_results(analysis_results, selected_types=None):
+# Заголовки списків структурованого результату (режим аналізу всіх типів одним запитом)
+SECTION_TITLES = {
+    "key_points": "Ключові положення",
+    "recommendations": "Рекомендації"
+}
+
+def format_section(result, markdown=False):
+    """
+    Текст результату одного типу аналізу: рядок повертається без змін, а структурований
+    розділ - як стислий висновок і марковані списки ключових положень та рекомендацій
+    """
+    if isinstance(result, str):
+        return result
+    lines = [result["summary"]] if result.get("summary") else []
+    for field, title in SECTION_TITLES.items():
+        if result.get(field):
+            lines.append(f"\n**{title}:**" if markdown else f"\n{title}:")
+            lines.extend(f"- {item}" for item in result[field])
+    return "\n".join(lines).strip()
+
+def download_results(analysis_results, selected_types=None, facts=None):
     """
-    Форматування результатів аналізу для завантаження
+    Форматування результатів аналізу для завантаження.
+    Якщо вказано facts, до звіту додається таблиця витягнутих фактів, а якщо результати
+    містять опис змін редакції ("changes") - розділ змін.
     """
     output = []
 
@@ -16,7 +39,7 @@ def download_results(analysis_results, selected_types=None):
         if "general" in analysis_results:
             output.append("\nЗАГАЛЬНИЙ АНАЛІЗ")
             output.append("-" * 30)
-            output.append(analysis_results["general"])
+            output.append(format_section(analysis_results["general"]))
     else:
         # Аналіз за вибраними типами
         headers = {
@@ -31,14 +54,45 @@ def download_results(analysis_results, selected_types=None):
             if analysis_type in analysis_results:
                 output.append(f"\n{headers[analysis_type]}")
                 output.append("-" * 30)
-                output.append(analysis_results[analysis_type])
+                output.append(format_section(analysis_results[analysis_type]))
+
+    if "changes" in analysis_results:
+        output.append("\nЗМІНИ ПОРІВНЯНО З ПОПЕРЕДНЬОЮ РЕДАКЦІЄЮ")
+        output.append("-" * 30)
+        output.append(analysis_results["changes"])
+
+    if facts:
+        output.append("\nКЛЮЧОВІ ФАКТИ")
+        output.append("-" * 30)
+        for row in fact_rows(facts):
+            output.append(f"{row['Тип']}: {row['Значення']} (стор. {row['Стор.']}) - {row['Контекст']}")
 
     return "\n".join(output)
 
-def create_docx_results(analysis_results, selected_types=None):
+def create_docx_results(analysis_results, selected_types=None, facts=None):
     """
-    Створення DOCX документу з результатами аналізу
+    Створення DOCX документу з результатами аналізу (і таблицею фактів, якщо вказано facts)
     """
+    with span("create_docx_results"):
+        return _build_docx_results(analysis_results, selected_types, facts)
+
+def _add_docx_section(doc, result):
+    """Текст результату або структурований розділ з маркованими списками"""
+    if isinstance(result, str):
+        doc.add_paragraph(result)
+        return
+    if result.get("summary"):
+        doc.add_paragraph(result["summary"])
+    for field, title in SECTION_TITLES.items():
+        if result.get(field):
+            doc.add_paragraph().add_run(f"{title}:").bold = True
+            for item in result[field]:
+                doc.add_paragraph(item, style='List Bullet')
+
+def _build_docx_results(analysis_results, selected_types, facts=None):
+    # python-docx потрібен лише для звіту DOCX, тому імпортується під час першого використання
+    from docx import Document
+
     doc = Document()
 
     # Додаємо заголовок
@@ -48,7 +102,7 @@ def create_docx_results(analysis_results, selected_types=None):
         # Загальний аналіз за запитом
         if "general" in analysis_results:
             doc.add_heading('ЗАГАЛЬНИЙ АНАЛІЗ', 1)
-            doc.add_paragraph(analysis_results["general"])
+            _add_docx_section(doc, analysis_results["general"])
     else:
         # Аналіз за вибраними типами
         headers = {
@@ -62,7 +116,22 @@ def create_docx_results(analysis_results, selected_types=None):
         for analysis_type in selected_types:
             if analysis_type in analysis_results:
                 doc.add_heading(headers[analysis_type], 1)
-                doc.add_paragraph(analysis_results[analysis_type])
+                _add_docx_section(doc, analysis_results[analysis_type])
+
+    if "changes" in analysis_results:
+        doc.add_heading('ЗМІНИ ПОРІВНЯНО З ПОПЕРЕДНЬОЮ РЕДАКЦІЄЮ', 1)
+        doc.add_paragraph(analysis_results["changes"])
+
+    if facts:
+        doc.add_heading('КЛЮЧОВІ ФАКТИ', 1)
+        columns = ("Тип", "Значення", "Стор.", "Контекст")
+        table = doc.add_table(rows=1, cols=len(columns))
+        table.style = 'Table Grid'
+        for cell, column in zip(table.rows[0].cells, columns):
+            cell.text = column
+        for row in fact_rows(facts):
+            for cell, column in zip(table.add_row().cells, columns):
+                cell.text = str(row[column])
 
     # Зберігаємо документ в байтовий потік
     docx_stream = io.BytesIO()